@@ -0,0 +1,52 @@
+"""Websocket frame decode cost per codec.
+
+Decodes the same Bitfinex and Coinbase Pro frames with every installed codec,
+both as str (what websockets yields for text frames) and as bytes, and prints
+the cost per message.
+
+    python -m benchmarks.bench_codec [frames]
+"""
+
+import sys
+import time
+
+from benchmarks import frames
+from cryptoapi.base.codec import codecs
+
+
+def decode_cost(codec, messages, repeat=5):
+    decode = codec.decode
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            decode(message)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e9
+
+
+def main(count=20000):
+    feeds = {
+        'bitfinex': frames.bitfinex(count),
+        'coinbasepro': frames.coinbasepro(count),
+    }
+    installed = []
+    for name, codec in codecs.items():
+        try:
+            installed.append(codec())
+        except ImportError:
+            print(f'{name}: not installed')
+    for feed, messages in feeds.items():
+        raw = [m.encode() for m in messages]
+        print(f'{feed} ({count} frames)')
+        baseline = None
+        for codec in installed:
+            str_cost = decode_cost(codec, messages)
+            bytes_cost = decode_cost(codec, raw)
+            baseline = baseline or str_cost
+            print(f'  {codec.name:<7} str {str_cost:7.0f} ns/msg'
+                  f'  bytes {bytes_cost:7.0f} ns/msg  ({baseline / str_cost:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,120 @@
+"""End-to-end throughput, latency and memory per exchange and channel.
+
+For every channel an exchange has, a MockServer process streams frames over
+a local websocket to an adapter running in its own process. Two passes are
+made: one as fast as possible for throughput, one paced at rate frames per
+second for latency. Latency is the time from the server sending a frame to
+the client reading the parsed result from exchange.result. Both processes
+use the same monotonic clock. Memory is the client process's peak RSS.
+
+    python -m benchmarks.bench_e2e [frames] [rate]
+"""
+
+import asyncio
+import multiprocessing
+import resource
+import sys
+import time
+
+import cryptoapi
+from benchmarks import frames
+from benchmarks.mock_server import MockServer
+
+CHANNELS = ['ticker', 'trades', 'order_book', 'ohlcvs']
+
+
+def serve(exchange, count, rate, conn):
+    async def run():
+        async with MockServer(exchange, count, rate) as server:
+            conn.send((server.url, server.http_url))
+            while not server.sent or len(server.sent[0]) < count:
+                await asyncio.sleep(0.01)
+            conn.send(server.sent[0])
+    asyncio.run(run())
+
+
+def consume(exchange, channel, urls, conn):
+    async def run():
+        ex = getattr(cryptoapi, exchange.capitalize())({'reconnect': False})
+        frames.load_market(ex, exchange)
+        symbol = frames.MARKETS[exchange]['symbol']
+        ex.ws_endpoint['public'] = urls[0]
+        # REST snapshots come from the mock server as well.
+        ex.urls['api'] = {'public': urls[1], 'private': urls[1]}
+        received = []
+
+        async def read():
+            while True:
+                await ex.result.get()
+                received.append(time.monotonic_ns())
+
+        reader = asyncio.ensure_future(read())
+        await getattr(ex, 'subscribe_' + channel)([symbol])
+        while not ex.result.empty():
+            await asyncio.sleep(0)
+        reader.cancel()
+        await ex.close()
+        return received
+    received = asyncio.run(run())
+    conn.send((received, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def receive(conn, process):
+    # Fails instead of waiting forever when the process died.
+    while not conn.poll(0.1):
+        if not process.is_alive():
+            raise RuntimeError(f'{process.name} exited with code {process.exitcode}.')
+    return conn.recv()
+
+
+def run_case(exchange, channel, count, rate):
+    server_conn, server_child = multiprocessing.Pipe()
+    client_conn, client_child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(exchange, count, rate, server_child))
+    server.start()
+    client = None
+    try:
+        urls = receive(server_conn, server)
+        client = multiprocessing.Process(target=consume, args=(exchange, channel, urls, client_child))
+        client.start()
+        received, max_rss = receive(client_conn, client)
+        sent = receive(server_conn, server)
+    finally:
+        for process in [server, client]:
+            if process is not None:
+                process.terminate()
+                process.join()
+    return sent, received, max_rss
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(count=20000, rate=2000):
+    # Long enough to reach a steady state, short enough to finish.
+    paced_count = min(count, rate * 3)
+    print(f'{"":<24} {"msgs/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"peak RSS":>9}')
+    for exchange in frames.feeds:
+        ex = getattr(cryptoapi, exchange.capitalize())()
+        for channel in CHANNELS:
+            if not ex.channels[channel]['has']:
+                continue
+            sent, received, max_rss = run_case(exchange, channel, count, None)
+            if len(sent) != len(received):
+                # The numbers would be meaningless.
+                print(f'{exchange + " " + channel:<24} FAILED: {len(sent)} frames sent, {len(received)} results')
+                continue
+            throughput = len(received) / ((received[-1] - sent[0]) / 1e9)
+            sent, received, _ = run_case(exchange, channel, paced_count, rate)
+            if len(sent) != len(received):
+                print(f'{exchange + " " + channel:<24} FAILED: {len(sent)} frames sent, {len(received)} results')
+                continue
+            latencies = [(r - s) / 1e6 for s, r in zip(sent, received)]
+            print(f'{exchange + " " + channel:<24} {throughput:9.0f} {percentile(latencies, 0.5):8.2f}'
+                  f' {percentile(latencies, 0.99):8.2f} {max_rss / 1024:6.0f} MiB')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,41 @@
+"""Cold start cost of importing cryptoapi.
+
+Every case runs in a fresh interpreter and is timed from the outside, the
+interpreter start included, so an empty run is shown as the baseline. The
+best of repeat runs is printed to leave out disk cache misses.
+
+    python -m benchmarks.bench_import [repeat]
+"""
+
+import subprocess
+import sys
+import time
+
+CASES = [
+    ('python', 'pass'),
+    ('import cryptoapi', 'import cryptoapi'),
+    ('one adapter', 'import cryptoapi; cryptoapi.Kraken'),
+    ('every adapter', 'import cryptoapi; [getattr(cryptoapi, e) for e in cryptoapi.exchanges]'),
+    ('ccxt.async_support', 'import ccxt.async_support'),
+]
+
+
+def cold_start(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(repeat=10):
+    baseline = None
+    for name, code in CASES:
+        cost = cold_start(code, repeat)
+        baseline = cost if baseline is None else baseline
+        print(f'{name:<20} {cost:7.1f} ms  (+{cost - baseline:6.1f} ms)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
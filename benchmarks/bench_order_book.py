@@ -0,0 +1,116 @@
+"""Local order book update throughput.
+
+Replays the same stream of random deltas against the list-scan update that
+``Exchange.update_order_book`` used to do and against the indexed
+``OrderBook`` it uses now, and prints updates per second for each.
+
+    python -m benchmarks.bench_order_book [depth] [updates]
+"""
+
+import random
+import sys
+import time
+
+from cryptoapi.base.exchange import Exchange
+
+MARKET = {'symbol': 'BTC/USD'}
+MID = 10000.0
+
+
+def legacy_update_order_book(order_book, update):
+    # The previous implementation, kept here as the baseline.
+    cupdate = update.copy()
+    order_book['timestamp'] = cupdate.pop('timestamp')
+    order_book['datetime'] = cupdate.pop('datetime')
+    order_book['nonce'] = cupdate.pop('nonce')
+    prices = {
+        'bids': [bid[0] for bid in order_book['bids']],
+        'asks': [ask[0] for ask in order_book['asks']]
+    }
+    for key, bids_asks in cupdate.items():
+        for bid_ask in bids_asks:
+            price = bid_ask[0]
+            amount = bid_ask[1]
+            if price in prices[key]:
+                idx = prices[key].index(price)
+                if amount == 0:
+                    del order_book[key][idx]
+                    del prices[key][idx]
+                else:
+                    order_book[key][idx] = bid_ask
+            else:
+                order_book[key].append(bid_ask)
+    order_book['bids'] = sorted(order_book['bids'], key=lambda l: l[0], reverse=True)
+    order_book['asks'] = sorted(order_book['asks'], key=lambda l: l[0])
+
+
+def make_snapshot(depth):
+    return {
+        'bids': [[MID - i, 1.0] for i in range(1, depth + 1)],
+        'asks': [[MID + i, 1.0] for i in range(1, depth + 1)],
+        'timestamp': None,
+        'datetime': None,
+        'nonce': None,
+    }
+
+
+def make_updates(depth, count, seed=0):
+    rng = random.Random(seed)
+    levels = {
+        'bids': set(range(1, depth + 1)),
+        'asks': set(range(1, depth + 1)),
+    }
+    updates = []
+    for n in range(count):
+        side = 'bids' if rng.random() < 0.5 else 'asks'
+        offset = rng.randint(1, depth)
+        price = MID - offset if side == 'bids' else MID + offset
+        # Roughly a third of the deltas remove a level, like a real feed.
+        # Only levels that exist get removed so both books stay comparable.
+        if offset in levels[side] and rng.random() < 0.3:
+            amount = 0
+            levels[side].discard(offset)
+        else:
+            amount = round(rng.uniform(0.1, 5), 4)
+            levels[side].add(offset)
+        updates.append({
+            'bids': [[price, amount]] if side == 'bids' else [],
+            'asks': [[price, amount]] if side == 'asks' else [],
+            'timestamp': n,
+            'datetime': None,
+            'nonce': None,
+        })
+    return updates
+
+
+def bench_legacy(depth, updates):
+    order_book = make_snapshot(depth)
+    start = time.perf_counter()
+    for update in updates:
+        legacy_update_order_book(order_book, update)
+    return len(updates) / (time.perf_counter() - start), order_book
+
+
+def bench_indexed(depth, updates):
+    exchange = Exchange()
+    exchange.update_order_book(make_snapshot(depth), MARKET, snapshot=True)
+    start = time.perf_counter()
+    for update in updates:
+        exchange.update_order_book(update, MARKET)
+    return len(updates) / (time.perf_counter() - start), exchange.order_book[MARKET['symbol']]
+
+
+def main(depth=100, count=50000):
+    updates = make_updates(depth, count)
+    legacy_rate, legacy_book = bench_legacy(depth, updates)
+    indexed_rate, indexed_book = bench_indexed(depth, updates)
+    # Both implementations must end up with the same book.
+    assert legacy_book['bids'] == indexed_book['bids']
+    assert legacy_book['asks'] == indexed_book['asks']
+    print(f'depth={depth} updates={count}')
+    print(f'list scan: {legacy_rate:12,.0f} updates/s')
+    print(f'indexed:   {indexed_rate:12,.0f} updates/s ({indexed_rate / legacy_rate:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
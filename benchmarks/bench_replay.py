@@ -0,0 +1,50 @@
+"""Parsing pipeline throughput per exchange, replayed from a recording.
+
+Records synthetic frames for every exchange class, then replays them as fast
+as possible through Replayer, which runs the real consumer path (decode,
+routing, parsing, local order books, result queues) without a network.
+
+    python -m benchmarks.bench_replay [frames]
+"""
+
+import asyncio
+import sys
+import tempfile
+
+import cryptoapi
+from benchmarks import frames
+from cryptoapi.base.recorder import Recorder
+from cryptoapi.base.replay import Replayer
+
+
+def record(path, name, count):
+    exchange = getattr(cryptoapi, name.capitalize())()
+    recorder = Recorder(path, exchange.id)
+    snapshot = frames.snapshot(name)
+    if snapshot:
+        recorder.write(0, snapshot, frames.MARKETS[name]['symbol'])
+    for frame in frames.subscribed(name) + frames.feeds[name](count):
+        recorder.write(0, frame)
+    recorder.close()
+
+
+async def replay(path, name):
+    exchange = getattr(cryptoapi, name.capitalize())()
+    frames.load_market(exchange, name)
+    exchange.result = None
+    replayer = Replayer(exchange, path)
+    await replayer.run()
+    await exchange.close()
+    return replayer
+
+
+async def main(count=50000):
+    for name in frames.feeds:
+        with tempfile.TemporaryDirectory() as path:
+            record(path, name, count)
+            replayer = await replay(path, name)
+        print(f'{name:<12} {replayer.frames} frames  {replayer.throughput():9.0f} frames/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:2]]))
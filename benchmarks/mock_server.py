@@ -0,0 +1,239 @@
+"""Local websocket server that speaks enough of each exchange's protocol to
+drive the adapters.
+
+It acknowledges subscribe requests the way the exchange does (Bitfinex
+chanId events, Kraken subscriptionStatus, Coinbase Pro subscriptions,
+Bitvavo subscribed), sends the book snapshot the exchange would send, and
+streams ticker, trades, book or candle frames for the subscribed channels.
+The frames are synthetic (see frames.py) or taken from a recording.
+
+    python -m benchmarks.mock_server exchange [port] [rate]
+
+Point an adapter at it with exchange.ws_endpoint['public'] = url. Only one
+symbol is served per exchange: the one in frames.MARKETS. Plain HTTP
+requests for the REST book snapshot of exchanges that don't send one over
+the websocket (Bitvavo) are answered too, point exchange.urls['api'] at
+http_url for those.
+"""
+
+import asyncio
+import itertools
+import json
+import sys
+import time
+import websockets
+
+from benchmarks import frames
+from cryptoapi.base.recorder import read_frames
+
+BITFINEX_IDS = {
+    'book': frames.BITFINEX_BOOK_ID,
+    'trades': frames.BITFINEX_TRADES_ID,
+    'ticker': frames.BITFINEX_TICKER_ID,
+    'candles': frames.BITFINEX_CANDLES_ID,
+}
+KRAKEN_IDS = {
+    'book': frames.KRAKEN_BOOK_ID,
+    'trade': frames.KRAKEN_TRADES_ID,
+    'ticker': frames.KRAKEN_TICKER_ID,
+    'ohlc': frames.KRAKEN_CANDLES_ID,
+}
+# Recorded frames are filed under the exchange's ccxt id.
+EXCHANGE_IDS = {'bitfinex': 'bitfinex2'}
+
+
+def channel_of(exchange, frame):
+    # The exchange's name of the channel a data frame belongs to. None for
+    # anything else (acks, heartbeats, info events).
+    if exchange == 'bitfinex':
+        if isinstance(frame, list) and frame[1] != 'hb':
+            return {v: k for k, v in BITFINEX_IDS.items()}.get(frame[0])
+    elif exchange == 'kraken':
+        if isinstance(frame, list):
+            return frame[2].split('-')[0]
+    elif exchange == 'coinbasepro':
+        return {'snapshot': 'level2', 'l2update': 'level2', 'match': 'matches', 'ticker': 'ticker'}.get(frame['type'])
+    elif exchange == 'bitvavo':
+        return {'book': 'book', 'trade': 'trades', 'ticker24h': 'ticker24h', 'candle': 'candles'}.get(frame['event'])
+
+
+def acks(exchange, request, subscribed):
+    # The replies to a subscribe request and the names of the channels it
+    # opened. subscribed is every channel opened on the connection so far.
+    if exchange == 'bitfinex':
+        ex_name = request['channel']
+        ack = {'event': 'subscribed', 'channel': ex_name, 'chanId': BITFINEX_IDS[ex_name]}
+        if ex_name == 'candles':
+            ack['key'] = request['key']
+        else:
+            ack.update({'symbol': request['symbol'], 'pair': request['symbol'][1:]})
+        if ex_name == 'book':
+            ack.update({'prec': request['prec'], 'freq': request['freq'], 'len': str(request['len'])})
+        return [ack], [ex_name]
+    if exchange == 'kraken':
+        subscription = request['subscription']
+        ex_name = subscription['name']
+        channel_name = f"book-{subscription['depth']}" if ex_name == 'book' else ex_name
+        if ex_name == 'ohlc':
+            channel_name = f"ohlc-{subscription['interval']}"
+        return [{
+            'channelID': KRAKEN_IDS[ex_name],
+            'channelName': channel_name,
+            'event': 'subscriptionStatus',
+            'pair': pair,
+            'status': 'subscribed',
+            'subscription': subscription,
+        } for pair in request['pair']], [ex_name]
+    if exchange == 'coinbasepro':
+        names = [c['name'] for c in request['channels']]
+        subscribed.extend(names)
+        return [{'type': 'subscriptions', 'channels': [
+            {'name': name, 'product_ids': [frames.MARKETS['coinbasepro']['id']]} for name in subscribed
+        ]}], names
+    if exchange == 'bitvavo':
+        names = [c['name'] for c in request['channels']]
+        subscribed.extend(names)
+        subscriptions = {}
+        for c in request['channels']:
+            if c['name'] == 'candles':
+                for interval in c['interval']:
+                    subscriptions.setdefault('candles', {})[interval] = c['markets']
+            else:
+                subscriptions[c['name']] = c['markets']
+        return [{'event': 'subscribed', 'subscriptions': subscriptions}], names
+
+
+def snapshot(exchange, ex_name):
+    # The book snapshot the exchange sends after subscribing, if any.
+    if ex_name not in ['book', 'level2']:
+        return None
+    for frame in frames.subscribed(exchange):
+        if channel_of(exchange, json.loads(frame)) == ex_name:
+            return frame
+
+
+def rest(exchange, path):
+    # The body of a REST response, None if the path isn't served.
+    book = frames.snapshot(exchange)
+    market = frames.MARKETS[exchange]['id']
+    if book and path.split('?')[0] == f'/v2/{market}/book':
+        return json.dumps({
+            'market': market,
+            'nonce': book['nonce'],
+            'bids': [[str(price), str(amount)] for price, amount in book['bids']],
+            'asks': [[str(price), str(amount)] for price, amount in book['asks']],
+        })
+
+
+class MockServer:
+
+    def __init__(self, exchange, count=10000, rate=None, recording=None, host='127.0.0.1', port=0):
+        self.exchange = exchange
+        # Data frames streamed per connection, snapshots included.
+        self.count = count
+        # Data frames per second. None streams as fast as possible.
+        self.rate = rate
+        # Recording to stream instead of synthetic frames.
+        self.recording = recording
+        self.host = host
+        self.port = port
+        self.server = None
+        # Monotonic send time in ns of every data frame, per connection.
+        self.sent = []
+
+    @property
+    def url(self):
+        return f'ws://{self.host}:{self.port}'
+
+    @property
+    def http_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        self.server = await websockets.serve(self.handler, self.host, self.port, process_request=self.process_request)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def pool(self, ex_names, size=10000):
+        # The data frames of the given channels that are streamed, over and
+        # over. Built before streaming so generating frames doesn't limit
+        # the rate.
+        if self.recording:
+            exchange_id = EXCHANGE_IDS.get(self.exchange, self.exchange)
+            return [
+                r['f'] for r in read_frames(self.recording)
+                if r['e'] == exchange_id and 's' not in r
+                and channel_of(self.exchange, json.loads(r['f'])) in ex_names
+            ]
+        pool = []
+        seed = 0
+        while len(pool) < size:
+            generated = frames.feeds[self.exchange](size, seed)
+            if set(ex_names) & {'candles', 'ohlc'}:
+                generated += frames.candles(self.exchange, size, seed)
+            pool += [f for f in generated if channel_of(self.exchange, json.loads(f)) in ex_names]
+            seed += 1
+        return pool[:size]
+
+    def process_request(self, connection, request):
+        if 'Upgrade' in request.headers:
+            return None
+        body = rest(self.exchange, request.path)
+        if body is None:
+            return connection.respond(404, 'Not found\n')
+        return connection.respond(200, body)
+
+    async def handler(self, websocket):
+        subscribed = []
+        sent = []
+        self.sent.append(sent)
+        stream = None
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                replies, ex_names = acks(self.exchange, request, subscribed)
+                for reply in replies:
+                    await websocket.send(json.dumps(reply, separators=(',', ':')))
+                if stream is None:
+                    # Streams the channels of the first request.
+                    stream = asyncio.ensure_future(self.stream(websocket, ex_names, sent))
+            if stream is not None:
+                await stream
+        finally:
+            if stream is not None:
+                stream.cancel()
+
+    async def stream(self, websocket, ex_names, sent):
+        queued = [snapshot(self.exchange, ex_name) for ex_name in ex_names]
+        source = itertools.chain([f for f in queued if f], itertools.cycle(self.pool(ex_names)))
+        start = time.monotonic()
+        for n in range(self.count):
+            frame = next(source)
+            if self.rate:
+                wait = start + n / self.rate - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            sent.append(time.monotonic_ns())
+            await websocket.send(frame)
+        await websocket.close()
+
+
+async def main(exchange, port=8765, rate=1000):
+    async with MockServer(exchange, count=10 ** 12, rate=rate, port=port) as server:
+        print(f'{exchange} listening on {server.url}')
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1], *[int(arg) for arg in sys.argv[2:4]]))
@@ -1,20 +1,27 @@
 __version__ = '0.1.22'
 
 
-from cryptoapi.base.exchange import Exchange
+import importlib
 
-from cryptoapi.bitfinex import Bitfinex
-from cryptoapi.bitvavo import Bitvavo
-from cryptoapi.coinbasepro import Coinbasepro
-from cryptoapi.kraken import Kraken
-
-from cryptoapi.base import errors
-from cryptoapi.base.errors import error_hierarchy
-from cryptoapi.base.errors import SubscribeError
-from cryptoapi.base.errors import UnsubscribeError
-from cryptoapi.base.errors import ChannelLimitExceeded
-from cryptoapi.base.errors import Reconnect
-from cryptoapi.base.errors import UnknownResponse
+# The adapters and errors pull in ccxt and its exchange registries, so they
+# are imported on first access (see __getattr__) rather than with the
+# package. {name: module defining it}
+lazy = {
+    'Exchange': 'cryptoapi.base.exchange',
+    'ConsolidatedBook': 'cryptoapi.base.consolidated',
+    'Hub': 'cryptoapi.base.hub',
+    'WorkerPool': 'cryptoapi.base.workers',
+    'Bitfinex': 'cryptoapi.bitfinex',
+    'Bitvavo': 'cryptoapi.bitvavo',
+    'Coinbasepro': 'cryptoapi.coinbasepro',
+    'Kraken': 'cryptoapi.kraken',
+    'error_hierarchy': 'cryptoapi.base.errors',
+    'SubscribeError': 'cryptoapi.base.errors',
+    'UnsubscribeError': 'cryptoapi.base.errors',
+    'ChannelLimitExceeded': 'cryptoapi.base.errors',
+    'Reconnect': 'cryptoapi.base.errors',
+    'UnknownResponse': 'cryptoapi.base.errors',
+}
 
 exchanges = [
     'Bitfinex',
@@ -23,9 +30,31 @@ exchanges = [
     'Kraken'
 ]
 
-base = [
+# Not named base, which is the cryptoapi.base package once it's imported.
+core = [
+    'ConsolidatedBook',
     'Exchange',
+    'Hub',
+    'WorkerPool',
     'exchanges',
 ]
 
-__all__ = base + errors.__all__ + exchanges
+
+def __getattr__(name):
+    if name == 'errors':
+        value = importlib.import_module('cryptoapi.base.errors')
+    elif name == '__all__':
+        value = core + __getattr__('errors').__all__ + exchanges
+    elif name in lazy:
+        value = getattr(importlib.import_module(lazy[name]), name)
+    else:
+        # The ccxt errors listed by cryptoapi.base.errors.
+        if name not in __getattr__('errors').__all__:
+            raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+        value = getattr(importlib.import_module('ccxt.base.errors'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__getattr__('__all__')) | {'errors'})
@@ -1,4 +1,29 @@
+from cryptoapi.base import codec
+from cryptoapi.base import consolidated
 from cryptoapi.base import errors
 from cryptoapi.base import exchange
+from cryptoapi.base import hub
+from cryptoapi.base import market_cache
+from cryptoapi.base import metrics
+from cryptoapi.base import order_book
+from cryptoapi.base import queues
+from cryptoapi.base import recorder
+from cryptoapi.base import replay
+from cryptoapi.base import supervisor
+from cryptoapi.base import workers
 
-__all__ = exchange.__all__ + errors.__all__
+__all__ = (
+    exchange.__all__
+    + errors.__all__
+    + codec.__all__
+    + consolidated.__all__
+    + hub.__all__
+    + market_cache.__all__
+    + metrics.__all__
+    + order_book.__all__
+    + queues.__all__
+    + recorder.__all__
+    + replay.__all__
+    + supervisor.__all__
+    + workers.__all__
+)
@@ -0,0 +1,73 @@
+__all__ = [
+    'JsonCodec',
+    'OrjsonCodec',
+    'UjsonCodec',
+    'get_codec',
+]
+
+
+import json
+
+
+class JsonCodec:
+    # Standard library json. Always available.
+    name = 'json'
+
+    def decode(self, frame):
+        # Frames can be str or bytes, json.loads takes both.
+        return json.loads(frame)
+
+    def encode(self, message):
+        return json.dumps(message, separators=(',', ':'))
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+        self.dumps = orjson.dumps
+
+    def decode(self, frame):
+        return self.loads(frame)
+
+    def encode(self, message):
+        # orjson returns bytes, which websockets would send as a binary frame.
+        return self.dumps(message).decode()
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.loads = ujson.loads
+        self.dumps = ujson.dumps
+
+    def decode(self, frame):
+        return self.loads(frame)
+
+    def encode(self, message):
+        return self.dumps(message)
+
+
+codecs = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    UjsonCodec.name: UjsonCodec,
+}
+
+
+def get_codec(name='auto'):
+    # 'auto' picks the fastest codec that is installed.
+    if name == 'auto':
+        for codec in [OrjsonCodec, UjsonCodec]:
+            try:
+                return codec()
+            except ImportError:
+                pass
+        return JsonCodec()
+    if name not in codecs:
+        raise ValueError(f'Unknown codec: {name}.')
+    return codecs[name]()
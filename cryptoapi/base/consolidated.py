@@ -0,0 +1,103 @@
+__all__ = [
+    'ConsolidatedBook',
+]
+
+
+from cryptoapi.base.order_book import OrderBook
+
+
+class ConsolidatedBook(OrderBook):
+    # The local books of one unified symbol on several exchanges, merged.
+    # Levels are [price, total amount, {exchange name: amount}], so every
+    # level tells which exchanges contribute what. The book listens to the
+    # exchanges' local books (see Exchange.notify_order_book()) and applies
+    # each of their deltas as it comes: a dict update of the level's
+    # amounts and a bisect in the sorted side. It's never merged again from
+    # the full books, only a snapshot replaces the levels of its exchange.
+    #
+    #   book = ConsolidatedBook('BTC/EUR', {'kraken': kraken, 'bitvavo': bitvavo})
+    #   book.bbo()  # Best bid and ask across the exchanges.
+    #
+    # Amounts are the ones the exchanges send. Levels a local book prunes
+    # beyond its depth stay until the exchange removes them.
+
+    def __init__(self, symbol, exchanges={}):
+        super().__init__()
+        self.symbol = symbol
+        # Levels of every exchange. {name: {'bids': {price: amount},
+        # 'asks': {price: amount}}}
+        self.venues = {}
+        # (exchange, listener) by name.
+        self.listeners = {}
+        for name, exchange in exchanges.items():
+            self.attach(name, exchange)
+
+    def attach(self, name, exchange):
+        # Follows the exchange's local book of the symbol, starting from
+        # the book it has now.
+        def listener(exchange, symbol, update, snapshot):
+            if symbol == self.symbol:
+                self.update(name, update, snapshot)
+        self.listeners[name] = (exchange, listener)
+        exchange.order_book_listeners.append(listener)
+        order_book = exchange.order_book.get(self.symbol)
+        if order_book is not None:
+            self.update(name, order_book, snapshot=True)
+
+    def detach(self, name):
+        # Stops following the exchange and removes its levels.
+        exchange, listener = self.listeners.pop(name)
+        exchange.order_book_listeners.remove(listener)
+        self.update(name, None, snapshot=True)
+
+    def update(self, name, update, snapshot=False):
+        # Applies the deltas of an exchange's update. A snapshot replaces
+        # every level of the exchange, None removes them.
+        self._bbo = None
+        self._arrays = None
+        if snapshot:
+            venue = self.venues.pop(name, None)
+            if venue is not None:
+                for key in ['bids', 'asks']:
+                    side = self[key]
+                    for price in venue[key]:
+                        self._store_level(side, name, price, 0)
+            if update is None:
+                return
+        venue = self.venues.get(name)
+        if venue is None:
+            venue = self.venues[name] = {'bids': {}, 'asks': {}}
+        for key in ['bids', 'asks']:
+            side = self[key]
+            levels = venue[key]
+            for delta in update[key]:
+                price = delta[0]
+                amount = delta[1]
+                if amount:
+                    levels[price] = amount
+                elif levels.pop(price, None) is None:
+                    continue
+                self._store_level(side, name, price, amount)
+        self['timestamp'] = update['timestamp']
+        self['datetime'] = update['datetime']
+
+    def _store_level(self, side, name, price, amount):
+        level = side._levels.get(price)
+        # Levels are replaced, never changed in place, see top().
+        amounts = dict(level[2]) if level is not None else {}
+        if amount:
+            amounts[name] = amount
+        else:
+            amounts.pop(name, None)
+        side.store([price, sum(amounts.values()), amounts] if amounts else [price, 0])
+
+    def bbo(self):
+        # OrderBook.bbo() across the exchanges, with the amount of every
+        # exchange at the best bid and ask.
+        if self._bbo is None:
+            bbo = super().bbo()
+            bids = self['bids']
+            asks = self['asks']
+            bbo['bidExchanges'] = bids[0][2] if bids else None
+            bbo['askExchanges'] = asks[0][2] if asks else None
+        return self._bbo
@@ -7,9 +7,9 @@ cryptoapi_errors = [
     'error_hierarchy',
     'SubscribeError',
     'UnsubscribeError',
-    'ChannelLimitExceeed',
+    'ChannelLimitExceeded',
     'Reconnect',
-    'UnkownResponse'
+    'UnknownResponse'
 ]
 
 # Do not include ccxt.error_hierarchy
@@ -48,7 +48,7 @@ error_hierarchy = {
         'NetworkError': {
             'DDoSProtection': {
                 'RateLimitExceeded': {},
-                'ChannelLimitExceeed': {},
+                'ChannelLimitExceeded': {},
             },
             'ExchangeNotAvailable': {
                 'OnMaintenance': {},
@@ -56,7 +56,7 @@ error_hierarchy = {
             'InvalidNonce': {},
             'RequestTimeout': {},
             'Reconnect': {},
-            'UnkownResponse': {},
+            'UnknownResponse': {},
         },
     },
 }
@@ -5,10 +5,28 @@ __all__ = [
 
 import asyncio
 import ccxt
+import random
+import time
 import websockets
 
 from aiolimiter import AsyncLimiter
+from ccxt.base.errors import BaseError
+from ccxt.base.errors import ExchangeNotAvailable
+from ccxt.base.errors import NetworkError
+from cryptoapi.base.codec import get_codec
+from cryptoapi.base.market_cache import MarketCache
+from cryptoapi.base.metrics import CHANNEL_COUNTERS
+from cryptoapi.base.metrics import CONNECTION_COUNTERS
+from cryptoapi.base.metrics import LatencyTracker
+from cryptoapi.base.metrics import prometheus
+from cryptoapi.base.order_book import OrderBook
+from cryptoapi.base.order_book import stack_order_books
+from cryptoapi.base.queues import ResultQueue
+from cryptoapi.base.recorder import Recorder
+from cryptoapi.base.supervisor import Supervisor
 from cryptoapi.base.errors import UnknownResponse
+from websockets.exceptions import ConnectionClosed
+from websockets.exceptions import InvalidHandshake
 
 
 class Exchange(ccxt.Exchange):
@@ -17,8 +35,14 @@ class Exchange(ccxt.Exchange):
     TRADES = 'trades'
     ORDER_BOOK = 'order_book'
     OHLCVS = 'ohlcvs'
-
-    def __init__(self):
+    # Best bid and ask of an order book. Not subscribed to on its own:
+    # create a result_queue() for it next to an order book subscription.
+    BBO = 'bbo'
+
+    def __init__(self, config={}):
+        # JSON codec for websocket frames: 'auto' (the fastest installed),
+        # 'orjson', 'ujson' or 'json'.
+        self.codec = get_codec(config.get('codec', 'auto'))
         self.channels = {
             self.TICKER: {
                 'ex_name': '',
@@ -43,6 +67,12 @@ class Exchange(ccxt.Exchange):
         }
         self.channels_by_ex_name = self.create_channels_by_ex_name()
         self.max_channels = 0  # Maximum number of channels per connection.
+        # Maximum number of symbols the exchange accepts in one subscribe
+        # message. Only used if batch_requests is True.
+        self.max_symbols_per_request = 1
+        # Pack many symbols in one subscribe message instead of sending one
+        # message per symbol.
+        self.batch_requests = config.get('batch_requests', False)
         # Number of connections that can be created per unit time,
         #   where the unit of time is in milliseconds.
         # Example: AsyncLimiter(1, 60000 / 1000) --> one connection per minute
@@ -51,7 +81,72 @@ class Exchange(ccxt.Exchange):
             'private': AsyncLimiter(1, 60000 / 1000)
         }
         self.connections = {}
+        self.next_channel_id = 0  # See claim_channel_id().
+        # Ids of the open connections, in the order they were opened.
+        self.connection_ids = {}
+        self.connection_count = 0
+        # Directory to record every received frame to. None disables it.
+        record = config.get('record')
+        self.recorder = Recorder(record, self.id, config.get('record_segment_size', 64 * 2 ** 20)) if record else None
+        # Directory to cache the loaded markets in, see load_markets(). None
+        # disables it.
+        market_cache = config.get('market_cache')
+        self.market_cache = MarketCache(market_cache, config.get('market_cache_ttl', 24 * 3600)) if market_cache else None
+        # Reloads expired cached markets in the background.
+        self.market_refresh = None
+        # Per channel latency histograms of every stage of handle_frame().
+        # Enabled by the 'latency' option, None otherwise.
+        self.latency = LatencyTracker() if config.get('latency') else None
+        # Message counters, see stats(). {websocket: counters} for the open
+        # connections and {channel name: counters} since start.
+        self.counters_by_connection = {}
+        self.counters_by_channel = {}
+        # Routing table for market replies, built by add_channel().
+        # {websocket: {ex_channel_id: route}}
+        self.routes = {}
+        # Runs the connection tasks. Use it to wait for or cancel them.
+        self.supervisor = Supervisor()
+        # Reopen dropped connections and replay their subscriptions.
+        self.reconnect = config.get('reconnect', True)
+        # Errors after which a connection is reopened. NetworkError covers
+        # Reconnect, OnMaintenance and failed REST snapshots.
+        self.reconnect_errors = (
+            ConnectionClosed,
+            InvalidHandshake,
+            OSError,
+            NetworkError,
+        )
+        # Backoff between attempts, in seconds. It doubles with every failed
+        # attempt and is jittered to spread reconnects out.
+        self.reconnect_delay_min = 1
+        self.reconnect_delay_max = 60
+        # Seconds to wait before reconnecting when the exchange is
+        # undergoing maintenance.
+        self.maintenance_delay = 120
+        # Seconds without any message after which a connection is
+        # considered stale and reopened. None disables the check.
+        self.stale_timeout = None
+        self.last_received = {}
+        # Call check_sequence() with every decoded reply, for exchanges that
+        # number their messages. Last sequence number per connection.
+        self.verify_sequence = False
+        self.sequences = {}
+        # Symbols whose book must be fetched over REST once their channel is
+        # registered. {websocket: [symbol]}
+        self.pending_snapshots = {}
+        # Every result is put in this queue. Set it to None if results are
+        # only read from the queues returned by result_queue().
         self.result = asyncio.Queue(maxsize=1)
+        # Queues keyed by (channel, symbol). A symbol of None catches every
+        # symbol of the channel that doesn't have its own queue.
+        self.result_queues = {}
+        # Order books that publish their top levels instead of every update.
+        # {symbol: {'top', 'interval', 'published', 'time', 'timer'}}
+        self.conflation = {}
+        # Last published (bid, bidVolume, ask, askVolume) per symbol. BBO
+        # results are only published once a result_queue() exists for them.
+        self.published_bbo = {}
+        self.publish_bbo = False
         self.ws_endpoint = {
             'public': '',
             'private': ''
@@ -60,9 +155,49 @@ class Exchange(ccxt.Exchange):
         self.subscribed = ''
         self.errors = {}
         self.order_book = {}
+        # Maximum number of levels per side of a local book, see
+        # limit_order_books(). {symbol: depth}
+        self.order_book_depth = {}
+        # Maximum number of levels read from a local book, see
+        # limit_order_books(). {symbol: limit}
+        self.order_book_limits = {}
+        # Called with (exchange, symbol, update, snapshot) after a local book
+        # changed, see notify_order_book().
+        self.order_book_listeners = []
+        # Checksum strings of recently seen levels, see checksum_cache().
+        # {symbol: {(price, amount): str}}
+        self.checksum_tokens = {}
+        # Strings cached per book before its cache starts over.
+        self.max_checksum_tokens = 10000
         # All message events that are not unified.
         self.others = []
 
+    async def load_markets(self, reload=False, params={}):
+        # With a market cache the markets are taken from disk when there.
+        # Expired ones are used while they are reloaded in the background.
+        cache = self.market_cache
+        if cache is None or self.markets and not reload:
+            return await super().load_markets(reload, params)
+        if not reload:
+            entry = cache.read(self.id)
+            if entry is not None:
+                self.set_markets(entry['markets'], entry['currencies'])
+                if cache.expired(entry) and self.market_refresh is None:
+                    self.market_refresh = asyncio.ensure_future(self.refresh_markets(params))
+                return self.markets
+        markets = await super().load_markets(reload, params)
+        await asyncio.get_event_loop().run_in_executor(
+            None, cache.write, self.id, list(markets.values()), self.currencies)
+        return markets
+
+    async def refresh_markets(self, params={}):
+        try:
+            await self.load_markets(reload=True, params=params)
+        except (BaseError, OSError):
+            pass  # The cached markets are kept until the next start.
+        finally:
+            self.market_refresh = None
+
     async def subscribe_ticker(self, symbols, params={}):
         requests = self.build_requests(symbols, self.TICKER)
         await self.subscribe(requests, public=True)
@@ -71,7 +206,9 @@ class Exchange(ccxt.Exchange):
         requests = self.build_requests(symbols, self.TRADES)
         await self.subscribe(requests, public=True)
 
-    async def subscribe_order_book(self, symbols, params={}):
+    async def subscribe_order_book(self, symbols, params={}, top=None, interval=None, limit=None):
+        self.limit_order_books(symbols, limit=limit)
+        self.conflate_order_books(symbols, top, interval)
         requests = self.build_requests(symbols, self.ORDER_BOOK)
         await self.subscribe(requests, public=True)
 
@@ -82,19 +219,159 @@ class Exchange(ccxt.Exchange):
     def build_requests(self, symbols, channel):
         return []
 
+    def batch_ids(self, ids):
+        # A batch never spans more than one connection.
+        size = min(self.max_symbols_per_request, self.max_channels) if self.batch_requests else 1
+        return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    def count_channels(self, request):
+        # Number of channels a subscribe request opens.
+        return 1
+
+    def shard_requests(self, requests):
+        shards = []
+        shard = []
+        size = 0
+        for r in requests:
+            n = self.count_channels(r)
+            if shard and size + n > self.max_channels:
+                shards.append(shard)
+                shard = []
+                size = 0
+            shard.append(r)
+            size += n
+        if shard:
+            shards.append(shard)
+        return shards
+
     async def subscribe(self, requests, public):
+        # Every shard of at most max_channels channels gets its own
+        # connection. The connections are opened concurrently (as fast as
+        # max_connections allows) and run until they close or fail.
+        tasks = [
+            self.supervisor.spawn(self.connect(shard, public))
+            for shard in self.shard_requests(requests)
+        ]
+        await self.supervisor.wait(tasks)
+
+    async def connect(self, requests, public):
         rate_limit = self.max_connections['public'] if public else self.max_connections['private']
         endpoint = self.ws_endpoint['public'] if public else self.ws_endpoint['private']
-        while requests:
-            async with rate_limit:
-                websocket = await websockets.connect(endpoint)
+        attempt = 0
+        while True:
+            websocket = None
+            channels = []
+            synced = False
+            delay = None
+            try:
+                async with rate_limit:
+                    websocket = await websockets.connect(endpoint)
                 self.connections[websocket] = []  # Register websocket
-                await self.send(websocket, requests[:self.max_channels])
-                del requests[:self.max_channels]
-                await asyncio.create_task(self.consumer(websocket))
+                self.connection_ids[websocket] = self.connection_count
+                self.connection_count += 1
+                await self.send(websocket, self.connection_requests() + requests)
+                await self.run_consumer(websocket)
+            except self.reconnect_errors as e:
+                if not self.reconnect:
+                    raise
+                if isinstance(e, ExchangeNotAvailable):
+                    delay = self.maintenance_delay
+            finally:
+                if websocket is not None:
+                    channels = self.connections.pop(websocket)
+                    # Synced if every channel was registered and got its book.
+                    synced = channels and websocket not in self.pending_snapshots
+                    self.routes.pop(websocket, None)
+                    self.connection_ids.pop(websocket, None)
+                    self.counters_by_connection.pop(websocket, None)
+                    self.last_received.pop(websocket, None)
+                    self.sequences.pop(websocket, None)
+                    self.pending_snapshots.pop(websocket, None)
+                    await websocket.close()
+            if not self.reconnect:
+                return
+            if channels and len(channels) >= sum(self.count_channels(r) for r in requests):
+                # Replay exactly what was registered.
+                requests = [c['request'] for c in channels]
+            attempt = 0 if synced else attempt + 1
+            # The books are rebuilt from the snapshots that follow the new
+            # subscriptions. Until then their deltas are dropped.
+            self.drop_order_books([c['symbol'] for c in channels if c['name'] == self.ORDER_BOOK])
+            await asyncio.sleep(self.reconnect_delay(attempt) if delay is None else delay)
+
+    def reconnect_delay(self, attempt):
+        delay = min(self.reconnect_delay_max, self.reconnect_delay_min * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def run_consumer(self, websocket):
+        if not self.stale_timeout:
+            return await self.consumer(websocket)
+        watchdog = asyncio.ensure_future(self.watchdog(websocket))
+        try:
+            await self.consumer(websocket)
+        finally:
+            watchdog.cancel()
+
+    async def watchdog(self, websocket):
+        # Closes the connection when nothing was received for stale_timeout
+        # seconds, which ends the consumer so the connection is reopened.
+        self.last_received[websocket] = time.monotonic()
+        while True:
+            idle = time.monotonic() - self.last_received[websocket]
+            if idle >= self.stale_timeout:
+                await websocket.close()
+                return
+            await asyncio.sleep(self.stale_timeout - idle)
+
+    def drop_order_books(self, symbols):
+        for symbol in symbols:
+            if self.order_book.pop(symbol, None) is not None:
+                self.notify_order_book(symbol, None, snapshot=True)
+            self.published_bbo.pop(symbol, None)
+
+    def request_snapshot(self, symbol, websocket):
+        # For exchanges that don't send a snapshot after subscribing. The
+        # consumer fetches it once the subscribe reply is handled.
+        self.pending_snapshots.setdefault(websocket, []).append(symbol)
+
+    async def fetch_snapshots(self, websocket):
+        symbols = self.pending_snapshots[websocket]
+        snapshots = await asyncio.gather(*[self.fetch_snapshot(s) for s in symbols])
+        for symbol, snapshot in zip(symbols, snapshots):
+            if self.recorder is not None:
+                # The snapshot isn't a frame, but replays need it too.
+                self.recorder.write(self.connection_ids.get(websocket), snapshot, symbol)
+            await self.sync_order_book(symbol, snapshot)
+        del self.pending_snapshots[websocket]
+
+    def expect_snapshots(self, websocket):
+        # Called when the snapshots pending on a connection are requested,
+        # before they arrive. The Replayer calls it too.
+        pass
+
+    async def sync_order_book(self, symbol, snapshot):
+        # Applies a fetched snapshot. The Replayer applies recorded ones
+        # through here as well.
+        self.update_order_book(snapshot, self.markets[symbol], snapshot=True)
+
+    async def fetch_snapshot(self, symbol):
+        return await self.fetch_order_book(symbol)
+
+    async def close(self):
+        if self.market_refresh is not None:
+            self.market_refresh.cancel()
+        for state in self.conflation.values():
+            if state['timer'] is not None:
+                state['timer'].cancel()
+                state['timer'] = None
+        if self.recorder is not None:
+            # Wait for the recorder off the event loop.
+            await asyncio.get_event_loop().run_in_executor(None, self.recorder.close)
+            self.recorder = None
+        await super().close()
 
     async def send(self, websocket, requests):
-        requests = [super(Exchange, self).json(r) for r in requests]
+        requests = [self.codec.encode(r) for r in requests]
         tasks = [
             asyncio.create_task(websocket.send(r))
             for r in requests
@@ -103,18 +380,253 @@ class Exchange(ccxt.Exchange):
             await t
 
     async def consumer(self, websocket):
-        async for reply in websocket:
-            reply = super().unjson(reply)
-            if self.is_general_reply(reply):
-                parsed_reply = self.parse_general_reply(reply, websocket)
-            else:
-                parsed_reply = self.parse_market_reply(reply, websocket)
-            if parsed_reply:
-                await self.result.put(parsed_reply)
+        self.routes.setdefault(websocket, {})
+        handle_frame = self.handle_frame
+        async for frame in websocket:
+            await handle_frame(frame, websocket)
+            if websocket in self.pending_snapshots:
+                # Replies that arrive meanwhile wait in the websocket.
+                await self.fetch_snapshots(websocket)
+
+    async def handle_frame(self, frame, websocket):
+        # Everything the consumer does with a received frame. The Replayer
+        # feeds recorded frames through here as well.
+        latency = self.latency
+        if latency is not None:
+            received = time.monotonic_ns()
+        self.last_received[websocket] = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.write(self.connection_ids.get(websocket), frame)
+        counters = self.counters_by_connection.get(websocket)
+        if counters is None:
+            counters = self.counters_by_connection[websocket] = dict.fromkeys(CONNECTION_COUNTERS, 0)
+        size = len(frame)
+        counters['messages'] += 1
+        counters['bytes'] += size
+        reply = self.codec.decode(frame)
+        if self.verify_sequence:
+            self.check_sequence(reply, websocket)
+        if latency is not None:
+            decoded = time.monotonic_ns()
+        if self.is_general_reply(reply):
+            route = None
+            symbol = None
+            if self.is_heartbeat(reply):
+                counters['heartbeats'] += 1
+            parsed_reply = self.parse_general_reply(reply, websocket)
+        else:
+            route = self.routes[websocket].get(self.ex_channel_id_from_reply(reply))
+            if route is None:
+                counters['unknown_responses'] += 1
+                raise UnknownResponse(reply)
+            symbol = route['symbol']
+            channel_counters = route['counters']
+            channel_counters['messages'] += 1
+            channel_counters['bytes'] += size
+            if latency is not None:
+                routed = time.monotonic_ns()
+            try:
+                parsed_reply = route['parse'](reply, route['market'])
+            except Exception:
+                counters['parse_errors'] += 1
+                channel_counters['parse_errors'] += 1
+                raise
+        if latency is not None:
+            parsed = time.monotonic_ns()
+        if parsed_reply:
+            await self.put_result(parsed_reply, symbol)
+        if latency is not None and route is not None:
+            name = route['channel']['name']
+            latency.record(name, latency.DECODE, decoded - received)
+            latency.record(name, latency.ROUTE, routed - decoded)
+            latency.record(name, latency.PARSE, parsed - routed)
+            now = time.monotonic_ns()
+            latency.record(name, latency.ENQUEUE, now - parsed)
+            latency.record(name, latency.TOTAL, now - received)
+            timestamp = self.exchange_timestamp(reply, name)
+            if timestamp is not None:
+                latency.record(name, latency.EXCHANGE, (time.time() * 1000 - timestamp) * 1e6)
+
+    def connection_requests(self):
+        # Requests sent on every new connection before the subscriptions,
+        # like configuration events.
+        return []
+
+    def check_sequence(self, reply, websocket):
+        # Raises Reconnect when a reply was missed, see verify_sequence.
+        pass
+
+    def exchange_timestamp(self, reply, name):
+        # When the exchange sent a market reply, in ms since the epoch. None
+        # if the reply doesn't say. Only used for latency measurements.
+        return None
+
+    def result_queue(self, channel, symbol=None, maxsize=1, policy=ResultQueue.BLOCK):
+        key = (channel, symbol)
+        if channel == self.BBO:
+            self.publish_bbo = True
+        if key not in self.result_queues:
+            self.result_queues[key] = ResultQueue(maxsize, policy)
+        return self.result_queues[key]
+
+    async def put_result(self, parsed_reply, symbol=None):
+        if self.publish_bbo and parsed_reply[0] == self.ORDER_BOOK:
+            await self.put_bbo(symbol)
+        if self.conflation and symbol in self.conflation and parsed_reply[0] == self.ORDER_BOOK:
+            await self.conflate(symbol)
+            return
+        await self.enqueue_result(parsed_reply, symbol)
+
+    async def enqueue_result(self, parsed_reply, symbol=None):
+        name = parsed_reply[0]
+        queue = self.result_queues.get((name, symbol))
+        if queue is None:
+            queue = self.result_queues.get((name, None))
+        if queue is not None:
+            if queue.policy == queue.BLOCK and queue.full():
+                self.channel_counters(name)['queue_full_waits'] += 1
+            await queue.put(parsed_reply, symbol)
+        if self.result is not None:
+            if self.result.full():
+                self.channel_counters(name)['queue_full_waits'] += 1
+            await self.result.put(parsed_reply)
+
+    def checksum_cache(self, symbol):
+        # The checksum strings of the levels recently seen in a book, by
+        # (price, amount). Most of the top levels don't change from one
+        # update to the next, so their strings are formatted once.
+        tokens = self.checksum_tokens.get(symbol)
+        if tokens is None or len(tokens) > self.max_checksum_tokens:
+            tokens = self.checksum_tokens[symbol] = {}
+        return tokens
+
+    def bbo(self, symbol):
+        # Best bid and ask of the local order book, see OrderBook.bbo().
+        # None if there is no book.
+        order_book = self.order_book.get(symbol)
+        if order_book is None:
+            return None
+        if not isinstance(order_book, OrderBook):
+            order_book = self.order_book[symbol] = self.new_order_book(symbol, order_book)
+        return order_book.bbo()
+
+    def order_books_to_numpy(self, symbols, n, out=None):
+        # The n best levels of the symbols' local books stacked in one array,
+        # see stack_order_books(). Needs numpy.
+        return stack_order_books([self.order_book.get(s) for s in symbols], n, out)
+
+    async def put_bbo(self, symbol):
+        # Publishes the best bid and ask when the price or amount of either
+        # changed.
+        bbo = self.bbo(symbol)
+        if bbo is None:
+            return
+        top = (bbo['bid'], bbo['bidVolume'], bbo['ask'], bbo['askVolume'])
+        if top == self.published_bbo.get(symbol):
+            return
+        self.published_bbo[symbol] = top
+        await self.enqueue_result((self.BBO, {symbol: bbo}), symbol)
+
+    def limit_order_books(self, symbols, depth=None, limit=None):
+        # Local books keep at most depth levels per side, the window the
+        # exchange sends: levels that fall out of it are pruned, as the
+        # exchange doesn't send their removal. None keeps every level.
+        # The user's limit only caps the levels read from the books (see
+        # OrderBook), pruning to it would lose the levels behind it.
+        # Exchanges that send a window subscribe to the smallest one that
+        # holds limit levels instead.
+        for symbol in symbols:
+            self.order_book_depth[symbol] = depth
+            self.order_book_limits[symbol] = limit
+            if isinstance(self.order_book.get(symbol), OrderBook):
+                # Rebuild the book with the new depth.
+                self.order_book[symbol] = self.new_order_book(symbol, self.order_book[symbol])
+
+    def new_order_book(self, symbol, snapshot):
+        return OrderBook(snapshot, self.order_book_depth.get(symbol), self.order_book_limits.get(symbol))
+
+    def conflate_order_books(self, symbols, top=None, interval=None):
+        # Every update is still applied to the local books, but instead of
+        # the updates their top levels are published: the top best levels
+        # of each side (all of them if top is None), only when they changed
+        # and at most once every interval seconds. Without an interval every
+        # change is published.
+        if top is None and interval is None:
+            return
+        for symbol in symbols:
+            self.conflation[symbol] = {
+                'top': top,
+                'interval': interval,
+                'published': None,  # The levels last published.
+                'time': None,  # When they were published.
+                'timer': None,  # Publishes the latest change of an interval.
+            }
+
+    async def conflate(self, symbol):
+        state = self.conflation[symbol]
+        if state['timer'] is not None:
+            return
+        if state['interval'] and state['time'] is not None:
+            wait = state['time'] + state['interval'] - time.monotonic()
+            if wait > 0:
+                loop = asyncio.get_event_loop()
+                state['timer'] = loop.call_later(wait, self.flush_order_book, symbol)
+                return
+        await self.publish_order_book(symbol)
+
+    def flush_order_book(self, symbol):
+        self.conflation[symbol]['timer'] = None
+        self.supervisor.spawn(self.publish_order_book(symbol))
+
+    async def publish_order_book(self, symbol):
+        state = self.conflation[symbol]
+        order_book = self.order_book.get(symbol)
+        if not isinstance(order_book, OrderBook):
+            # Dropped while the timer was running.
+            return
+        top = order_book.top(state['top'])
+        levels = (top['bids'], top['asks'])
+        if levels == state['published']:
+            return
+        state['published'] = levels
+        state['time'] = time.monotonic()
+        await self.enqueue_result((self.ORDER_BOOK, {symbol: top}), symbol)
+
+    def channel_counters(self, name):
+        counters = self.counters_by_channel.get(name)
+        if counters is None:
+            counters = self.counters_by_channel[name] = dict.fromkeys(CHANNEL_COUNTERS, 0)
+        return counters
+
+    def stats(self):
+        # Message counters of every open connection, by connection id, and
+        # of every channel, by channel name. Bytes are the length of the
+        # frames as received (characters for text frames).
+        return {
+            'connections': {
+                self.connection_ids.get(websocket): {
+                    **counters,
+                    'channels': len(self.connections.get(websocket, [])),
+                }
+                for websocket, counters in self.counters_by_connection.items()
+            },
+            'channels': {
+                name: dict(counters)
+                for name, counters in self.counters_by_channel.items()
+            },
+        }
+
+    def metrics_text(self):
+        # stats() in the Prometheus text format, for a local scraper.
+        return prometheus(self.id, self.stats())
 
     def is_general_reply(self, reply):
         return reply[self.event] == self.subscribed or reply[self.event] in self.errors
 
+    def is_heartbeat(self, reply):
+        # Only asked for general replies.
+        return False
+
     def parse_general_reply(self, reply, websocket):
         if isinstance(reply, dict):
             if reply[self.event] == self.subscribed:
@@ -123,31 +635,74 @@ class Exchange(ccxt.Exchange):
                 return self.parse_error_ws(reply)
 
     def parse_market_reply(self, reply, websocket):
+        route = self.find_route(reply, websocket)
+        return route['parse'](reply, route['market'])
+
+    def find_route(self, reply, websocket):
         ex_channel_id = self.ex_channel_id_from_reply(reply)
-        for c in self.connections[websocket]:
-            if c['ex_channel_id'] == ex_channel_id:
-                name = c['name']
-                symbol = c['symbol']
-                market = self.markets[symbol]
-                parse = self.channels[name]['parse']
-                return parse(reply, market)
-        raise UnknownResponse(reply)
+        try:
+            return self.routes[websocket][ex_channel_id]
+        except KeyError:
+            raise UnknownResponse(reply)
 
     def register_channel(self, reply, websocket):
         self.connections[websocket] = reply
 
-    def find_not_subbed_symbol(self, subed_ids):
-        subed_symbols = [
-            channel['symbol']
-            for channel in self.get_channels()
-        ]  # Subscribed and registered symbols
-        id, symbol = [
-            (id, self.markets_by_id[id]['symbol'])
-            for id in subed_ids
-            if self.markets_by_id[id]['symbol'] not in subed_symbols
-        ].pop()  # Find the only subed id that isn't registered yet
-        return id, symbol
+    def add_channel(self, channel, websocket):
+        self.connections[websocket].append(channel)  # Register channel
+        # Bind everything needed to parse the channel's replies up front
+        # so routing a reply is a single lookup.
+        symbol = channel['symbol']
+        self.routes.setdefault(websocket, {})[channel['ex_channel_id']] = {
+            'channel': channel,
+            'parse': self.channels[channel['name']]['parse'],
+            'market': self.markets[symbol],
+            'symbol': symbol,
+            'counters': self.channel_counters(channel['name']),
+        }
+
+    def remove_channel(self, ex_channel_id, websocket):
+        # For unsubscribe replies.
+        route = self.routes.get(websocket, {}).pop(ex_channel_id, None)
+        if route is not None:
+            self.connections[websocket].remove(route['channel'])
+
+    def find_order_book_channels(self, symbol):
+        # [(websocket, channel)] of the symbol's order book subscriptions.
+        return [
+            (websocket, channel)
+            for websocket, channels in self.connections.items()
+            for channel in channels
+            if channel['name'] == self.ORDER_BOOK and channel['symbol'] == symbol
+        ]
+
+    def resync_order_book(self, symbol):
+        # Drops a book that went out of sync and resubscribes only its
+        # channel, which brings a new snapshot. The rest of the connection
+        # is left alone.
+        self.channel_counters(self.ORDER_BOOK)['checksum_errors'] += 1
+        self.drop_order_books([symbol])
+        for websocket, channel in self.find_order_book_channels(symbol):
+            self.supervisor.spawn(self.resubscribe(websocket, channel))
+
+    async def resubscribe(self, websocket, channel):
+        unsubscribe = self.build_unsubscribe_request(channel)
+        if unsubscribe is None:
+            # A single channel can't be unsubscribed: the connection is
+            # reopened, which resubscribes all of its channels.
+            await websocket.close()
+            return
+        await self.send(websocket, [unsubscribe, channel['request']])
+
+    def build_unsubscribe_request(self, channel):
+        # The request that unsubscribes a channel, None if there is none.
+        pass
 
+    def find_not_subbed_ids(self, ex_name, subed_ids, websocket):
+        # For exchanges whose subscribe replies list every market subscribed
+        # on the connection and whose ex_channel_id is (ex_name, id).
+        routes = self.routes.get(websocket, {})
+        return [id for id in subed_ids if (ex_name, id) not in routes]
 
     def parse_error_ws(self, reply, market=None):
         raise self.errors[reply['code']]
@@ -168,36 +723,35 @@ class Exchange(ccxt.Exchange):
         return 'other', reply
 
     def update_order_book(self, update, market, snapshot=False):
+        # Returns False if the update was dropped because the book is
+        # waiting for a snapshot. Parsers then don't publish the update.
         symbol = market['symbol']
         if snapshot:
-            self.order_book[symbol] = update
-            return
-        cupdate = update.copy()
-        self.order_book[symbol]['timestamp'] = cupdate.pop('timestamp')
-        self.order_book[symbol]['datetime'] = cupdate.pop('datetime')
-        self.order_book[symbol]['nonce'] = cupdate.pop('nonce')
-        prices = {
-            'bids': [bid[0] for bid in self.order_book[symbol]['bids']],
-            'asks': [ask[0] for ask in self.order_book[symbol]['asks']]
-        }
-        for key, bids_asks in cupdate.items():
-            for bid_ask in bids_asks:
-                price = bid_ask[0]
-                amount = bid_ask[1]
-                if price in prices[key]:
-                    # The index for the bid_ask in question
-                    idx = prices[key].index(price)
-                    if amount == 0:
-                        del self.order_book[symbol][key][idx]
-                        # Make sure prices's indices are synced
-                        # with self.order_book
-                        del prices[key][idx]
-                    else:
-                        self.order_book[symbol][key][idx] = bid_ask
-                else:
-                    self.order_book[symbol][key].append(bid_ask)
-        self.order_book[symbol]['bids'] = self.sort_by(self.order_book[symbol]['bids'], 0, True)
-        self.order_book[symbol]['asks'] = self.sort_by(self.order_book[symbol]['asks'], 0)
+            order_book = self.order_book[symbol] = self.new_order_book(symbol, update)
+            self.notify_order_book(symbol, order_book, snapshot=True)
+            return True
+        order_book = self.order_book.get(symbol)
+        if order_book is None:
+            return False
+        if not isinstance(order_book, OrderBook):
+            # Books assigned by hand (or fetched over REST) are plain dicts.
+            order_book = self.order_book[symbol] = self.new_order_book(symbol, order_book)
+            self.notify_order_book(symbol, order_book, snapshot=True)
+        if self.latency is None:
+            order_book.apply(update)
+        else:
+            start = time.monotonic_ns()
+            order_book.apply(update)
+            self.latency.record(self.ORDER_BOOK, self.latency.BOOK, time.monotonic_ns() - start)
+        self.notify_order_book(symbol, update)
+        return True
+
+    def notify_order_book(self, symbol, update, snapshot=False):
+        # Tells the listeners about a change of a local book: the deltas
+        # of an update, or with snapshot the whole new book (None once it
+        # was dropped).
+        for listener in self.order_book_listeners:
+            listener(self, symbol, update, snapshot)
 
     def normalize_order_book_reply(self, order_book, bids_key='bids', asks_key='asks'):
         if not self.key_exists(order_book, bids_key):
@@ -207,12 +761,9 @@ class Exchange(ccxt.Exchange):
         return order_book
 
     def claim_channel_id(self):
-        channels = self.get_channels()
-        if channels:
-            channel_ids = [c['channel_id'] for c in channels]
-            return max(channel_ids) + 1
-        else:
-            return 0
+        channel_id = self.next_channel_id
+        self.next_channel_id += 1
+        return channel_id
 
     def create_channels_by_ex_name(self):
         return {
@@ -0,0 +1,148 @@
+__all__ = [
+    'Hub',
+]
+
+
+import asyncio
+import cryptoapi
+
+from ccxt.base.errors import BadSymbol
+from cryptoapi.base.consolidated import ConsolidatedBook
+from cryptoapi.base.queues import ResultQueue
+from cryptoapi.base.supervisor import Supervisor
+
+
+class Feed:
+    # Stands in for an exchange's result_queue() of a channel and forwards
+    # every result to the hub, tagged with the exchange and the symbol.
+
+    BLOCK = ResultQueue.BLOCK
+
+    def __init__(self, results, exchange):
+        self.results = results
+        self.exchange = exchange
+        self.policy = results.policy
+
+    def full(self):
+        return self.results.full()
+
+    async def put(self, item, key=None):
+        channel, data = item
+        tag = (self.exchange, channel, key)
+        await self.results.put((*tag, data), tag)
+
+
+class Hub:
+    # Runs the subscriptions of many exchanges as one and merges their
+    # results into one stream of (exchange, channel, symbol, data) tuples.
+    # The spec lists the subscriptions:
+    #   [{'exchange': 'kraken', 'channel': 'order_book',
+    #     'symbols': ['BTC/USD'], 'params': {'depth': 25}}, ...]
+    # params are passed to the exchange's subscribe_<channel>() method. The
+    # bbo channel isn't subscribed to, it publishes the best bid and ask of
+    # the books subscribed to by another entry.
+    #
+    #   async with Hub(spec) as hub:
+    #       async for exchange, channel, symbol, data in hub:
+    #           ...
+    #
+    # The stream ends when every subscription ends and raises the error of
+    # the first one that fails, after the others are closed.
+
+    def __init__(self, spec, config={}, exchanges=None, maxsize=1000, policy=ResultQueue.BLOCK):
+        self.spec = spec
+        # Constructor config per exchange name.
+        self.config = config
+        # Instances by exchange name, created from the names in the spec
+        # unless given.
+        self.exchanges = dict(exchanges or {})
+        # Every result of every exchange. The CONFLATE policy keeps the
+        # latest per (exchange, channel, symbol).
+        self.results = ResultQueue(maxsize, policy)
+        self.supervisor = Supervisor()
+        self.watcher = None
+
+    def exchange(self, name):
+        exchange = self.exchanges.get(name)
+        if exchange is None:
+            exchange = self.exchanges[name] = getattr(cryptoapi, name.capitalize())(self.config.get(name, {}))
+        return exchange
+
+    async def start(self):
+        # Loads the markets of every exchange concurrently, then starts all
+        # subscriptions. Returns once they are started.
+        for entry in self.spec:
+            self.exchange(entry['exchange'])
+        await asyncio.gather(*[e.load_markets() for e in self.exchanges.values()])
+        for entry in self.spec:
+            exchange = self.exchanges[entry['exchange']]
+            missing = [s for s in entry['symbols'] if s not in exchange.markets]
+            if missing:
+                raise BadSymbol(f"{entry['exchange']} has no market {', '.join(missing)}.")
+        tasks = []
+        for entry in self.spec:
+            name = entry['exchange']
+            exchange = self.exchanges[name]
+            channel = entry['channel']
+            # Results only go to the hub.
+            exchange.result = None
+            exchange.result_queues[(channel, None)] = Feed(self.results, name)
+            if channel == exchange.BBO:
+                exchange.publish_bbo = True
+                continue
+            subscribe = getattr(exchange, 'subscribe_' + channel)
+            tasks.append(self.supervisor.spawn(subscribe(entry['symbols'], **entry.get('params', {}))))
+        self.watcher = asyncio.ensure_future(self.supervisor.wait(tasks))
+
+    def consolidated_book(self, symbol):
+        # A ConsolidatedBook of the symbol's books on every exchange whose
+        # order book the spec subscribes to.
+        names = [
+            e['exchange'] for e in self.spec
+            if e['channel'] == 'order_book' and symbol in e['symbols']
+        ]
+        return ConsolidatedBook(symbol, {name: self.exchange(name) for name in names})
+
+    async def get(self):
+        # The next (exchange, channel, symbol, data). Raises
+        # StopAsyncIteration once every subscription ended and the results
+        # are read.
+        if not self.results.empty():
+            return self.results.get_nowait()
+        if self.watcher.done():
+            self.watcher.result()
+            raise StopAsyncIteration
+        get = asyncio.ensure_future(self.results.get())
+        try:
+            await asyncio.wait([get, self.watcher], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not get.done():
+                get.cancel()
+        if get.done() and not get.cancelled():
+            return get.result()
+        return await self.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    async def close(self):
+        # Closes every connection, then the exchanges.
+        await self.supervisor.cancel()
+        if self.watcher is not None:
+            self.watcher.cancel()
+            await asyncio.gather(self.watcher, return_exceptions=True)
+        await asyncio.gather(*[e.close() for e in self.exchanges.values()], return_exceptions=True)
+
+    async def __aenter__(self):
+        try:
+            await self.start()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
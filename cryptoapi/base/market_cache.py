@@ -0,0 +1,58 @@
+__all__ = [
+    'MarketCache',
+]
+
+
+import gzip
+import json
+import os
+import time
+
+
+class MarketCache:
+    # Keeps the markets an exchange loaded over REST on disk, so a new
+    # process can start from them instead of waiting for load_markets().
+    # Every exchange has one gzip compressed JSON file:
+    #   {"version": 1, "time": seconds since the epoch when loaded,
+    #    "markets": [market], "currencies": {code: currency}}
+    # The ids, Kraken's wsnames and the other indexes are rebuilt from the
+    # markets by set_markets().
+
+    VERSION = 1
+
+    def __init__(self, path, ttl=24 * 3600):
+        self.path = path
+        # Seconds after which cached markets are reloaded in the background.
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, exchange_id):
+        return os.path.join(self.path, f'{exchange_id}-markets.json.gz')
+
+    def read(self, exchange_id):
+        # The cached entry, None if there is none or it can't be used.
+        try:
+            with gzip.open(self.file(exchange_id), 'rb') as file:
+                entry = json.loads(file.read())
+        except (OSError, EOFError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('version') != self.VERSION:
+            return None
+        return entry
+
+    def write(self, exchange_id, markets, currencies):
+        entry = {
+            'version': self.VERSION,
+            'time': time.time(),
+            'markets': markets,
+            'currencies': currencies,
+        }
+        path = self.file(exchange_id)
+        # Written aside and renamed, so readers never see half a file.
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with gzip.open(temporary, 'wb') as file:
+            file.write(json.dumps(entry, separators=(',', ':')).encode())
+        os.replace(temporary, path)
+
+    def expired(self, entry):
+        return time.time() - entry['time'] > self.ttl
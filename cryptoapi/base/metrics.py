@@ -0,0 +1,148 @@
+__all__ = [
+    'CHANNEL_COUNTERS',
+    'CONNECTION_COUNTERS',
+    'Histogram',
+    'LatencyTracker',
+    'prometheus',
+]
+
+
+# Counters kept per connection and per channel, see Exchange.stats().
+CONNECTION_COUNTERS = [
+    'messages',
+    'bytes',
+    'heartbeats',
+    'parse_errors',
+    'unknown_responses',
+]
+CHANNEL_COUNTERS = [
+    'messages',
+    'bytes',
+    'parse_errors',
+    'queue_full_waits',
+    'checksum_errors',
+    'sequence_gaps',
+]
+
+
+class Histogram:
+    # Counts values (latencies in ns) in log-linear buckets: every power of
+    # two is split in four, so a bucket is at most 25% wide. Recording is
+    # an index computation and an increment, and memory stays fixed.
+
+    BUCKETS = 4 * 64
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket(value):
+        if value < 8:
+            return value
+        # Keep the three highest bits: 4 to 7 times 2 ** shift.
+        shift = value.bit_length() - 3
+        return shift * 4 + (value >> shift)
+
+    @staticmethod
+    def lower_bound(bucket):
+        if bucket < 8:
+            return bucket
+        return (bucket % 4 + 4) << (bucket // 4 - 1)
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        # The lower bound of the bucket holding the p-th percentile
+        # (0 <= p <= 1), clamped to the recorded range.
+        if not self.count:
+            return None
+        rank = max(1, round(p * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self.lower_bound(bucket), self.min), self.max)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+        }
+
+
+class LatencyTracker:
+    # Latency histograms per channel and stage of Exchange.handle_frame().
+    # All latencies are in ns.
+
+    DECODE = 'decode'  # Frame received until decoded.
+    ROUTE = 'route'  # Decoded until its route was found.
+    PARSE = 'parse'  # Routed until parsed, book included.
+    BOOK = 'book'  # Applying the update to the local order book.
+    ENQUEUE = 'enqueue'  # Parsed until the result was in a queue.
+    TOTAL = 'total'  # Frame received until the result was in a queue.
+    EXCHANGE = 'exchange'  # Exchange timestamp until the frame was received.
+
+    STAGES = [DECODE, ROUTE, PARSE, BOOK, ENQUEUE, TOTAL, EXCHANGE]
+
+    def __init__(self):
+        # {channel: {stage: Histogram}}
+        self.histograms = {}
+
+    def histogram(self, channel, stage):
+        stages = self.histograms.get(channel)
+        if stages is None:
+            stages = self.histograms[channel] = {}
+        histogram = stages.get(stage)
+        if histogram is None:
+            histogram = stages[stage] = Histogram()
+        return histogram
+
+    def record(self, channel, stage, value):
+        self.histogram(channel, stage).record(value)
+
+    def snapshot(self):
+        # {channel: {stage: {'count', 'mean', 'min', 'max', 'p50', ...}}}
+        return {
+            channel: {stage: h.snapshot() for stage, h in stages.items()}
+            for channel, stages in self.histograms.items()
+        }
+
+    def reset(self):
+        self.histograms = {}
+
+
+def prometheus(exchange, stats):
+    # Exchange.stats() in the Prometheus text exposition format.
+    lines = []
+    scopes = [
+        ('connection', stats['connections'], CONNECTION_COUNTERS),
+        ('channel', stats['channels'], CHANNEL_COUNTERS),
+    ]
+    for scope, counters, names in scopes:
+        for name in names:
+            metric = f'cryptoapi_{scope}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for key, values in counters.items():
+                lines.append(f'{metric}{{exchange="{exchange}",{scope}="{key}"}} {values[name]}')
+    lines.append('# TYPE cryptoapi_connection_channels gauge')
+    for key, values in stats['connections'].items():
+        lines.append(f'cryptoapi_connection_channels{{exchange="{exchange}",connection="{key}"}} {values["channels"]}')
+    return '\n'.join(lines) + '\n'
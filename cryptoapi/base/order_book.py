@@ -0,0 +1,254 @@
+__all__ = [
+    'OrderBook',
+    'OrderBookSide',
+    'Asks',
+    'Bids',
+    'L3OrderBook',
+    'stack_order_books',
+]
+
+
+import bisect
+
+
+class OrderBookSide(list):
+    # The side itself is the familiar list of [price, amount] levels, best
+    # price first. Next to it we keep a price-keyed map of the levels and a
+    # sorted list of sort keys that is index-aligned with the side, so a level
+    # is found with a dict lookup and placed with a bisect instead of a scan.
+    descending = False
+
+    def __init__(self, deltas=[], depth=None):
+        super().__init__()
+        self._index = []
+        self._levels = {}
+        # Maximum number of levels. Levels beyond it are pruned, None keeps
+        # every level.
+        self.depth = depth
+        self.store_all(deltas)
+
+    def store(self, delta):
+        price = delta[0]
+        key = -price if self.descending else price
+        if price in self._levels:
+            idx = bisect.bisect_left(self._index, key)
+            if delta[1] == 0:
+                del self._index[idx]
+                del self[idx]
+                del self._levels[price]
+            else:
+                self[idx] = delta
+                self._levels[price] = delta
+        elif delta[1] != 0:
+            idx = bisect.bisect_left(self._index, key)
+            depth = self.depth
+            if depth is not None and idx >= depth:
+                return
+            self._index.insert(idx, key)
+            self.insert(idx, delta)
+            self._levels[price] = delta
+            if depth is not None and len(self) > depth:
+                # The worst level fell out of the window.
+                self._index.pop()
+                del self._levels[self.pop()[0]]
+
+    def store_all(self, deltas):
+        for delta in deltas:
+            self.store(delta)
+
+    def amount(self, price):
+        level = self._levels.get(price)
+        return level[1] if level else 0
+
+
+class Asks(OrderBookSide):
+    descending = False
+
+
+class Bids(OrderBookSide):
+    descending = True
+
+
+class OrderBook(dict):
+
+    def __init__(self, snapshot={}, depth=None, limit=None):
+        super().__init__(snapshot)
+        # depth is the window of levels the exchange sends, the sides prune
+        # levels that fall out of it. limit caps the levels read by top()
+        # and to_numpy() but prunes nothing: a level below the limit can
+        # become a best level later, and the exchange won't send it again.
+        self['bids'] = Bids(snapshot.get('bids', []), depth)
+        self['asks'] = Asks(snapshot.get('asks', []), depth)
+        self.limit = limit
+        for key in ['timestamp', 'datetime', 'nonce']:
+            self.setdefault(key, None)
+        self._bbo = None  # Cached by bbo() until the next update.
+        # Arrays returned by to_numpy() until the next update, and the
+        # buffers behind them.
+        self._arrays = None
+        self._buffers = {}
+
+    def top(self, n=None):
+        # A copy of the book with only the n best levels of each side (every
+        # level if n is None). Levels are replaced, never changed in place,
+        # so the copy can't change underneath its reader.
+        n = self._read_limit(n)
+        return {
+            'bids': self['bids'][:n],
+            'asks': self['asks'][:n],
+            'timestamp': self['timestamp'],
+            'datetime': self['datetime'],
+            'nonce': self['nonce'],
+        }
+
+    def bbo(self):
+        # Best bid and ask with their amounts, the spread and the mid price.
+        # None where a side is empty. The sides are sorted, so this only
+        # looks at their first levels.
+        if self._bbo is None:
+            bids = self['bids']
+            asks = self['asks']
+            bid, bid_volume = bids[0][:2] if bids else (None, None)
+            ask, ask_volume = asks[0][:2] if asks else (None, None)
+            both = bids and asks
+            self._bbo = {
+                'bid': bid,
+                'bidVolume': bid_volume,
+                'ask': ask,
+                'askVolume': ask_volume,
+                'spread': ask - bid if both else None,
+                'mid': (ask + bid) / 2 if both else None,
+                'timestamp': self['timestamp'],
+                'datetime': self['datetime'],
+            }
+        return self._bbo
+
+    def to_numpy(self, n=None):
+        # The n best levels of each side (all of them if n is None) as
+        # contiguous float64 arrays of shape (levels, 2), one row per
+        # [price, amount]. The arrays are views of buffers the book reuses,
+        # so they are only valid until the next update or the next call with
+        # another n: copy them to keep them. Needs numpy.
+        n = self._read_limit(n)
+        if self._arrays is None or self._arrays[0] != n:
+            self._arrays = (n, self._side_array('bids', n), self._side_array('asks', n))
+        return self._arrays[1], self._arrays[2]
+
+    def _read_limit(self, n):
+        if self.limit is None:
+            return n
+        return self.limit if n is None else min(n, self.limit)
+
+    def _side_array(self, key, n):
+        import numpy
+        side = self[key]
+        levels = side[:n]
+        count = len(levels)
+        buffer = self._buffers.get(key)
+        if buffer is None or len(buffer) < count:
+            size = max(count, 2 * len(buffer) if buffer is not None else 64)
+            buffer = self._buffers[key] = numpy.empty((size, 2))
+        array = buffer[:count]
+        if count:
+            # The sort keys are the prices, negated for bids.
+            array[:, 0] = side._index[:count]
+            if side.descending:
+                numpy.negative(array[:, 0], out=array[:, 0])
+            array[:, 1] = [level[1] for level in levels]
+        return array
+
+    def apply(self, update):
+        self._bbo = None
+        self._arrays = None
+        self['timestamp'] = update['timestamp']
+        self['datetime'] = update['datetime']
+        self['nonce'] = update['nonce']
+        self['bids'].store_all(update['bids'])
+        self['asks'].store_all(update['asks'])
+
+
+class L3OrderBook(OrderBook):
+    # A book of individual orders (level 3 data). Next to the aggregated
+    # sides it keeps a map of the open orders by id and the total amount
+    # and number of orders of every price, so open, match, change and done
+    # are dict operations. The sorted side is only searched when the amount
+    # of a level changes. The snapshot lists [price, amount, order id]
+    # per order.
+
+    def __init__(self, snapshot={}, depth=None):
+        super().__init__({key: value for key, value in snapshot.items() if key not in ['bids', 'asks']})
+        # {order id: [side, price, amount]}
+        self.orders = {}
+        # {side: {price: [amount, orders]}}
+        self.levels = {'bids': {}, 'asks': {}}
+        for side in ['bids', 'asks']:
+            for price, amount, order_id in snapshot.get(side, []):
+                self.open(order_id, side, price, amount)
+
+    def _change_level(self, side, price, amount, orders=0):
+        # Adds amount and orders to a level. Returns its new [price, amount],
+        # 0 once its last order is gone.
+        self._bbo = None
+        self._arrays = None
+        levels = self.levels[side]
+        level = levels.get(price)
+        if level is None:
+            level = levels[price] = [0, 0]
+        level[0] += amount
+        level[1] += orders
+        if level[1] <= 0:
+            del levels[price]
+            delta = [price, 0]
+        else:
+            delta = [price, level[0]]
+        self[side].store(delta)
+        return delta
+
+    def open(self, order_id, side, price, amount):
+        self.orders[order_id] = [side, price, amount]
+        return side, self._change_level(side, price, amount, 1)
+
+    def match(self, order_id, amount):
+        # The resting order is done once the exchange says so, even when
+        # nothing is left.
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        order[2] -= amount
+        return order[0], self._change_level(order[0], order[1], -amount)
+
+    def change(self, order_id, amount):
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        difference = amount - order[2]
+        order[2] = amount
+        return order[0], self._change_level(order[0], order[1], difference)
+
+    def done(self, order_id):
+        # None for orders that were never on the book.
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        return order[0], self._change_level(order[0], order[1], -order[2], -1)
+
+
+def stack_order_books(books, n, out=None):
+    # The n best levels of many books in one float64 array of shape
+    # (books, 2, n, 2): [book][0 for bids, 1 for asks][level][price, amount].
+    # Missing books and levels are NaN. Pass the array of a previous call
+    # as out to fill it in place. Needs numpy.
+    import numpy
+    shape = (len(books), 2, n, 2)
+    if out is None or out.shape != shape:
+        out = numpy.empty(shape)
+    out.fill(numpy.nan)
+    for i, book in enumerate(books):
+        if book is None:
+            continue
+        if not isinstance(book, OrderBook):
+            book = OrderBook(book)
+        bids, asks = book.to_numpy(n)
+        out[i, 0, :len(bids)] = bids
+        out[i, 1, :len(asks)] = asks
+    return out
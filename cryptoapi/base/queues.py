@@ -0,0 +1,63 @@
+__all__ = [
+    'ResultQueue'
+]
+
+
+import asyncio
+
+
+class ResultQueue(asyncio.Queue):
+
+    # What put() does when the queue is full.
+    BLOCK = 'block'  # Wait for a free slot, like asyncio.Queue.
+    DROP_OLDEST = 'drop_oldest'  # Discard the oldest item to make room.
+    DROP_NEWEST = 'drop_newest'  # Discard the item being put.
+    CONFLATE = 'conflate'  # Keep only the latest item per key.
+
+    POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST, CONFLATE]
+
+    def __init__(self, maxsize=1, policy=BLOCK):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown queue policy: {policy}.')
+        # asyncio.Queue calls _init(), which needs the policy.
+        self.policy = policy
+        super().__init__(maxsize=maxsize)
+        self.dropped = 0  # Number of items discarded by the policy.
+
+    async def put(self, item, key=None):
+        if self.policy == self.BLOCK:
+            await super().put(item)
+            return
+        if self.policy == self.CONFLATE:
+            if key in self._latest:
+                # Replace the pending item in place, it keeps its position.
+                self._latest[key] = item
+                self.dropped += 1
+                return
+            item = (key, item)
+        if self.full():
+            self.dropped += 1
+            if self.policy == self.DROP_NEWEST:
+                return
+            self.get_nowait()
+            # The evicted item will never be processed, so it mustn't keep
+            # join() waiting.
+            self.task_done()
+        self.put_nowait(item)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._latest = {}
+
+    def _put(self, item):
+        if self.policy == self.CONFLATE:
+            key, item = item
+            self._latest[key] = item
+            item = key
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        if self.policy == self.CONFLATE:
+            item = self._latest.pop(item)
+        return item
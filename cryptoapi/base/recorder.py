@@ -0,0 +1,91 @@
+__all__ = [
+    'Recorder',
+    'read_frames',
+]
+
+
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+
+class Recorder:
+    # Writes received websocket frames to gzip compressed, append-only
+    # segment files. Every line of a segment is a JSON record:
+    #   {"t": monotonic receive time in ns, "c": connection id,
+    #    "e": exchange name, "f": frame}
+    # Order book snapshots fetched over REST are recorded as well, so a
+    # replay can rebuild the books. Their records have the symbol in "s"
+    # and the unified order book in "f".
+    # write() only puts the frame in a queue. A background thread does the
+    # encoding, compression and disk IO so the event loop isn't held up.
+
+    def __init__(self, path, exchange, segment_size=64 * 2 ** 20):
+        self.path = path
+        self.exchange = exchange
+        # Uncompressed bytes written to a segment before starting a new one.
+        self.segment_size = segment_size
+        self.segment = 0
+        self.frames = queue.SimpleQueue()
+        os.makedirs(path, exist_ok=True)
+        self.started = time.strftime('%Y%m%dT%H%M%S')
+        self.thread = threading.Thread(target=self.run, name=f'recorder-{exchange}', daemon=True)
+        self.thread.start()
+
+    def write(self, connection_id, frame, symbol=None):
+        self.frames.put((time.monotonic_ns(), connection_id, frame, symbol))
+
+    def close(self):
+        # Blocks until every queued frame is on disk.
+        self.frames.put(None)
+        self.thread.join()
+
+    def segment_path(self):
+        return os.path.join(self.path, f'{self.exchange}-{self.started}-{self.segment:06d}.jsonl.gz')
+
+    def run(self):
+        file = gzip.open(self.segment_path(), 'ab')
+        size = 0
+        while True:
+            record = self.frames.get()
+            # Write everything that is queued before flushing.
+            lines = []
+            while record is not None:
+                t, connection_id, frame, symbol = record
+                if isinstance(frame, bytes):
+                    frame = frame.decode()
+                entry = {'t': t, 'c': connection_id, 'e': self.exchange, 'f': frame}
+                if symbol is not None:
+                    entry['s'] = symbol
+                line = json.dumps(entry)
+                lines.append(line.encode() + b'\n')
+                try:
+                    record = self.frames.get_nowait()
+                except queue.Empty:
+                    break
+            for line in lines:
+                if size >= self.segment_size:
+                    file.close()
+                    self.segment += 1
+                    file = gzip.open(self.segment_path(), 'ab')
+                    size = 0
+                file.write(line)
+                size += len(line)
+            file.flush()
+            if record is None:
+                file.close()
+                return
+
+
+def read_frames(path):
+    # Yields the records of a segment file, or of every segment in a
+    # directory, in the order they were written.
+    paths = sorted(glob.glob(os.path.join(path, '*.jsonl.gz'))) if os.path.isdir(path) else [path]
+    for p in paths:
+        with gzip.open(p, 'rb') as file:
+            for line in file:
+                yield json.loads(line)
@@ -0,0 +1,108 @@
+__all__ = [
+    'Replayer',
+]
+
+
+import asyncio
+import time
+
+from cryptoapi.base.recorder import read_frames
+
+
+class ReplaySocket:
+    # Stands in for the websocket a recorded connection used. Nothing is
+    # ever sent to an exchange during a replay.
+
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+class Replayer:
+    # Feeds the frames recorded for an exchange (see Recorder) through its
+    # real pipeline: handle_frame() -> is_general_reply() -> parse_*_ws()
+    # -> update_order_book() -> put_result(). Nothing touches the network.
+    #
+    # speed is None to replay as fast as possible, otherwise the original
+    # timing is kept, sped up by this factor (1 is real time).
+    #
+    # Results are put in the exchange's queues as usual. Read them, or set
+    # exchange.result to None and use non-blocking result_queue() policies,
+    # otherwise the replay blocks on the first full queue.
+
+    def __init__(self, exchange, path, speed=None):
+        self.exchange = exchange
+        self.path = path
+        self.speed = speed
+        # Replay socket of every recorded connection id.
+        self.sockets = {}
+        self.frames = 0
+        self.snapshots = 0
+        self.elapsed = 0
+
+    def socket(self, connection_id):
+        socket = self.sockets.get(connection_id)
+        if socket is None:
+            socket = self.sockets[connection_id] = ReplaySocket(connection_id)
+            self.exchange.connections[socket] = []
+            self.exchange.connection_ids[socket] = connection_id
+            self.exchange.routes[socket] = {}
+        return socket
+
+    async def run(self, until=None):
+        # Replays every record, or the ones received up to until (a
+        # monotonic time in ns, like the record's "t") to rebuild the
+        # exchange's state at that moment. Returns the number of frames.
+        exchange = self.exchange
+        handle_frame = exchange.handle_frame
+        first = None
+        started = time.monotonic_ns()
+        for record in read_frames(self.path):
+            if record['e'] != exchange.id:
+                continue
+            t = record['t']
+            if until is not None and t > until:
+                break
+            if first is None:
+                first = t
+            if self.speed is not None:
+                wait = (t - first) / self.speed - (time.monotonic_ns() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait / 1e9)
+            socket = self.socket(record['c'])
+            if 's' in record:
+                await exchange.sync_order_book(record['s'], record['f'])
+                self.snapshots += 1
+                continue
+            await handle_frame(record['f'], socket)
+            self.frames += 1
+            if socket in exchange.pending_snapshots:
+                # Live, the snapshots would be fetched now. Their records
+                # follow, the exchange only gets ready for them (Bitvavo
+                # buffers the deltas received meanwhile).
+                exchange.expect_snapshots(socket)
+                del exchange.pending_snapshots[socket]
+        self.elapsed = (time.monotonic_ns() - started) / 1e9
+        return self.frames
+
+    def throughput(self):
+        # Frames per second of the last run.
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    def close(self):
+        # Forgets the replay sockets. The books and results stay.
+        for socket in self.sockets.values():
+            self.exchange.connections.pop(socket, None)
+            self.exchange.connection_ids.pop(socket, None)
+            self.exchange.routes.pop(socket, None)
+            self.exchange.last_received.pop(socket, None)
+            self.exchange.sequences.pop(socket, None)
+            self.exchange.counters_by_connection.pop(socket, None)
+            self.exchange.pending_snapshots.pop(socket, None)
+        self.sockets = {}
@@ -0,0 +1,43 @@
+__all__ = [
+    'Supervisor'
+]
+
+
+import asyncio
+
+
+class Supervisor:
+    # Keeps track of the tasks running the connections of an exchange.
+    # If one of them fails the others are cancelled and the error is raised
+    # by wait(), like a task group.
+
+    def __init__(self):
+        self.tasks = set()
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def wait(self, tasks=None):
+        # Wait for the given tasks (all supervised tasks by default).
+        pending = set(self.tasks if tasks is None else tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        await self.cancel(pending)
+                        raise task.exception()
+        except asyncio.CancelledError:
+            await self.cancel(pending)
+            raise
+
+    async def cancel(self, tasks=None):
+        # Cancel the given tasks (all supervised tasks by default) and wait
+        # until they are done.
+        tasks = set(self.tasks if tasks is None else tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,355 @@
+__all__ = [
+    'SharedBooks',
+    'WorkerPool',
+]
+
+
+import asyncio
+import cryptoapi
+import itertools
+import math
+import multiprocessing
+import struct
+
+from ccxt.base.errors import BadSymbol
+from ccxt.base.errors import ExchangeError
+from ccxt.base.errors import NotSupported
+from cryptoapi.base.hub import Hub
+from cryptoapi.base.queues import ResultQueue
+from multiprocessing import shared_memory
+
+
+class SharedBooks:
+    # The best levels of a set of order books in one block of shared memory,
+    # written by the worker that keeps the books and read by the parent
+    # without going through a pipe. Every symbol has a fixed size slot:
+    #   header: sequence (uint64), bid count (uint64), ask count (uint64),
+    #           timestamp (float64, nan if None), nonce (int64, -1 if None)
+    #   bids:   depth * [price, amount] float64
+    #   asks:   depth * [price, amount] float64
+    # Slots are guarded by a sequence lock: the writer makes the sequence
+    # odd, writes the slot and makes it even again, and a reader retries
+    # until it saw the same even sequence before and after reading. Readers
+    # never block the writer.
+
+    HEADER = struct.Struct('QQQdq')
+    SEQUENCE = struct.Struct('Q')
+
+    def __init__(self, symbols, depth=25, name=None):
+        self.symbols = list(symbols)
+        self.depth = depth
+        self.slots = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.slot_size = self.HEADER.size + depth * 4 * 8
+        size = max(1, len(self.symbols)) * self.slot_size
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Workers share their parent's resource tracker, the block is
+            # unlinked once, by the parent.
+            self.memory = shared_memory.SharedMemory(name)
+        self.buffer = self.memory.buf
+        self.levels = {}  # struct.Struct of n float64 by n.
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def offset(self, symbol):
+        return self.slots[symbol] * self.slot_size
+
+    def pack_levels(self, side, offset):
+        # Writes the best levels of a side, returns how many were written.
+        levels = side[:self.depth]
+        count = len(levels)
+        if count:
+            values = list(itertools.chain.from_iterable(level[:2] for level in levels))
+            packer = self.levels.get(len(values))
+            if packer is None:
+                packer = self.levels[len(values)] = struct.Struct(f'{len(values)}d')
+            packer.pack_into(self.buffer, offset, *values)
+        return count
+
+    def write(self, symbol, order_book):
+        # Copies the best levels of a local book into the symbol's slot.
+        offset = self.offset(symbol)
+        sequence = self.SEQUENCE.unpack_from(self.buffer, offset)[0]
+        self.SEQUENCE.pack_into(self.buffer, offset, sequence + 1)
+        bids = offset + self.HEADER.size
+        asks = bids + self.depth * 2 * 8
+        bid_count = self.pack_levels(order_book['bids'], bids)
+        ask_count = self.pack_levels(order_book['asks'], asks)
+        timestamp = order_book.get('timestamp')
+        nonce = order_book.get('nonce')
+        self.HEADER.pack_into(
+            self.buffer, offset, sequence + 1, bid_count, ask_count,
+            math.nan if timestamp is None else timestamp,
+            -1 if nonce is None else nonce
+        )
+        # Published last, the slot is consistent again.
+        self.SEQUENCE.pack_into(self.buffer, offset, sequence + 2)
+
+    def version(self, symbol):
+        # Changes with every write, odd while one is in progress. 0 until
+        # the first write.
+        return self.SEQUENCE.unpack_from(self.buffer, self.offset(symbol))[0]
+
+    def read(self, symbol):
+        # A consistent copy of the slot, shaped like OrderBook.top(). None
+        # until the worker wrote the book.
+        offset = self.offset(symbol)
+        while True:
+            sequence, bid_count, ask_count, timestamp, nonce = self.HEADER.unpack_from(self.buffer, offset)
+            if sequence == 0:
+                return None
+            if sequence & 1:
+                continue
+            bids = offset + self.HEADER.size
+            asks = bids + self.depth * 2 * 8
+            bid_values = struct.unpack_from(f'{2 * bid_count}d', self.buffer, bids)
+            ask_values = struct.unpack_from(f'{2 * ask_count}d', self.buffer, asks)
+            if self.version(symbol) == sequence:
+                break
+        return {
+            'bids': [list(bid_values[i:i + 2]) for i in range(0, len(bid_values), 2)],
+            'asks': [list(ask_values[i:i + 2]) for i in range(0, len(ask_values), 2)],
+            'timestamp': None if math.isnan(timestamp) else int(timestamp),
+            'nonce': None if nonce == -1 else nonce,
+        }
+
+    def to_numpy(self, symbol):
+        # The slot's bids and asks as float64 arrays of shape (levels, 2)
+        # that are views of the shared memory, nothing is copied. The worker
+        # may write while they are read: take version() before and check it
+        # is unchanged (and even) after using them. Needs numpy.
+        import numpy
+        offset = self.offset(symbol)
+        _, bid_count, ask_count, _, _ = self.HEADER.unpack_from(self.buffer, offset)
+        bids = offset + self.HEADER.size
+        asks = bids + self.depth * 2 * 8
+        return (
+            numpy.ndarray((min(bid_count, self.depth), 2), numpy.float64, self.buffer, bids),
+            numpy.ndarray((min(ask_count, self.depth), 2), numpy.float64, self.buffer, asks),
+        )
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class BookWriter:
+    # Stands in for the worker exchange's order book result queue and
+    # writes the local book of every update into the shared slots.
+
+    BLOCK = ResultQueue.BLOCK
+    policy = ResultQueue.CONFLATE
+
+    def __init__(self, books, exchange):
+        self.books = books
+        self.exchange = exchange
+
+    def full(self):
+        return False
+
+    async def put(self, item, key=None):
+        order_book = self.exchange.order_book.get(key)
+        if order_book is not None:
+            self.books.write(key, order_book)
+
+
+class Sender:
+    # Stands in for the worker exchange's other result queues and sends
+    # their results to the parent. Results are batched per event loop
+    # iteration, one pipe write carries all results of the frames read
+    # meanwhile. A full pipe blocks the worker until the parent catches up.
+
+    BLOCK = ResultQueue.BLOCK
+    policy = ResultQueue.BLOCK
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.batch = []
+
+    def full(self):
+        return False
+
+    async def put(self, item, key=None):
+        if not self.batch:
+            asyncio.get_event_loop().call_soon(self.flush)
+        channel, data = item
+        self.batch.append((channel, key, data))
+
+    def flush(self):
+        if self.batch:
+            batch, self.batch = self.batch, []
+            self.conn.send(('results', batch))
+
+
+def create_exchange(name, config):
+    return getattr(cryptoapi, name.capitalize())(config)
+
+
+def run_worker(name, config, entries, books_name, book_symbols, depth, conn, factory):
+    # Entry point of a worker process.
+    asyncio.run(work(name, config, entries, books_name, book_symbols, depth, conn, factory))
+
+
+async def work(name, config, entries, books_name, book_symbols, depth, conn, factory):
+    exchange = factory(name, config)
+    books = SharedBooks(book_symbols, depth, books_name)
+    sender = Sender(conn)
+    try:
+        await exchange.load_markets()
+        for entry in entries:
+            missing = [s for s in entry['symbols'] if s not in exchange.markets]
+            if missing:
+                raise BadSymbol(f"{name} has no market {', '.join(missing)}.")
+        exchange.result = None
+        tasks = []
+        for entry in entries:
+            channel = entry['channel']
+            if channel == exchange.ORDER_BOOK:
+                exchange.result_queues[(channel, None)] = BookWriter(books, exchange)
+            else:
+                exchange.result_queues[(channel, None)] = sender
+            if channel == exchange.BBO:
+                exchange.publish_bbo = True
+                continue
+            subscribe = getattr(exchange, 'subscribe_' + channel)
+            tasks.append(exchange.supervisor.spawn(subscribe(entry['symbols'], **entry.get('params', {}))))
+        await exchange.supervisor.wait(tasks)
+        sender.flush()
+        conn.send(('done', None))
+    except Exception as e:
+        sender.flush()
+        try:
+            conn.send(('error', e))
+        except Exception:
+            # Not picklable.
+            conn.send(('error', ExchangeError(repr(e))))
+    finally:
+        await exchange.close()
+        books.close()
+        conn.close()
+
+
+class WorkerPool(Hub):
+    # Runs the subscriptions of the spec (see Hub) in worker processes, so
+    # parsing and book keeping scale across cores. Every exchange gets a
+    # worker, or one per shard_size symbols if given. Workers keep the local
+    # books and write their depth best levels into shared memory, read them
+    # with book() or books(). Order book results aren't sent to the parent,
+    # every other result is, and makes up the stream of (exchange, channel,
+    # symbol, data) tuples like Hub's.
+    #
+    #   async with WorkerPool(spec, shard_size=10) as pool:
+    #       async for exchange, channel, symbol, data in pool:
+    #           book = pool.book('kraken', 'BTC/USD')
+    #
+    # Workers create their exchange with factory(name, config), it must be
+    # picklable on platforms that don't fork.
+
+    def __init__(self, spec, config={}, depth=25, shard_size=None, maxsize=1000, policy=ResultQueue.BLOCK,
+                 factory=create_exchange):
+        super().__init__(spec, config, maxsize=maxsize, policy=policy)
+        # Levels per side kept in shared memory.
+        self.depth = depth
+        self.shard_size = shard_size
+        self.factory = factory
+        # {'exchange', 'entries', 'books', 'process', 'conn'} per worker.
+        self.workers = []
+        # SharedBooks by (exchange, symbol).
+        self.shared_books = {}
+
+    def shards(self):
+        # (exchange, entries) per worker. Each shard's entries only list its
+        # symbols.
+        symbols_by_exchange = {}
+        for entry in self.spec:
+            symbols = symbols_by_exchange.setdefault(entry['exchange'], [])
+            symbols.extend(s for s in entry['symbols'] if s not in symbols)
+        shards = []
+        for name, symbols in symbols_by_exchange.items():
+            size = self.shard_size or len(symbols)
+            for i in range(0, len(symbols), size):
+                shard = symbols[i:i + size]
+                entries = [
+                    {**entry, 'symbols': [s for s in entry['symbols'] if s in shard]}
+                    for entry in self.spec if entry['exchange'] == name
+                ]
+                shards.append((name, [e for e in entries if e['symbols']]))
+        return shards
+
+    async def start(self):
+        tasks = []
+        for name, entries in self.shards():
+            book_symbols = sorted({s for e in entries if e['channel'] == 'order_book' for s in e['symbols']})
+            books = SharedBooks(book_symbols, self.depth)
+            conn, child_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=run_worker, daemon=True,
+                args=(name, self.config.get(name, {}), entries, books.name, book_symbols, self.depth,
+                      child_conn, self.factory)
+            )
+            worker = {'exchange': name, 'entries': entries, 'books': books, 'process': process, 'conn': conn}
+            self.workers.append(worker)
+            for symbol in book_symbols:
+                self.shared_books[(name, symbol)] = books
+            process.start()
+            child_conn.close()
+            tasks.append(self.supervisor.spawn(self.receive(worker)))
+        self.watcher = asyncio.ensure_future(self.supervisor.wait(tasks))
+
+    async def receive(self, worker):
+        # Moves a worker's results into the stream until it is done.
+        loop = asyncio.get_event_loop()
+        conn = worker['conn']
+        readable = asyncio.Event()
+        loop.add_reader(conn.fileno(), readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                while conn.poll():
+                    try:
+                        kind, payload = conn.recv()
+                    except EOFError:
+                        worker['process'].join(1)
+                        raise ExchangeError(
+                            f"The {worker['exchange']} worker exited with code {worker['process'].exitcode}."
+                        )
+                    if kind == 'done':
+                        return
+                    if kind == 'error':
+                        raise payload
+                    for channel, symbol, data in payload:
+                        tag = (worker['exchange'], channel, symbol)
+                        await self.results.put((*tag, data), tag)
+        finally:
+            loop.remove_reader(conn.fileno())
+
+    def book(self, exchange, symbol):
+        # The best levels of a worker's local book, see SharedBooks.read().
+        return self.shared_books[(exchange, symbol)].read(symbol)
+
+    def books(self, exchange, symbol):
+        # The SharedBooks holding the book, for to_numpy() and version().
+        return self.shared_books[(exchange, symbol)]
+
+    def consolidated_book(self, symbol):
+        raise NotSupported('The books are kept by the workers, read them with book().')
+
+    async def close(self):
+        await super().close()
+        for worker in self.workers:
+            process = worker['process']
+            if process.is_alive():
+                process.terminate()
+            await asyncio.get_event_loop().run_in_executor(None, process.join)
+            worker['conn'].close()
+            worker['books'].close()
+            worker['books'].unlink()
+        self.workers = []
+        self.shared_books = {}
@@ -1,5 +1,7 @@
 import ccxt.async_support as ccxt
 import cryptoapi.base.exchange as exchange
+import decimal
+import zlib
 
 from aiolimiter import AsyncLimiter
 from ccxt.base.errors import BaseError
@@ -12,11 +14,33 @@ from cryptoapi.base.errors import Reconnect
 from cryptoapi.base.errors import UnknownResponse
 
 
+def number_to_string(number):
+    # Formats a number like JavaScript does, which Bitfinex checksums rely
+    # on: no exponent from 1e-6 up to 1e21 and no trailing zeros.
+    if isinstance(number, int):
+        return str(number)
+    if number == 0:
+        return '0'
+    if 1e-6 <= abs(number) < 1e21:
+        text = format(decimal.Decimal(repr(number)), 'f')
+        return text.rstrip('0').rstrip('.') if '.' in text else text
+    mantissa, exponent = repr(number).split('e')
+    return f'{mantissa}e{int(exponent):+d}'
+
+
 class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
 
+    # Flags of the conf event, see the conf_flags option.
+    TIMESTAMP = 32768  # Append the send time in ms to every message.
+    SEQ_ALL = 65536  # Append a sequence number to every message.
+    OB_CHECKSUM = 131072  # Send a checksum of the top 25 levels of every book.
+    BULK_UPDATES = 536870912  # Send the book updates of an event in one frame.
+    # Lengths a book can be subscribed with.
+    BOOK_LENGTHS = [1, 25, 100, 250]
+
     def __init__(self, config={}):
         ccxt.bitfinex2.__init__(self, config=config)
-        exchange.Exchange.__init__(self)
+        exchange.Exchange.__init__(self, config)
         self.channels[self.TICKER]['ex_name'] = 'ticker'
         self.channels[self.TRADES]['ex_name'] = 'trades'
         self.channels[self.ORDER_BOOK]['ex_name'] = 'book'
@@ -37,6 +61,8 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
             'public': AsyncLimiter(20, 60000 / 1000),
             'private': AsyncLimiter(1, 60000 / 1000)
         }
+        # Bitfinex sends a heartbeat on every channel every 15 seconds.
+        self.stale_timeout = 30
         self.ws_endpoint = {
             'public': 'wss://api-pub.bitfinex.com/ws/2',
             'private': 'wss://api.bitfinex.com/ws/2'
@@ -54,7 +80,14 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
             10401: UnsubscribeError('Not subscribed.'),
         }
         # All message events that are not unified.
-        self.others = ['info']
+        self.others = ['info', 'conf', 'unsubscribed']
+        # Sum of the flags to enable on every connection, for example
+        # Bitfinex.BULK_UPDATES | Bitfinex.OB_CHECKSUM. 0 sends no conf event.
+        self.conf_flags = config.get('conf_flags', 0)
+        self.verify_sequence = bool(self.conf_flags & self.SEQ_ALL)
+        # (chanId, symbol) of the book channels that got their snapshot. In
+        # bulk mode updates look like snapshots, so the first one is taken.
+        self.book_snapshots = set()
 
     def build_requests(self, symbols, name, params={}):
         ids = [self.markets[s]['id'] for s in symbols]
@@ -67,12 +100,23 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
             for id in ids
         ]
 
-    async def subscribe_order_book(self, symbols):
+    async def subscribe_order_book(self, symbols, top=None, interval=None, limit=None):
+        length = 100
+        if limit:
+            # The smallest length holding limit levels. The local book keeps
+            # all of them, Bitfinex sends no removal for the levels that
+            # fall out of it.
+            length = min([n for n in self.BOOK_LENGTHS if n >= limit], default=self.BOOK_LENGTHS[-1])
+        if self.conf_flags & self.OB_CHECKSUM:
+            # The checksum covers the 25 best levels.
+            length = max(length, 25)
         params = {
             'prec': 'P0',
             'freq': 'F0',
-            'len': 100
+            'len': length
         }
+        self.limit_order_books(symbols, length, limit)
+        self.conflate_order_books(symbols, top, interval)
         requests = self.build_requests(symbols, self.ORDER_BOOK, params)
         await self.subscribe(requests, public=True)
 
@@ -88,9 +132,37 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
         ]
         await self.subscribe(requests, public=True)
 
+    def connection_requests(self):
+        if not self.conf_flags:
+            return []
+        return [{'event': 'conf', 'flags': self.conf_flags}]
+
+    def build_unsubscribe_request(self, channel):
+        return {'event': 'unsubscribe', 'chanId': channel['ex_channel_id']}
+
     def ex_channel_id_from_reply(self, reply):
         return reply[0]
 
+    def check_sequence(self, reply, websocket):
+        # With SEQ_ALL every message of a connection, heartbeats included,
+        # is numbered. A gap means messages were lost, so the connection is
+        # reopened and the books are rebuilt from new snapshots.
+        if not isinstance(reply, list):
+            return
+        sequence = reply[-2] if self.conf_flags & self.TIMESTAMP else reply[-1]
+        last = self.sequences.get(websocket)
+        self.sequences[websocket] = sequence
+        if last is not None and sequence != last + 1:
+            raise Reconnect(f'Sequence number {sequence} followed {last}.')
+
+    def exchange_timestamp(self, reply, name):
+        if self.conf_flags & self.TIMESTAMP:
+            return reply[-1]
+        if name == self.TRADES:
+            trades = reply[2] if reply[1] in ['te', 'tu'] else reply[1]
+            return trades[-1][1] if isinstance(trades[0], list) else trades[1]
+        return None
+
     def register_channel(self, reply, websocket):
         channel = {}
         ex_channel_id = reply['chanId']
@@ -120,25 +192,47 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
             channel['request'].update({'symbol': id})
             channel.update({'symbol': symbol})
             if name == self.ORDER_BOOK:
+                # A new subscription, maybe with the chanId of an old one.
+                self.book_snapshots.discard((ex_channel_id, symbol))
                 depth = int(reply['len'])
                 channel['request'].update({
                     'prec': reply['prec'],
                     'freq': reply['freq'],
                     'len': depth
                 })
-        self.connections[websocket].append(channel)  # Register channel.
+        self.add_channel(channel, websocket)
 
     def is_general_reply(self, reply):
         if isinstance(reply, list):
             return reply[1] == 'hb'
-        return reply[self.event] in [self.subscribed, 'info']
+        return reply[self.event] in [self.subscribed, *self.others]
+
+    def is_heartbeat(self, reply):
+        return isinstance(reply, list)
+
+    def parse_general_reply(self, reply, websocket):
+        if isinstance(reply, dict):
+            event = reply[self.event]
+            if event == 'info':
+                # Raises Reconnect or OnMaintenance, which make the connection
+                # reconnect and resubscribe.
+                return self.parse_other_ws(reply)
+            if event == 'conf':
+                if reply.get('status') != 'OK':
+                    raise ExchangeError(f'Flags {reply.get("flags")} were not accepted.')
+                return
+            if event == 'unsubscribed':
+                route = self.routes.get(websocket, {}).get(reply['chanId'])
+                if route is not None:
+                    self.book_snapshots.discard((reply['chanId'], route['symbol']))
+                return self.remove_channel(reply['chanId'], websocket)
+        return super().parse_general_reply(reply, websocket)
 
     def parse_other_ws(self, reply):
         code = reply['code'] if self.key_exists(reply, 'code') else None
         if code == 20051:
             raise Reconnect('Unsubscribe/subscribe to all channels.')
         elif code == 20060:
-            # TODO handle this issue once unsubscribe feature is added.
             raise OnMaintenance(
                 'Exchange is undergoing maintenance.'
                 + ' Pause activity for 2 minutes and then'
@@ -151,19 +245,26 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
                 raise ExchangeError('API version number changed.')
 
     def parse_ticker_ws(self, reply, market):
-        ticker = reply[1]
-        return self.TICKER, self.parse_ticker(ticker, market)
+        ticker = self.parse_ticker(reply[1], market)
+        if self.conf_flags & self.TIMESTAMP:
+            ticker['timestamp'] = reply[-1]
+            ticker['datetime'] = self.iso8601(reply[-1])
+        return self.TICKER, ticker
 
     def parse_trades_ws(self, reply, market):
-        trades = reply[1] if len(reply) < 3 else reply[2]
+        # Snapshots are [chanId, trades], updates [chanId, 'te', trade],
+        # both followed by the sequence number and timestamp if enabled.
+        trades = reply[2] if reply[1] in ['te', 'tu'] else reply[1]
         if not isinstance(trades[0], list):
             trades = [trades]
         return self.TRADES, self.parse_trades(trades, market)
 
     def parse_order_book_ws(self, reply, market):
+        if reply[1] == 'cs':
+            return self.verify_checksum(reply, market)
         order_book = reply[1]
         symbol = market['symbol']
-        timestamp = self.milliseconds()
+        timestamp = reply[-1] if self.conf_flags & self.TIMESTAMP else self.milliseconds()
         update = {
             'bids': [],
             'asks': [],
@@ -171,20 +272,50 @@ class Bitfinex(exchange.Exchange, ccxt.bitfinex2):
             'datetime': self.iso8601(timestamp),
             'nonce': None,
         }
-        if not isinstance(order_book[0], list):
+        if order_book and not isinstance(order_book[0], list):
             order_book = [order_book]
             snapshot = False
         else:
-            snapshot = True
-        for i in range(0, len(order_book)):
-            order = order_book[i]
-            price = order[0]
-            side = 'bids' if (order[2] > 0) else 'asks'
-            amount = abs(order[2])
-            update[side].append([price, amount])
-        self.update_order_book(update, market, snapshot=snapshot)
+            # The first list of levels of a channel is its snapshot, the
+            # next ones are bulk updates.
+            key = (reply[0], symbol)
+            snapshot = key not in self.book_snapshots
+            self.book_snapshots.add(key)
+        for price, count, amount in order_book:
+            side = 'bids' if amount > 0 else 'asks'
+            # A count of 0 removes the level, the amount is then 1 for bids
+            # and -1 for asks.
+            update[side].append([price, abs(amount) if count else 0])
+        if not self.update_order_book(update, market, snapshot=snapshot):
+            return
         return self.ORDER_BOOK, {symbol: update}
 
+    def verify_checksum(self, reply, market):
+        # [chanId, 'cs', checksum]. Never a result.
+        symbol = market['symbol']
+        if symbol in self.order_book and self.order_book_checksum(symbol) != reply[2]:
+            self.resync_order_book(symbol)
+
+    def order_book_checksum(self, symbol):
+        # Signed CRC32 of the 25 best bids and asks, interleaved as
+        # bid price:bid amount:ask price:ask amount:... where ask amounts
+        # are negative.
+        tokens = self.checksum_cache(symbol)
+        order_book = self.order_book[symbol]
+        bids = order_book['bids'][:25]
+        asks = order_book['asks'][:25]
+        parts = []
+        for i in range(max(len(bids), len(asks))):
+            for level, sign in [(bids, 1), (asks, -1)]:
+                if i < len(level):
+                    key = (level[i][0], sign * level[i][1])
+                    token = tokens.get(key)
+                    if token is None:
+                        token = tokens[key] = number_to_string(key[0]) + ':' + number_to_string(key[1])
+                    parts.append(token)
+        checksum = zlib.crc32(':'.join(parts).encode())
+        return checksum - 2 ** 32 if checksum >= 2 ** 31 else checksum
+
     def parse_ohlcvs_ws(self, reply, market):
         ohlcvs = reply[1]
         symbol = market['symbol']
@@ -1,3 +1,4 @@
+import asyncio
 import ccxt.async_support as ccxt
 import cryptoapi.base.exchange as exchange
 
@@ -8,7 +9,7 @@ class Bitvavo(exchange.Exchange, ccxt.bitvavo):
 
     def __init__(self, config={}):
         ccxt.bitvavo.__init__(self, config=config)
-        exchange.Exchange.__init__(self)
+        exchange.Exchange.__init__(self, config)
         self.channels[self.TICKER]['ex_name'] = 'ticker24h'
         self.channels[self.TRADES]['ex_name'] = 'trades'
         self.channels[self.ORDER_BOOK]['ex_name'] = 'book'
@@ -21,6 +22,8 @@ class Bitvavo(exchange.Exchange, ccxt.bitvavo):
         # Maximum number of channels per connection.
         # Unlimited if equal to 10 ** 5.
         self.max_channels = 10 ** 5
+        # Maximum number of symbols in one subscribe message.
+        self.max_symbols_per_request = 10 ** 5
         # Number of connections that can be created per unit time,
         #   where the unit of time is in milliseconds.
         # Example: AsyncLimiter(1, 60000 / 1000) --> one connection per minute
@@ -35,22 +38,117 @@ class Bitvavo(exchange.Exchange, ccxt.bitvavo):
         }
         self.event = 'event'
         self.subscribed = 'subscribed'
+        # REST book snapshots are fetched concurrently, at most one per
+        # ccxt rateLimit.
+        self.snapshot_limiter = AsyncLimiter(1, self.rateLimit / 1000)
+        # Deltas of the books whose snapshot is being fetched. {symbol: [update]}
+        self.book_buffers = {}
+        # Snapshot fetches of every connection. {websocket: {task: symbols}}
+        self.snapshot_tasks = {}
+        # Failed snapshot fetch of a connection, raised by run_consumer().
+        self.snapshot_errors = {}
 
     def build_requests(self, symbols, name, params={}):
         ids = [self.markets[s]['id'] for s in symbols]
         ex_name = self.channels[name]['ex_name']
         return [
             {'action': 'subscribe',
-             'channels': [{'name': ex_name, 'markets': [id], **params}]}
-            for id in ids
+             'channels': [{'name': ex_name, 'markets': batch, **params}]}
+            for batch in self.batch_ids(ids)
         ]
 
-    async def subscribe_order_book(self, symbols, params={}):
+    def count_channels(self, request):
+        return sum(len(c['markets']) for c in request['channels'])
+
+    async def subscribe_order_book(self, symbols, params={}, top=None, interval=None, limit=None):
+        self.limit_order_books(symbols, limit=limit)
+        self.conflate_order_books(symbols, top, interval)
+        # The snapshots are fetched once the subscriptions are registered.
+        self.drop_order_books(symbols)
         requests = self.build_requests(symbols, self.ORDER_BOOK)
-        for symbol in symbols:
-            self.order_book[symbol] = await self.fetch_order_book(symbol, 100)
         await self.subscribe(requests, public=True)
 
+    async def fetch_snapshot(self, symbol):
+        async with self.snapshot_limiter:
+            return await self.fetch_order_book(symbol, 100)
+
+    def expect_snapshots(self, websocket):
+        # Buffers the deltas of the books whose snapshots were requested
+        # until they arrive. Returns the symbols that weren't buffered yet.
+        symbols = [s for s in self.pending_snapshots[websocket] if s not in self.book_buffers]
+        for symbol in symbols:
+            self.book_buffers[symbol] = []
+        return symbols
+
+    async def fetch_snapshots(self, websocket):
+        # Unlike the base class this doesn't hold up the connection. The
+        # snapshots are fetched in the background while the deltas of their
+        # books are buffered, see sync_order_books().
+        symbols = self.expect_snapshots(websocket)
+        if not symbols:
+            return
+        task = asyncio.ensure_future(self.sync_order_books(symbols, websocket))
+        self.snapshot_tasks.setdefault(websocket, {})[task] = symbols
+
+    async def sync_order_books(self, symbols, websocket):
+        try:
+            snapshots = await asyncio.gather(*[self.fetch_snapshot(s) for s in symbols])
+        except Exception as e:
+            # Ends the connection, see run_consumer().
+            self.snapshot_errors[websocket] = e
+            await websocket.close()
+            return
+        for symbol, snapshot in zip(symbols, snapshots):
+            if self.recorder is not None:
+                self.recorder.write(self.connection_ids.get(websocket), snapshot, symbol)
+            await self.sync_order_book(symbol, snapshot)
+        pending = [s for s in self.pending_snapshots.get(websocket, []) if s not in symbols]
+        if pending:
+            self.pending_snapshots[websocket] = pending
+        else:
+            self.pending_snapshots.pop(websocket, None)
+
+    async def sync_order_book(self, symbol, snapshot):
+        # Applies the snapshot, then the buffered deltas in nonce order,
+        # skipping the ones the book already has. All of them are applied
+        # before any is published: while publishing waits for a full queue
+        # new deltas keep being buffered, and are applied and published
+        # next, so the book never goes back to an older delta.
+        market = self.markets[symbol]
+        self.update_order_book(snapshot, market, snapshot=True)
+        while self.book_buffers.get(symbol):
+            buffer = self.book_buffers[symbol]
+            self.book_buffers[symbol] = []
+            order_book = self.order_book.get(symbol)
+            if order_book is None:
+                # Dropped meanwhile.
+                break
+            updates = []
+            for update in sorted(buffer, key=lambda u: u['nonce']):
+                if order_book['nonce'] is None or update['nonce'] > order_book['nonce']:
+                    self.update_order_book(update, market)
+                    updates.append(update)
+            for update in updates:
+                await self.put_result((self.ORDER_BOOK, {symbol: update}), symbol)
+        self.book_buffers.pop(symbol, None)
+
+    async def run_consumer(self, websocket):
+        try:
+            await super().run_consumer(websocket)
+            if not self.reconnect:
+                # The connection closed but its books are kept, as nothing
+                # reopens it: the deltas received before the close are
+                # applied once their snapshots arrive.
+                await asyncio.gather(*self.snapshot_tasks.get(websocket, {}))
+        finally:
+            for task, symbols in self.snapshot_tasks.pop(websocket, {}).items():
+                task.cancel()
+                for symbol in symbols:
+                    self.book_buffers.pop(symbol, None)
+        error = self.snapshot_errors.pop(websocket, None)
+        if error is not None:
+            raise error
+
     async def subscribe_ohlcvs(self, symbols, timeframe='1m'):
         ex_timeframe = self.timeframes[timeframe]
         params = {'interval': [ex_timeframe]}
@@ -67,32 +165,45 @@ class Bitvavo(exchange.Exchange, ccxt.bitvavo):
             ex_name = 'candles'
         return (ex_name, reply['market'])
 
+    def exchange_timestamp(self, reply, name):
+        if name == self.TRADES:
+            return reply['timestamp']
+        if name == self.TICKER:
+            return reply['data'][0]['timestamp']
+        return None
+
     def register_channel(self, reply, websocket):
-        reply = reply['subscriptions']
-        ex_name = list(reply.keys())[0]
-        name = self.channels_by_ex_name[ex_name]['name']
-        req_params = {}
-        params = {}
-        if name == self.OHLCVS:
-            ex_timeframe = list(reply[ex_name].keys())[0]
-            req_params = {'interval': ex_timeframe}
-            timeframe = self.timeframes[ex_timeframe]
-            params = {'timeframe': timeframe}
-            subed_ids = reply[ex_name][timeframe]
-        else:
-            subed_ids = reply[ex_name]
-        id, symbol = self.find_not_subbed_symbol(subed_ids)
-        symbol = self.markets_by_id[id]['symbol']
-        request = self.build_requests([symbol], name, req_params)[0]
-        channel = {
-            'request': request,
-            'channel_id': self.claim_channel_id(),
-            'name': name,
-            'symbol': symbol,
-            'ex_channel_id': (ex_name, id),
-            **params
-        }
-        self.connections[websocket].append(channel)  # Register channel
+        # The reply lists every channel and market subscribed on the
+        # connection, register the ones that are new.
+        for ex_name, subed_ids in reply['subscriptions'].items():
+            name = self.channels_by_ex_name[ex_name]['name']
+            if name == self.OHLCVS:
+                ex_timeframes = {v: k for k, v in self.timeframes.items()}
+                for ex_timeframe, ids in subed_ids.items():
+                    req_params = {'interval': [ex_timeframe]}
+                    params = {'timeframe': ex_timeframes[ex_timeframe]}
+                    self.register_markets(ids, name, websocket, req_params, params)
+            else:
+                self.register_markets(subed_ids, name, websocket)
+
+    def register_markets(self, subed_ids, name, websocket, req_params={}, params={}):
+        ex_name = self.channels[name]['ex_name']
+        for id in self.find_not_subbed_ids(ex_name, subed_ids, websocket):
+            symbol = self.markets_by_id[id]['symbol']
+            if name == self.ORDER_BOOK and symbol not in self.order_book:
+                # Bitvavo doesn't send a snapshot after subscribing, e.g.
+                # when resubscribing after a reconnect.
+                self.request_snapshot(symbol, websocket)
+            request = self.build_requests([symbol], name, req_params)[0]
+            channel = {
+                'request': request,
+                'channel_id': self.claim_channel_id(),
+                'name': name,
+                'symbol': symbol,
+                'ex_channel_id': (ex_name, id),
+                **params
+            }
+            self.add_channel(channel, websocket)
 
     def parse_error_ws(self, reply, market=None):
         pass  # Errors are not defined in API documentation.
@@ -106,7 +217,16 @@ class Bitvavo(exchange.Exchange, ccxt.bitvavo):
     def parse_order_book_ws(self, reply, market):
         symbol = market['symbol']
         update = super().parse_order_book(reply)
-        self.update_order_book(update, market, snapshot=False)
+        update['nonce'] = reply['nonce']
+        buffer = self.book_buffers.get(symbol)
+        if buffer is not None:
+            buffer.append(update)
+            return
+        order_book = self.order_book.get(symbol)
+        if order_book is not None and order_book['nonce'] is not None and update['nonce'] <= order_book['nonce']:
+            return
+        if not self.update_order_book(update, market, snapshot=False):
+            return
         return 'order_book', {symbol: update}
 
     def parse_ohlcvs_ws(self, reply, market):
@@ -3,13 +3,14 @@ import cryptoapi.base.exchange as exchange
 
 from ccxt.base.errors import BaseError
 from aiolimiter import AsyncLimiter
+from cryptoapi.base.order_book import L3OrderBook
 
 
 class Coinbasepro(exchange.Exchange, ccxt.coinbasepro):
 
     def __init__(self, config={}):
         ccxt.coinbasepro.__init__(self, config=config)
-        exchange.Exchange.__init__(self)
+        exchange.Exchange.__init__(self, config)
         self.channels[self.TICKER]['ex_name'] = 'ticker'
         self.channels[self.TRADES]['ex_name'] = 'matches'
         self.channels[self.ORDER_BOOK]['ex_name'] = 'level2'
@@ -20,6 +21,8 @@ class Coinbasepro(exchange.Exchange, ccxt.coinbasepro):
         # Maximum number of channels per connection.
         # Unlimited if equal to 10 ** 5.
         self.max_channels = 10 ** 5
+        # Maximum number of symbols in one subscribe message.
+        self.max_symbols_per_request = 10 ** 5
         # Number of connections that can be created per unit time,
         #   where the unit of time is in milliseconds.
         # Example: AsyncLimiter(1, 60000 / 1000) --> one connection per minute
@@ -34,43 +37,143 @@ class Coinbasepro(exchange.Exchange, ccxt.coinbasepro):
         }
         self.event = 'type'
         self.subscribed = 'subscriptions'
+        # Channels that send the messages of a unified channel, coalesced
+        # every 50ms. {ex_name: unified ex_name}
+        self.ex_name_aliases = {
+            'level2_batch': 'level2',
+            'ticker_batch': 'ticker',
+        }
+        for alias, ex_name in self.ex_name_aliases.items():
+            self.channels_by_ex_name[alias] = self.channels_by_ex_name[ex_name]
+        # Every order, for level 3 books.
+        self.channels_by_ex_name['full'] = self.channels_by_ex_name['level2']
+        # Symbols whose book is built from the full channel.
+        self.l3_symbols = set()
 
-    def build_requests(self, symbols, name, params={}):
+    def build_requests(self, symbols, name, params={}, ex_name=None):
         ids = [self.markets[s]['id'] for s in symbols]
-        ex_name = self.channels[name]['ex_name']
+        ex_name = ex_name or self.channels[name]['ex_name']
         return [
             {'type': 'subscribe',
-             'channels': [{'name': ex_name, 'product_ids': [id]}],
+             'channels': [{'name': ex_name, 'product_ids': batch}],
              **params}
-            for id in ids
+            for batch in self.batch_ids(ids)
         ]
 
+    async def subscribe_ticker(self, symbols, batch=False):
+        ex_name = 'ticker_batch' if batch else None
+        requests = self.build_requests(symbols, self.TICKER, ex_name=ex_name)
+        await self.subscribe(requests, public=True)
+
+    async def subscribe_order_book(self, symbols, batch=False, level=2, top=None, interval=None, limit=None):
+        # level 3 builds the books from every order of the full channel,
+        # see parse_full_ws(). Their depth isn't limited.
+        if level == 3:
+            self.l3_symbols.update(symbols)
+            ex_name = 'full'
+        else:
+            self.limit_order_books(symbols, limit=limit)
+            ex_name = 'level2_batch' if batch else None
+        self.conflate_order_books(symbols, top, interval)
+        requests = self.build_requests(symbols, self.ORDER_BOOK, ex_name=ex_name)
+        await self.subscribe(requests, public=True)
+
+    def count_channels(self, request):
+        return sum(len(c['product_ids']) for c in request['channels'])
+
     def ex_channel_id_from_reply(self, reply):
-        if reply['type'] in ['snapshot', 'l2update']:
+        type = reply['type']
+        if type in ['snapshot', 'l2update']:
             name = self.channels[self.ORDER_BOOK]['ex_name']
-        elif reply['type'] in ['last_match', 'match']:
+        elif type in ['last_match', 'match']:
             name = 'matches'
+        elif type in ['received', 'open', 'done', 'change', 'activate']:
+            name = 'full'
         else:
-            name = reply['type']
+            name = type
         return (name, reply['product_id'])
 
+    def exchange_timestamp(self, reply, name):
+        return self.parse8601(reply['time']) if 'time' in reply else None
+
     def register_channel(self, reply, websocket):
-        ex_name = reply['channels'][0]['name']
+        # The reply lists every channel and market subscribed on the
+        # connection, register the ones that are new.
+        for c in reply['channels']:
+            ex_name = c['name']
+            if ex_name not in self.channels_by_ex_name:
+                continue
+            name = self.channels_by_ex_name[ex_name]['name']
+            # Batched channels are routed like the channel they batch.
+            route_name = self.ex_name_aliases.get(ex_name, ex_name)
+            for id in self.find_not_subbed_ids(route_name, c['product_ids'], websocket):
+                request = {
+                    'type': 'subscribe',
+                    'channels': [{'name': ex_name, 'product_ids': [id]}]
+                }
+                channel = {
+                    'request': request,
+                    'channel_id': self.claim_channel_id(),
+                    'ex_channel_id': (route_name, id),
+                    'name': name,
+                    'symbol': self.markets_by_id[id]['symbol'],
+                }
+                self.add_channel(channel, websocket)
+                if ex_name == 'full':
+                    self.add_full_match_route(channel, websocket)
+                    self.request_snapshot(channel['symbol'], websocket)
+
+    def add_full_match_route(self, channel, websocket):
+        # The full channel sends its matches as match messages, which are
+        # routed to the matches channel. Without a trades subscription they
+        # go to the book's route.
+        routes = self.routes[websocket]
+        key = ('matches', channel['ex_channel_id'][1])
+        if key not in routes:
+            routes[key] = routes[channel['ex_channel_id']]
+
+    def find_not_subbed_ids(self, ex_name, subed_ids, websocket):
+        # A trades subscription takes over the matches route of a book.
+        routes = self.routes.get(websocket, {})
         name = self.channels_by_ex_name[ex_name]['name']
-        subed_ids = reply['channels'][0]['product_ids']  # List of subscribed markets
-        id, symbol = self.find_not_subbed_symbol(subed_ids)
-        request = {
-            'type': 'subscribe',
-            'channels': [{'name': ex_name, 'product_ids': [id]}]
-        }
-        channel = {
-            'request': request,
-            'channel_id': self.claim_channel_id(),
-            'ex_channel_id': (ex_name, id),
-            'name': name,
-            'symbol': symbol,
+        return [
+            id for id in subed_ids
+            if (ex_name, id) not in routes or routes[(ex_name, id)]['channel']['name'] != name
+        ]
+
+    def remove_channel(self, ex_channel_id, websocket):
+        super().remove_channel(ex_channel_id, websocket)
+        key = ('matches', ex_channel_id[1])
+        route = self.routes.get(websocket, {}).get(key)
+        if route is not None and route['channel']['ex_channel_id'] == ex_channel_id:
+            del self.routes[websocket][key]
+
+    async def fetch_snapshot(self, symbol):
+        if symbol not in self.l3_symbols:
+            return await super().fetch_snapshot(symbol)
+        response = await self.publicGetProductsIdBook({'id': self.market_id(symbol), 'level': 3})
+        return {
+            'bids': [[float(price), float(amount), order_id] for price, amount, order_id in response['bids']],
+            'asks': [[float(price), float(amount), order_id] for price, amount, order_id in response['asks']],
+            'timestamp': None,
+            'datetime': None,
+            'nonce': response['sequence'],
         }
-        self.connections[websocket].append(channel)  # Register channel
+
+    def update_order_book(self, update, market, snapshot=False):
+        if snapshot and market['symbol'] in self.l3_symbols:
+            order_book = self.order_book[market['symbol']] = L3OrderBook(update)
+            self.notify_order_book(market['symbol'], order_book, snapshot=True)
+            return True
+        return super().update_order_book(update, market, snapshot)
+
+    def resync_order_book(self, symbol):
+        # Coinbase Pro numbers the messages of every product. After a gap a
+        # new snapshot is fetched for the same subscription.
+        self.channel_counters(self.ORDER_BOOK)['sequence_gaps'] += 1
+        self.drop_order_books([symbol])
+        for websocket, channel in self.find_order_book_channels(symbol):
+            self.request_snapshot(symbol, websocket)
 
     def parse_error_ws(self, reply, market=None):
         err = f"Error: {reply['message']}."
@@ -81,10 +184,19 @@ class Coinbasepro(exchange.Exchange, ccxt.coinbasepro):
         return self.TICKER, super().parse_ticker(reply, market)
 
     def parse_trades_ws(self, reply, market):
+        if market['symbol'] in self.l3_symbols and reply['type'] == 'match':
+            # The match is on the full channel too. It is applied here when
+            # it is next in sequence, otherwise the full channel brings it.
+            order_book = self.order_book.get(market['symbol'])
+            if order_book is not None and reply['sequence'] == order_book['nonce'] + 1:
+                self.parse_full_ws(reply, market)
         return self.TRADES, [self.parse_trade(reply, market)]
 
     def parse_order_book_ws(self, reply, market):
-        if reply['type'] == 'snapshot':
+        type = reply['type']
+        if type not in ['snapshot', 'l2update']:
+            return self.parse_full_ws(reply, market)
+        if type == 'snapshot':
             snapshot = True
             update = super().parse_order_book(reply)
         else:
@@ -101,5 +213,48 @@ class Coinbasepro(exchange.Exchange, ccxt.coinbasepro):
                 price = float(o[1])
                 amount = float(o[2])
                 update[side].append([price, amount])
-        self.update_order_book(update, market, snapshot)
+        if not self.update_order_book(update, market, snapshot):
+            return
         return 'order_book', {market['symbol']: update}
+
+    def parse_full_ws(self, reply, market):
+        # Applies a message of the full channel to the level 3 book and
+        # publishes the levels it changed. Messages older than the snapshot
+        # are skipped, a gap in the sequence numbers resyncs the book.
+        symbol = market['symbol']
+        order_book = self.order_book.get(symbol)
+        if order_book is None:
+            return
+        sequence = reply['sequence']
+        if sequence <= order_book['nonce']:
+            return
+        if sequence != order_book['nonce'] + 1:
+            self.resync_order_book(symbol)
+            return
+        order_book['nonce'] = sequence
+        type = reply['type']
+        if type == 'open':
+            side = 'bids' if reply['side'] == 'buy' else 'asks'
+            change = order_book.open(reply['order_id'], side, float(reply['price']), float(reply['remaining_size']))
+        elif type == 'match':
+            change = order_book.match(reply['maker_order_id'], float(reply['size']))
+        elif type == 'change':
+            change = order_book.change(reply['order_id'], float(reply['new_size']))
+        elif type == 'done':
+            change = order_book.done(reply['order_id'])
+        else:
+            # received and activate don't touch the book.
+            change = None
+        if change is None:
+            return
+        side, level = change
+        update = {
+            'bids': [],
+            'asks': [],
+            'timestamp': None,
+            'datetime': None,
+            'nonce': sequence,
+        }
+        update[side].append(level)
+        self.notify_order_book(symbol, update)
+        return self.ORDER_BOOK, {symbol: update}
@@ -1,5 +1,6 @@
 import ccxt.async_support as ccxt
 import cryptoapi.base.exchange as exchange
+import zlib
 
 from aiolimiter import AsyncLimiter
 from ccxt.base.errors import BaseError
@@ -7,9 +8,16 @@ from ccxt.base.errors import BaseError
 
 class Kraken(exchange.Exchange, ccxt.kraken):
 
+    # markets_by_wsnames and the markets it was built from. Class attributes
+    # since ccxt reads every property while constructing the instance.
+    wsnames_index = {}
+    wsnames_markets = None
+    # Depths a book can be subscribed with.
+    BOOK_DEPTHS = [10, 25, 100, 500, 1000]
+
     def __init__(self, config={}):
         ccxt.kraken.__init__(self, config=config)
-        exchange.Exchange.__init__(self)
+        exchange.Exchange.__init__(self, config)
         self.channels[self.TICKER]['ex_name'] = 'ticker'
         self.channels[self.TRADES]['ex_name'] = 'trade'
         self.channels[self.ORDER_BOOK]['ex_name'] = 'book'
@@ -22,6 +30,8 @@ class Kraken(exchange.Exchange, ccxt.kraken):
         # Maximum number of channels per connection.
         # Unlimited if equal to 10 ** 5.
         self.max_channels = 45
+        # Maximum number of symbols in one subscribe message.
+        self.max_symbols_per_request = 10 ** 5
         # Number of connections that can be created per unit time,
         #   where the unit of time is in milliseconds.
         # Example: AsyncLimiter(1, 60000 / 1000) --> one connection per minute
@@ -30,6 +40,8 @@ class Kraken(exchange.Exchange, ccxt.kraken):
             'public': AsyncLimiter(10 ** 5, 60000 / 1000),
             'private': AsyncLimiter(1, 60000 / 1000)
         }
+        # Kraken sends a heartbeat every second when there is no traffic.
+        self.stale_timeout = 10
         self.ws_endpoint = {
             'public': 'wss://ws.kraken.com',
             'private': ''
@@ -39,27 +51,44 @@ class Kraken(exchange.Exchange, ccxt.kraken):
         self.subscribed = 'subscribed'
         # All message events that are not unified.
         self.others = ['subscriptionStatus', 'systemStatus', 'heartbeat']
+        # Verify the checksum of every book update and resubscribe books
+        # that went out of sync.
+        self.verify_checksums = config.get('checksum', True)
 
     @property
     def markets_by_wsnames(self):
-        return {
-            market['info']['wsname']: market
-            for market in self.markets.values()
-            if self.key_exists(market['info'], 'wsname')
-        } if self.markets else {}
+        # Rebuilt only when the markets are replaced.
+        if self.wsnames_markets is not self.markets:
+            self.wsnames_markets = self.markets
+            self.wsnames_index = {
+                market['info']['wsname']: market
+                for market in self.markets.values()
+                if self.key_exists(market['info'], 'wsname')
+            } if self.markets else {}
+        return self.wsnames_index
 
     def build_requests(self, symbols, name, params={}):
         ids = [self.markets[s]['info']['wsname'] for s in symbols]
         ex_name = self.channels[name]['ex_name']
         return [
             {'event': 'subscribe',
-             'pair': [id],
+             'pair': batch,
              'subscription': {'name': ex_name, **params}}
-            for id in ids
+            for batch in self.batch_ids(ids)
         ]
 
-    async def subscribe_order_book(self, symbols, depth=100):
-        params = {'depth': 100}
+    def count_channels(self, request):
+        return len(request['pair'])
+
+    async def subscribe_order_book(self, symbols, depth=100, top=None, interval=None, limit=None):
+        if limit:
+            # The smallest depth holding limit levels. The local book keeps
+            # all of them, Kraken sends no removal for the levels that fall
+            # out of it. Every depth covers the 10 levels of the checksum.
+            depth = min([d for d in self.BOOK_DEPTHS if d >= limit] + [depth])
+        self.limit_order_books(symbols, depth, limit)
+        self.conflate_order_books(symbols, top, interval)
+        params = {'depth': depth}
         requests = self.build_requests(symbols, self.ORDER_BOOK, params)
         await self.subscribe(requests, public=True)
 
@@ -72,6 +101,17 @@ class Kraken(exchange.Exchange, ccxt.kraken):
     def ex_channel_id_from_reply(self, reply):
         return reply[0]
 
+    def exchange_timestamp(self, reply, name):
+        if name == self.TRADES:
+            return float(reply[1][-1][2]) * 1000
+        if name == self.OHLCVS:
+            return float(reply[1][0]) * 1000
+        if name == self.ORDER_BOOK:
+            levels = reply[1].get('b') or reply[1].get('a')
+            if levels:
+                return float(levels[-1][2]) * 1000
+        return None
+
     def register_channel(self, reply, websocket):
         ex_channel_id = reply['channelID']
         ex_name = reply['subscription']['name']
@@ -80,7 +120,7 @@ class Kraken(exchange.Exchange, ccxt.kraken):
         symbol = self.markets_by_wsnames[wsname]['symbol']
         request = {
             'event': 'subscribe',
-            'pair': wsname,
+            'pair': [wsname],
             'subscription': reply['subscription']
         }
         channel = {
@@ -98,15 +138,20 @@ class Kraken(exchange.Exchange, ccxt.kraken):
             channel.update({
                 'timeframe': timeframe
             })
-        self.connections[websocket].append(channel)  # Register channel
+        self.add_channel(channel, websocket)
 
     def is_general_reply(self, reply):
         return isinstance(reply, dict)
 
+    def is_heartbeat(self, reply):
+        return reply[self.event] == 'heartbeat'
+
     def parse_general_reply(self, reply, websocket):
         if reply[self.event] == 'subscriptionStatus':
             if reply['status'] == self.subscribed:
                 return self.register_channel(reply, websocket)
+            if reply['status'] == 'unsubscribed':
+                return self.remove_channel(reply['channelID'], websocket)
         elif reply[self.event] in self.errors:
             return self.parse_error_ws(reply)
         else:
@@ -166,21 +211,56 @@ class Kraken(exchange.Exchange, ccxt.kraken):
         timestamp = float(bid_ask[2])
         return [price, amount, timestamp]
 
+    def build_unsubscribe_request(self, channel):
+        return {**channel['request'], 'event': 'unsubscribe'}
+
     def parse_order_book_ws(self, reply, market):
         order_book = reply[1]
+        if len(reply) == 5:
+            # Updates of both sides come in two objects, the second one
+            # with the checksum.
+            order_book = {**reply[1], **reply[2]}
         symbol = market['symbol']
         # Update
         if self.key_exists(order_book, 'b') or self.key_exists(order_book, 'a'):
             order_book = self.normalize_order_book_reply(order_book, bids_key='b', asks_key='a')
             update = super().parse_order_book(order_book, bids_key='b', asks_key='a')
-            self.update_order_book(update, market)
+            applied = self.update_order_book(update, market)
         # Snapshot
         else:
             order_book = self.normalize_order_book_reply(order_book, bids_key='bs', asks_key='as')
             update = super().parse_order_book(order_book, bids_key='bs', asks_key='as')
-            self.update_order_book(update, market, snapshot=True)
+            applied = self.update_order_book(update, market, snapshot=True)
+        if not applied:
+            return
+        checksum = order_book.get('c')
+        if checksum is not None and self.verify_checksums:
+            if self.order_book_checksum(market) != int(checksum):
+                self.resync_order_book(symbol)
+                return
         return 'order_book', {symbol: update}
 
+    def order_book_checksum(self, market):
+        # CRC32 of the 10 best asks and then bids: price and amount of
+        # every level as Kraken formats them, without the decimal point and
+        # leading zeros.
+        symbol = market['symbol']
+        tokens = self.checksum_cache(symbol)
+        order_book = self.order_book[symbol]
+        price_precision = market['precision']['price']
+        amount_precision = market['precision']['amount']
+        parts = []
+        for side in [order_book['asks'], order_book['bids']]:
+            for level in side[:10]:
+                key = (level[0], level[1])
+                token = tokens.get(key)
+                if token is None:
+                    price = f'{level[0]:.{price_precision}f}'.replace('.', '').lstrip('0')
+                    amount = f'{level[1]:.{amount_precision}f}'.replace('.', '').lstrip('0')
+                    token = tokens[key] = price + amount
+                parts.append(token)
+        return zlib.crc32(''.join(parts).encode())
+
     def parse_ohlcvs_ws(self, reply, market):
         ohlcvs = reply[1]
         symbol = market['symbol']
@@ -24,4 +24,8 @@ setup(
     packages=['cryptoapi', 'cryptoapi/base'],
     include_package_data=True,
     install_requires=['aiolimiter', 'ccxt', 'websockets'],
+    extras_require={
+        'fast': ['orjson'],
+        'numpy': ['numpy'],
+    },
 )
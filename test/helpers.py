@@ -1,3 +1,5 @@
+import asyncio
+
 from unittest.mock import MagicMock
 
 BOOK_METADATA = {
@@ -88,3 +90,52 @@ class AsyncContextManager(MagicMock):
 
     async def __aexit__(self, *args, **kwargs):
         return super().__exit__(*args, **kwargs)
+
+
+class WebsocketMock:
+    """Websocket that yields the queued replies and records what is sent.
+
+    Iteration stops once None is queued or the websocket is closed.
+    Queued exceptions are raised.
+    """
+
+    def __init__(self, replies=[]):
+        self.replies = asyncio.Queue()
+        for reply in replies:
+            self.replies.put_nowait(reply)
+        self.sent = []
+        self.closed = False
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+        self.replies.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        reply = await self.replies.get()
+        if reply is None:
+            raise StopAsyncIteration
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class ConnectMock:
+    """Stands in for websockets.connect, handing out the given websockets.
+
+    Once they run out, websockets without replies are handed out.
+    """
+
+    def __init__(self, websockets=[]):
+        self.websockets = list(websockets)
+        self.opened = []
+
+    async def __call__(self, endpoint):
+        websocket = self.websockets.pop(0) if self.websockets else WebsocketMock()
+        self.opened.append(websocket)
+        return websocket
@@ -1,8 +1,13 @@
+import asyncio
+import json
 import unittest
+import zlib
 
-from cryptoapi.bitfinex import Bitfinex
-from cryptoapi.base.errors import UnknownResponse
-from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET
+from unittest.mock import MagicMock, patch
+from ccxt.base.errors import OnMaintenance
+from cryptoapi.bitfinex import Bitfinex, number_to_string
+from cryptoapi.base.errors import Reconnect, UnknownResponse
+from test.helpers import AsyncContextManager, BOOK_METADATA, ConnectMock, TEST_MARKET, WebsocketMock
 
 
 class TestBitfinex(unittest.IsolatedAsyncioTestCase):
@@ -145,6 +150,28 @@ class TestBitfinex(unittest.IsolatedAsyncioTestCase):
         }
         self.assertEqual([correct_channel], self.exchange.connections[websocket_mock])
 
+    def test_parse_market_reply_routes_by_ex_channel_id(self):
+        ex_name = self.exchange.channels[self.exchange.ORDER_BOOK]['ex_name']
+        reply = {
+            "event": "subscribed",
+            "channel": ex_name,
+            "chanId": 17082,
+            "symbol": self.test_market['id'],
+            "prec": "P0",
+            "freq": "F0",
+            "len": 100
+        }
+        websocket_mock = AsyncContextManager()
+        self.exchange.connections[websocket_mock] = []
+        self.exchange.register_channel(reply, websocket_mock)
+
+        channel, update = self.exchange.parse_market_reply([17082, [[7254.7, 3, 3.3]]], websocket_mock)
+
+        self.assertEqual(self.exchange.ORDER_BOOK, channel)
+        self.assertEqual([[7254.7, 3.3]], update[self.test_market['symbol']]['bids'])
+        with self.assertRaises(UnknownResponse):
+            self.exchange.parse_market_reply([1, [1, 1, 1]], websocket_mock)
+
     def test_parse_order_book_snapshot_ccxt_style(self):
         reply = [17082, [[7254.7, 3, 3.3]]]
 
@@ -179,3 +206,162 @@ class TestBitfinex(unittest.IsolatedAsyncioTestCase):
             **BOOK_METADATA
         }
         self.assertEqual(correct_update, update[symbol])
+
+    def test_count_zero_deletes_level(self):
+        symbol = self.test_market['symbol']
+        self.exchange.parse_order_book_ws([17082, [[7254.7, 3, 3.3], [7255.1, 1, -1.2]]], self.test_market)
+
+        self.exchange.parse_order_book_ws([17082, [7254.7, 0, 1]], self.test_market)
+        self.exchange.parse_order_book_ws([17082, [7255.1, 0, -1]], self.test_market)
+
+        self.assertEqual([], self.exchange.order_book[symbol]['bids'])
+        self.assertEqual([], self.exchange.order_book[symbol]['asks'])
+
+    def test_bulk_updates_after_snapshot(self):
+        symbol = self.test_market['symbol']
+        self.exchange.conf_flags = Bitfinex.BULK_UPDATES
+        self.exchange.parse_order_book_ws([17082, [[7254.7, 3, 3.3], [7255.1, 1, -1.2]]], self.test_market)
+
+        channel, update = self.exchange.parse_order_book_ws(
+            [17082, [[7254.7, 0, 1], [7254.5, 1, 0.5], [7255.3, 2, -2.0]]], self.test_market)
+
+        self.assertEqual([[7254.7, 0], [7254.5, 0.5]], update[symbol]['bids'])
+        self.assertEqual([[7254.5, 0.5]], self.exchange.order_book[symbol]['bids'])
+        self.assertEqual([[7255.1, 1.2], [7255.3, 2.0]], self.exchange.order_book[symbol]['asks'])
+
+    def test_timestamp_and_sequence_fields(self):
+        symbol = self.test_market['symbol']
+        self.exchange.conf_flags = Bitfinex.TIMESTAMP | Bitfinex.SEQ_ALL
+        self.exchange.parse_order_book_ws([17082, [[7254.7, 3, 3.3]], 1, 1574694475039], self.test_market)
+
+        channel, update = self.exchange.parse_order_book_ws([17082, [7254.5, 1, 0.5], 2, 1574694475040],
+                                                            self.test_market)
+        self.assertEqual(1574694475040, update[symbol]['timestamp'])
+        trade = [17083, 'te', [401597393, 1574694475039, 0.005, 7244.9], 3, 1574694475041]
+        channel, trades = self.exchange.parse_trades_ws(trade, self.test_market)
+        self.assertEqual([401597393], [int(t['id']) for t in trades])
+        self.assertEqual(1574694475041, self.exchange.exchange_timestamp(trade, 'trades'))
+
+    def test_sequence_gap_reconnects(self):
+        self.exchange.conf_flags = Bitfinex.TIMESTAMP | Bitfinex.SEQ_ALL
+        websocket = WebsocketMock()
+
+        self.exchange.check_sequence({'event': 'conf', 'status': 'OK'}, websocket)
+        self.exchange.check_sequence([0, 'hb', 1, 1574694475039], websocket)
+        self.exchange.check_sequence([1, [7254.5, 1, 0.5], 2, 1574694475040], websocket)
+        with self.assertRaises(Reconnect):
+            self.exchange.check_sequence([1, [7254.5, 1, 0.5], 4, 1574694475041], websocket)
+
+    async def test_conf_is_sent_first(self):
+        self.exchange = Bitfinex({'conf_flags': Bitfinex.BULK_UPDATES | Bitfinex.OB_CHECKSUM})
+        self.exchange.markets = {TEST_MARKET['symbol']: TEST_MARKET}
+        self.exchange.markets_by_id = {TEST_MARKET['id']: TEST_MARKET}
+        connect = ConnectMock([WebsocketMock()])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_order_book([self.test_market['symbol']], limit=10))
+            while not connect.opened or len(connect.opened[0].sent) < 2:
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await task
+
+        sent = [json.loads(m) for m in connect.opened[0].sent]
+        self.assertEqual({'event': 'conf', 'flags': 536870912 + 131072}, sent[0])
+        self.assertEqual('subscribe', sent[1]['event'])
+        # The checksum covers the 25 best levels.
+        self.assertEqual(25, sent[1]['len'])
+        self.assertEqual(25, self.exchange.order_book_depth[self.test_market['symbol']])
+        self.assertIsNone(self.exchange.parse_general_reply({'event': 'conf', 'status': 'OK'}, WebsocketMock()))
+
+    @staticmethod
+    def checksum(bids, asks):
+        parts = []
+        for bid, ask in zip(bids[:25], asks[:25]):
+            parts += [str(bid[0]), str(bid[2]), str(ask[0]), str(ask[2])]
+        checksum = zlib.crc32(':'.join(parts).encode())
+        return checksum - 2 ** 32 if checksum >= 2 ** 31 else checksum
+
+    async def test_checksum(self):
+        self.exchange.result = None
+        subscribed = {"event": "subscribed", "channel": "book", "chanId": 17082, "symbol": self.test_market['id'],
+                      "prec": "P0", "freq": "F0", "len": "25"}
+        websocket = WebsocketMock([json.dumps(subscribed), None])
+        self.exchange.connections[websocket] = []
+        await self.exchange.consumer(websocket)
+        bids = [[7254.7 - i, 1, 1.5 + i] for i in range(30)]
+        asks = [[7255.1 + i, 2, -0.25 - i] for i in range(30)]
+        self.exchange.parse_order_book_ws([17082, bids + asks], self.test_market)
+
+        self.assertIsNone(self.exchange.parse_order_book_ws([17082, 'cs', self.checksum(bids, asks)],
+                                                            self.test_market))
+        self.assertIn('BTC/USD', self.exchange.order_book)
+        self.assertEqual([], websocket.sent)
+
+        self.exchange.parse_order_book_ws([17082, 'cs', 12345], self.test_market)
+        await self.exchange.supervisor.wait()
+        self.assertNotIn('BTC/USD', self.exchange.order_book)
+        self.assertEqual(1, self.exchange.stats()['channels']['order_book']['checksum_errors'])
+        request = {'event': 'subscribe', 'channel': 'book', 'symbol': self.test_market['id'],
+                   'prec': 'P0', 'freq': 'F0', 'len': 25}
+        self.assertEqual([{'event': 'unsubscribe', 'chanId': 17082}, request],
+                         [json.loads(m) for m in websocket.sent])
+        self.exchange.parse_general_reply({'event': 'unsubscribed', 'status': 'OK', 'chanId': 17082}, websocket)
+        self.assertEqual([], self.exchange.connections[websocket])
+        self.assertEqual({}, self.exchange.routes[websocket])
+
+    def test_info_replies(self):
+        websocket_mock = AsyncContextManager()
+
+        self.assertIsNone(self.exchange.parse_general_reply({'event': 'info', 'version': 2}, websocket_mock))
+        with self.assertRaises(Reconnect):
+            self.exchange.parse_general_reply({'event': 'info', 'code': 20051}, websocket_mock)
+        with self.assertRaises(OnMaintenance):
+            self.exchange.parse_general_reply({'event': 'info', 'code': 20060}, websocket_mock)
+
+    async def reconnect_after_info(self, code):
+        self.exchange.reconnect_delay = MagicMock(return_value=0)
+        self.exchange.maintenance_delay = 0
+        info = json.dumps({'event': 'info', 'code': code})
+        connect = ConnectMock([WebsocketMock([info])])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_ticker([self.test_market['symbol']]))
+            while len(connect.opened) < 2 or not connect.opened[1].sent:
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await task
+        self.assertTrue(connect.opened[0].closed)
+        return self.exchange.reconnect_delay
+
+    async def test_reconnect_on_20051(self):
+        reconnect_delay = await self.reconnect_after_info(20051)
+
+        reconnect_delay.assert_called_once_with(1)
+
+    async def test_reconnect_after_maintenance_on_20060(self):
+        reconnect_delay = await self.reconnect_after_info(20060)
+
+        # The maintenance delay is used instead of the backoff.
+        reconnect_delay.assert_not_called()
+
+
+class TestNumberToString(unittest.TestCase):
+
+    def test_formats_like_javascript(self):
+        # String(number) in JavaScript.
+        cases = [
+            (1e-6, '0.000001'),
+            (5e-7, '5e-7'),
+            (1.5e-7, '1.5e-7'),
+            (1e-8, '1e-8'),
+            (-5e-7, '-5e-7'),
+            (0.00012, '0.00012'),
+            (7254.5, '7254.5'),
+            (-0.005, '-0.005'),
+            (1e21, '1e+21'),
+            (3, '3'),
+            (0.0, '0'),
+        ]
+        for number, text in cases:
+            with self.subTest(number=number):
+                self.assertEqual(text, number_to_string(number))
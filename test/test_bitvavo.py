@@ -1,7 +1,12 @@
+import asyncio
+import json
 import unittest
 
+from unittest.mock import patch
+from aiolimiter import AsyncLimiter
+from ccxt.base.errors import NetworkError
 from cryptoapi.bitvavo import Bitvavo
-from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET
+from test.helpers import AsyncContextManager, BOOK_METADATA, ConnectMock, TEST_MARKET, WebsocketMock
 
 
 class TestBitvavo(unittest.IsolatedAsyncioTestCase):
@@ -85,7 +90,7 @@ class TestBitvavo(unittest.IsolatedAsyncioTestCase):
         correct_registration = {
             'request': {
                 'action': 'subscribe',
-                'channels': [{'name': ex_name, 'markets': [id], 'interval': ex_timeframe}],
+                'channels': [{'name': ex_name, 'markets': [id], 'interval': [ex_timeframe]}],
             },
             'channel_id': 0,
             'ex_channel_id': (ex_name, id),
@@ -117,7 +122,130 @@ class TestBitvavo(unittest.IsolatedAsyncioTestCase):
         correct_book = {
             'bids': [[10101.10, 0.45054140]],
             'asks': [[10102.55, 0.57753524]],
-            **BOOK_METADATA
+            **BOOK_METADATA,
+            # Deltas keep their nonce to be ordered against the snapshot.
+            'nonce': 0,
         }
         symbol = self.test_market['symbol']
         self.assertEqual(correct_book, update[symbol])
+
+    async def test_reconnect_fetches_snapshot_after_subscribing(self):
+        symbol = self.test_market['symbol']
+        id = self.test_market['id']
+        attempts = []
+        self.exchange.reconnect_delay = lambda attempt: attempts.append(attempt) or 0
+        subscribed = json.dumps({'event': 'subscribed', 'subscriptions': {'book': [id]}})
+        delta = json.dumps({'event': 'book', 'market': id, 'nonce': 2, 'bids': [['2', '1']], 'asks': []})
+        snapshot = {'bids': [[1, 1]], 'asks': [[3, 1]], **BOOK_METADATA}
+        fetches = [NetworkError('down'), snapshot]
+
+        async def fetch_order_book(symbol, limit=None, params={}):
+            # Never fetched before the subscription is acknowledged.
+            self.assertTrue(self.exchange.connections[connect.opened[-1]])
+            result = fetches.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.exchange.fetch_order_book = fetch_order_book
+        self.exchange.order_book[symbol] = {'bids': [], 'asks': [], **BOOK_METADATA}
+        connect = ConnectMock([
+            # Dropped after subscribing.
+            WebsocketMock([subscribed, None]),
+            # The snapshot fetch fails.
+            WebsocketMock([subscribed]),
+            WebsocketMock([subscribed, delta]),
+        ])
+
+        requests = self.exchange.build_requests([symbol], self.exchange.ORDER_BOOK)
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe(requests, public=True))
+            channel, update = await asyncio.wait_for(self.exchange.result.get(), 1)
+            await self.exchange.supervisor.cancel()
+            await task
+
+        # The failed snapshot counts as a failed attempt.
+        self.assertEqual([0, 1], attempts)
+        self.assertEqual([[2, 1], [1, 1]], self.exchange.order_book[symbol]['bids'])
+        self.assertEqual([[2.0, 1.0]], update[symbol]['bids'])
+
+    async def test_snapshots_are_fetched_concurrently_after_subscribing(self):
+        eth_market = {**self.test_market, 'id': 'ETH-EUR', 'symbol': 'ETH/EUR'}
+        self.exchange.markets['ETH/EUR'] = eth_market
+        self.exchange.markets_by_id['ETH-EUR'] = eth_market
+        self.exchange.snapshot_limiter = AsyncLimiter(10, 1)
+        self.exchange.result = None
+        results = self.exchange.result_queue('order_book', maxsize=10)
+        ids = [self.test_market['id'], 'ETH-EUR']
+        fetching = []
+        release = asyncio.Event()
+
+        async def fetch_order_book(symbol, limit=None, params={}):
+            # Never fetched before the subscription is acknowledged.
+            self.assertTrue(self.exchange.connections[connect.opened[0]])
+            fetching.append(symbol)
+            await release.wait()
+            return {'bids': [[1.0, 1.0]], 'asks': [[3.0, 1.0]], 'timestamp': None, 'datetime': None, 'nonce': 5}
+
+        def delta(id, nonce, price):
+            return json.dumps({'event': 'book', 'market': id, 'nonce': nonce, 'bids': [[price, '1']], 'asks': []})
+
+        self.exchange.fetch_order_book = fetch_order_book
+        websocket = WebsocketMock([
+            json.dumps({'event': 'subscribed', 'subscriptions': {'book': ids}}),
+            delta(ids[0], 7, '2.5'),
+            delta(ids[0], 5, '0.5'),
+            delta(ids[0], 6, '2'),
+        ])
+        connect = ConnectMock([websocket])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_order_book(['BTC/USD', 'ETH/EUR']))
+            while len(fetching) < 2 or websocket.replies.qsize():
+                await asyncio.sleep(0)
+            # Both snapshots are in flight and the deltas are buffered.
+            self.assertEqual(['BTC/USD', 'ETH/EUR'], fetching)
+            self.assertEqual([7, 5, 6], [u['nonce'] for u in self.exchange.book_buffers['BTC/USD']])
+            release.set()
+            published = [await asyncio.wait_for(results.get(), 1) for _ in range(2)]
+            # A delta older than the book is discarded.
+            websocket.replies.put_nowait(delta(ids[0], 7, '0.7'))
+            while websocket.replies.qsize():
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await task
+
+        self.assertEqual([6, 7], [update['BTC/USD']['nonce'] for channel, update in published])
+        self.assertEqual([[2.5, 1.0], [2.0, 1.0], [1.0, 1.0]], self.exchange.order_book['BTC/USD']['bids'])
+        self.assertEqual([[1.0, 1.0]], self.exchange.order_book['ETH/EUR']['bids'])
+        self.assertEqual({}, self.exchange.book_buffers)
+        self.assertNotIn(websocket, self.exchange.pending_snapshots)
+
+    async def test_deltas_arriving_while_publishing_are_applied_in_order(self):
+        symbol = self.test_market['symbol']
+        # The result queue holds one result and is full.
+        self.exchange.result.put_nowait(('trades', []))
+        self.exchange.book_buffers[symbol] = []
+
+        def delta(nonce, amount):
+            reply = {'event': 'book', 'market': self.test_market['id'], 'nonce': nonce,
+                     'bids': [['10.0', amount]], 'asks': []}
+            return self.exchange.parse_order_book_ws(reply, self.test_market)
+
+        self.assertEqual([None, None, None], [delta(12, '2'), delta(11, '1'), delta(9, '9')])
+        snapshot = {'bids': [[10.0, 0.5]], 'asks': [], 'timestamp': None, 'datetime': None, 'nonce': 10}
+
+        task = asyncio.create_task(self.exchange.sync_order_book(symbol, snapshot))
+        await asyncio.sleep(0)
+        # Every buffered delta is applied before the first one is published.
+        self.assertEqual(12, self.exchange.order_book[symbol]['nonce'])
+        # A delta arriving meanwhile waits for the older ones.
+        self.assertIsNone(delta(13, '3'))
+        results = [await asyncio.wait_for(self.exchange.result.get(), 1) for _ in range(4)]
+        await task
+
+        self.assertEqual([11, 12, 13], [update[symbol]['nonce'] for channel, update in results[1:]])
+        self.assertEqual([[10.0, 3.0]], self.exchange.order_book[symbol]['bids'])
+        self.assertEqual(13, self.exchange.order_book[symbol]['nonce'])
+        self.assertEqual({}, self.exchange.book_buffers)
@@ -0,0 +1,28 @@
+import unittest
+
+from cryptoapi.base.codec import JsonCodec, get_codec
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec('unknown')
+
+    def test_auto_returns_a_codec(self):
+        self.assertIsInstance(get_codec('auto'), JsonCodec)
+
+    def test_codecs_round_trip_str_and_bytes(self):
+        message = {'event': 'subscribe', 'channel': 'book', 'len': 100}
+        frame = '[17082,[7254.7,3,3.3]]'
+        for name in ['json', 'orjson', 'ujson']:
+            try:
+                codec = get_codec(name)
+            except ImportError:
+                continue
+            with self.subTest(codec=name):
+                encoded = codec.encode(message)
+                self.assertIsInstance(encoded, str)
+                self.assertEqual(message, codec.decode(encoded))
+                self.assertEqual([17082, [7254.7, 3, 3.3]], codec.decode(frame))
+                self.assertEqual([17082, [7254.7, 3, 3.3]], codec.decode(frame.encode()))
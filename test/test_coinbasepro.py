@@ -1,7 +1,12 @@
+import asyncio
+import json
 import unittest
 
+from unittest.mock import patch
+from cryptoapi.base.consolidated import ConsolidatedBook
+from cryptoapi.base.order_book import L3OrderBook
 from cryptoapi.coinbasepro import Coinbasepro
-from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET
+from test.helpers import AsyncContextManager, AsyncMock, BOOK_METADATA, ConnectMock, TEST_MARKET, WebsocketMock
 
 
 class TestKraken(unittest.IsolatedAsyncioTestCase):
@@ -73,6 +78,38 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         }
         self.assertEqual([correct_registration], self.exchange.connections[websocket_mock])
 
+    def test_register_batched_channels(self):
+        eth_market = {**self.test_market, 'id': 'ETH-USD', 'symbol': 'ETH/USD'}
+        self.exchange.markets['ETH/USD'] = eth_market
+        self.exchange.markets_by_id['ETH-USD'] = eth_market
+        ids = [self.test_market['id'], 'ETH-USD']
+        websocket_mock = AsyncContextManager()
+        self.exchange.connections[websocket_mock] = []
+
+        # Replies list everything subscribed on the connection so far.
+        self.exchange.register_channel({
+            'type': 'subscriptions',
+            'channels': [{'name': 'ticker', 'product_ids': ids}]
+        }, websocket_mock)
+        self.exchange.register_channel({
+            'type': 'subscriptions',
+            'channels': [
+                {'name': 'ticker', 'product_ids': ids},
+                {'name': 'matches', 'product_ids': ids[:1]},
+                {'name': 'heartbeat', 'product_ids': ids[:1]}
+            ]
+        }, websocket_mock)
+
+        registered = [
+            (c['name'], c['symbol'], c['request']['channels'][0]['product_ids'])
+            for c in self.exchange.connections[websocket_mock]
+        ]
+        self.assertEqual([
+            (self.exchange.TICKER, 'BTC/USD', ['BTCUSD']),
+            (self.exchange.TICKER, 'ETH/USD', ['ETH-USD']),
+            (self.exchange.TRADES, 'BTC/USD', ['BTCUSD'])
+        ], registered)
+
     def test_parse_order_book_snapshot_ccxt_style(self):
         reply = {
             "type": "snapshot",
@@ -123,3 +160,140 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         }
         symbol = self.test_market['symbol']
         self.assertEqual(correct_update, update[symbol])
+
+    async def test_subscribe_batched_channels(self):
+        connect = ConnectMock([WebsocketMock()])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            tasks = [
+                asyncio.create_task(self.exchange.subscribe_order_book([self.test_market['symbol']], batch=True)),
+                asyncio.create_task(self.exchange.subscribe_ticker([self.test_market['symbol']], batch=True)),
+            ]
+            while len(connect.opened) < 2 or not all(w.sent for w in connect.opened):
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await asyncio.gather(*tasks)
+
+        names = sorted(json.loads(w.sent[0])['channels'][0]['name'] for w in connect.opened)
+        self.assertEqual(['level2_batch', 'ticker_batch'], names)
+
+    def test_batched_channels_route_like_unbatched(self):
+        id = self.test_market['id']
+        websocket_mock = AsyncContextManager()
+        self.exchange.connections[websocket_mock] = []
+
+        self.exchange.register_channel({
+            'type': 'subscriptions',
+            'channels': [{'name': 'level2_batch', 'product_ids': [id]}, {'name': 'ticker_batch', 'product_ids': [id]}]
+        }, websocket_mock)
+
+        channels = self.exchange.connections[websocket_mock]
+        self.assertEqual([('level2', id), ('ticker', id)], [c['ex_channel_id'] for c in channels])
+        self.assertEqual('level2_batch', channels[0]['request']['channels'][0]['name'])
+        reply = {'type': 'l2update', 'product_id': id, 'changes': [['buy', '10101.8', '0.16']]}
+        self.exchange.order_book[self.test_market['symbol']] = {'bids': [], 'asks': [], **BOOK_METADATA}
+        channel, update = self.exchange.parse_market_reply(reply, websocket_mock)
+        self.assertEqual([[10101.8, 0.16]], update[self.test_market['symbol']]['bids'])
+
+    def full_book(self):
+        symbol = self.test_market['symbol']
+        id = self.test_market['id']
+        self.exchange.l3_symbols.add(symbol)
+        websocket_mock = AsyncContextManager()
+        self.exchange.connections[websocket_mock] = []
+        self.exchange.register_channel({
+            'type': 'subscriptions',
+            'channels': [{'name': 'full', 'product_ids': [id]}]
+        }, websocket_mock)
+        self.assertEqual([symbol], self.exchange.pending_snapshots[websocket_mock])
+        self.exchange.update_order_book({
+            'bids': [[100.0, 1.0, 'a']],
+            'asks': [[101.0, 2.0, 'b']],
+            'nonce': 10,
+        }, self.test_market, snapshot=True)
+        return websocket_mock
+
+    def test_full_channel(self):
+        symbol = self.test_market['symbol']
+        id = self.test_market['id']
+        websocket_mock = self.full_book()
+        messages = [
+            {'type': 'received', 'sequence': 9, 'order_id': 'x', 'product_id': id},
+            {'type': 'received', 'sequence': 11, 'order_id': 'c', 'product_id': id},
+            {'type': 'open', 'sequence': 12, 'order_id': 'c', 'side': 'buy', 'price': '100.0',
+             'remaining_size': '0.5', 'product_id': id},
+            {'type': 'match', 'sequence': 13, 'maker_order_id': 'b', 'taker_order_id': 'y', 'size': '0.5',
+             'price': '101.0', 'side': 'sell', 'product_id': id, 'trade_id': 1, 'time': '2020-01-01T00:00:00Z'},
+            {'type': 'change', 'sequence': 14, 'order_id': 'a', 'new_size': '0.25', 'price': '100.0',
+             'side': 'buy', 'product_id': id},
+            {'type': 'done', 'sequence': 15, 'order_id': 'c', 'reason': 'canceled', 'side': 'buy',
+             'product_id': id},
+        ]
+
+        results = [self.exchange.parse_market_reply(m, websocket_mock) for m in messages]
+
+        self.assertEqual([None, None], results[:2])
+        self.assertEqual([
+            {'bids': [[100.0, 1.5]], 'asks': []},
+            {'bids': [], 'asks': [[101.0, 1.5]]},
+            {'bids': [[100.0, 0.75]], 'asks': []},
+            {'bids': [[100.0, 0.25]], 'asks': []},
+        ], [{k: r[1][symbol][k] for k in ['bids', 'asks']} for r in results[2:]])
+        self.assertIsInstance(self.exchange.order_book[symbol], L3OrderBook)
+        self.assertEqual(15, self.exchange.order_book[symbol]['nonce'])
+
+    def test_full_channel_notifies_listeners(self):
+        symbol = self.test_market['symbol']
+        websocket_mock = self.full_book()
+        book = ConsolidatedBook(symbol, {'coinbasepro': self.exchange})
+
+        self.exchange.parse_market_reply({
+            'type': 'open', 'sequence': 11, 'order_id': 'c', 'side': 'buy', 'price': '99.0',
+            'remaining_size': '0.5', 'product_id': self.test_market['id']
+        }, websocket_mock)
+
+        self.assertEqual([[100.0, 1.0, {'coinbasepro': 1.0}], [99.0, 0.5, {'coinbasepro': 0.5}]], book['bids'])
+        self.assertEqual([[101.0, 2.0, {'coinbasepro': 2.0}]], book['asks'])
+
+    def test_full_channel_gap_fetches_snapshot(self):
+        symbol = self.test_market['symbol']
+        websocket_mock = self.full_book()
+        del self.exchange.pending_snapshots[websocket_mock]
+        message = {'type': 'received', 'sequence': 12, 'order_id': 'c', 'product_id': self.test_market['id']}
+
+        self.assertIsNone(self.exchange.parse_market_reply(message, websocket_mock))
+
+        self.assertNotIn(symbol, self.exchange.order_book)
+        self.assertEqual([symbol], self.exchange.pending_snapshots[websocket_mock])
+        self.assertEqual(1, self.exchange.stats()['channels']['order_book']['sequence_gaps'])
+
+    def test_trades_take_over_full_matches(self):
+        symbol = self.test_market['symbol']
+        id = self.test_market['id']
+        websocket_mock = self.full_book()
+        self.exchange.register_channel({
+            'type': 'subscriptions',
+            'channels': [{'name': 'full', 'product_ids': [id]}, {'name': 'matches', 'product_ids': [id]}]
+        }, websocket_mock)
+        match = {'type': 'match', 'sequence': 11, 'maker_order_id': 'a', 'taker_order_id': 'y', 'size': '0.5',
+                 'price': '100.0', 'side': 'buy', 'product_id': id, 'trade_id': 1, 'time': '2020-01-01T00:00:00Z'}
+
+        channel, trades = self.exchange.parse_market_reply(match, websocket_mock)
+
+        self.assertEqual(self.exchange.TRADES, channel)
+        self.assertEqual([[100.0, 0.5]], self.exchange.order_book[symbol]['bids'])
+
+    async def test_fetch_level_3_snapshot(self):
+        symbol = self.test_market['symbol']
+        self.exchange.l3_symbols.add(symbol)
+        self.exchange.publicGetProductsIdBook = AsyncMock(return_value={
+            'sequence': 3,
+            'bids': [['100.0', '1.0', 'a']],
+            'asks': [['101.0', '2.0', 'b']],
+        })
+
+        snapshot = await self.exchange.fetch_snapshot(symbol)
+
+        self.exchange.publicGetProductsIdBook.assert_called_once_with({'id': self.test_market['id'], 'level': 3})
+        self.assertEqual([[100.0, 1.0, 'a']], snapshot['bids'])
+        self.assertEqual(3, snapshot['nonce'])
@@ -0,0 +1,80 @@
+import unittest
+
+from cryptoapi.base.consolidated import ConsolidatedBook
+from cryptoapi.base.hub import Hub
+from cryptoapi.bitfinex import Bitfinex
+from cryptoapi.kraken import Kraken
+from test.helpers import BOOK_METADATA, TEST_MARKET
+
+
+def update(bids=[], asks=[]):
+    return {'bids': bids, 'asks': asks, **BOOK_METADATA}
+
+
+class TestConsolidatedBook(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.kraken = Kraken()
+        self.bitfinex = Bitfinex()
+        self.kraken.update_order_book(update([[9, 1], [8, 1]], [[11, 1]]), TEST_MARKET, snapshot=True)
+        self.book = ConsolidatedBook('BTC/USD', {'kraken': self.kraken, 'bitfinex': self.bitfinex})
+
+    async def asyncTearDown(self):
+        await self.kraken.close()
+        await self.bitfinex.close()
+
+    async def test_levels_track_every_exchange(self):
+        self.bitfinex.update_order_book(update([[9, 2], [7, 1]], [[10, 3], [11, 1]]), TEST_MARKET, snapshot=True)
+
+        self.assertEqual([[9, 3, {'kraken': 1, 'bitfinex': 2}], [8, 1, {'kraken': 1}], [7, 1, {'bitfinex': 1}]],
+                         self.book['bids'])
+        self.assertEqual([[10, 3, {'bitfinex': 3}], [11, 2, {'kraken': 1, 'bitfinex': 1}]], self.book['asks'])
+        bbo = self.book.bbo()
+        self.assertEqual((9, 3, 10, 3), (bbo['bid'], bbo['bidVolume'], bbo['ask'], bbo['askVolume']))
+        self.assertEqual({'kraken': 1, 'bitfinex': 2}, bbo['bidExchanges'])
+        self.assertEqual({'bitfinex': 3}, bbo['askExchanges'])
+
+    async def test_deltas(self):
+        self.bitfinex.update_order_book(update([[9, 2]], [[10, 3]]), TEST_MARKET, snapshot=True)
+        top = self.book.top()
+
+        self.bitfinex.update_order_book(update([[9, 0]], [[10, 0], [12, 1]]), TEST_MARKET)
+        self.kraken.update_order_book(update([[8, 2], [9.5, 1]], [[13, 0]]), TEST_MARKET)
+
+        self.assertEqual([[9.5, 1, {'kraken': 1}], [9, 1, {'kraken': 1}], [8, 2, {'kraken': 2}]], self.book['bids'])
+        self.assertEqual([[11, 1, {'kraken': 1}], [12, 1, {'bitfinex': 1}]], self.book['asks'])
+        self.assertEqual((9.5, 11), (self.book.bbo()['bid'], self.book.bbo()['ask']))
+        # Earlier copies keep their levels.
+        self.assertEqual([9, 3, {'kraken': 1, 'bitfinex': 2}], top['bids'][0])
+
+    async def test_snapshot_replaces_and_drop_removes_the_exchange(self):
+        self.bitfinex.update_order_book(update([[9, 2]], [[10, 3]]), TEST_MARKET, snapshot=True)
+
+        self.kraken.update_order_book(update([[7, 1]], []), TEST_MARKET, snapshot=True)
+
+        self.assertEqual([[9, 2, {'bitfinex': 2}], [7, 1, {'kraken': 1}]], self.book['bids'])
+        self.assertEqual([[10, 3, {'bitfinex': 3}]], self.book['asks'])
+
+        self.bitfinex.drop_order_books(['BTC/USD'])
+
+        self.assertEqual([[7, 1, {'kraken': 1}]], self.book['bids'])
+        self.assertEqual([], self.book['asks'])
+        self.assertIsNone(self.book.bbo()['ask'])
+
+        self.book.detach('kraken')
+        self.kraken.update_order_book(update([[8, 1]], []), TEST_MARKET)
+
+        self.assertEqual([], self.book['bids'])
+        self.assertEqual([], self.kraken.order_book_listeners)
+
+    async def test_hub_consolidated_book(self):
+        spec = [
+            {'exchange': 'kraken', 'channel': 'order_book', 'symbols': ['BTC/USD']},
+            {'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['BTC/USD']},
+        ]
+        hub = Hub(spec, exchanges={'kraken': self.kraken, 'bitfinex': self.bitfinex})
+
+        book = hub.consolidated_book('BTC/USD')
+
+        self.assertEqual(['kraken'], list(book.listeners))
+        self.assertEqual([[9, 1, {'kraken': 1}], [8, 1, {'kraken': 1}]], book['bids'])
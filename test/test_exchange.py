@@ -1,7 +1,10 @@
+import asyncio
 import unittest
 
+from aiolimiter import AsyncLimiter
+from unittest.mock import patch
 from cryptoapi.base.exchange import Exchange
-from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET
+from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET, WebsocketMock
 
 
 class TestExchange(unittest.IsolatedAsyncioTestCase):
@@ -14,6 +17,21 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
         symbol = self.test_market['symbol']
         self.assertEqual(self.exchange.build_requests(symbol, self.exchange.TICKER), [])
 
+    def test_batch_ids(self):
+        self.exchange.max_channels = 3
+        self.exchange.max_symbols_per_request = 2
+        ids = ['a', 'b', 'c']
+
+        self.assertEqual([['a'], ['b'], ['c']], self.exchange.batch_ids(ids))
+        self.exchange.batch_requests = True
+        self.assertEqual([['a', 'b'], ['c']], self.exchange.batch_ids(ids))
+
+    def test_shard_requests(self):
+        self.exchange.max_channels = 2
+        requests = [{'id': i} for i in range(3)]
+
+        self.assertEqual([requests[:2], requests[2:]], self.exchange.shard_requests(requests))
+
     def test_snapshot_updates_order_book(self):
         snapshot = {
             'bids': [[1, 1]],
@@ -127,10 +145,7 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(0, self.exchange.claim_channel_id())
 
     def test_claim_nonfirst_channel_id(self):
-        channel_id = 0
-        self.exchange.connections = {
-            AsyncContextManager(): [{'channel_id': channel_id}]
-        }
+        channel_id = self.exchange.claim_channel_id()
 
         self.assertEqual(channel_id + 1, self.exchange.claim_channel_id())
 
@@ -146,3 +161,171 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
         }
 
         self.assertEqual([channel], self.exchange.get_channels())
+
+    async def test_put_result_routes_by_symbol(self):
+        symbol = self.test_market['symbol']
+        self.exchange.result = None
+        symbol_queue = self.exchange.result_queue(self.exchange.TICKER, symbol)
+        channel_queue = self.exchange.result_queue(self.exchange.TICKER)
+
+        await self.exchange.put_result((self.exchange.TICKER, 'BTC'), symbol)
+        await self.exchange.put_result((self.exchange.TICKER, 'ETH'), 'ETH/USD')
+
+        self.assertEqual((self.exchange.TICKER, 'BTC'), symbol_queue.get_nowait())
+        self.assertEqual((self.exchange.TICKER, 'ETH'), channel_queue.get_nowait())
+
+    async def test_put_result_fans_in(self):
+        symbol = self.test_market['symbol']
+        queue = self.exchange.result_queue(self.exchange.TICKER, symbol)
+
+        await self.exchange.put_result((self.exchange.TICKER, 'BTC'), symbol)
+
+        self.assertEqual(queue.get_nowait(), self.exchange.result.get_nowait())
+
+    async def test_put_result_counts_queue_full_waits(self):
+        await self.exchange.put_result((self.exchange.TICKER, 'BTC'))
+        task = asyncio.create_task(self.exchange.put_result((self.exchange.TICKER, 'ETH')))
+        await asyncio.sleep(0)
+        self.exchange.result.get_nowait()
+        await task
+
+        self.assertEqual(1, self.exchange.stats()['channels']['ticker']['queue_full_waits'])
+
+    async def test_subscribe_connects_every_shard_concurrently(self):
+        self.exchange.max_channels = 2
+        self.exchange.max_connections['public'] = AsyncLimiter(10, 1)
+        websockets = []
+
+        async def connect(endpoint):
+            websockets.append(WebsocketMock())
+            return websockets[-1]
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            requests = [{'id': i} for i in range(5)]
+            task = asyncio.create_task(self.exchange.subscribe(requests, public=True))
+            while sum(len(w.sent) for w in websockets) < len(requests):
+                await asyncio.sleep(0)
+
+            self.assertEqual([2, 2, 1], [len(w.sent) for w in websockets])
+
+            # Cancelling the connections ends the subscription.
+            await self.exchange.supervisor.cancel()
+            await task
+        self.assertEqual({}, self.exchange.connections)
+        self.assertTrue(all(w.closed for w in websockets))
+
+    def test_add_channel_fills_routes(self):
+        symbol = self.test_market['symbol']
+        self.exchange.markets = {symbol: self.test_market}
+        channel = {'ex_channel_id': 7, 'name': self.exchange.TICKER, 'symbol': symbol}
+        websocket_mock = AsyncContextManager()
+        self.exchange.connections[websocket_mock] = []
+
+        self.exchange.add_channel(channel, websocket_mock)
+
+        route = self.exchange.routes[websocket_mock][7]
+        self.assertEqual([channel], self.exchange.connections[websocket_mock])
+        self.assertIs(channel, route['channel'])
+        self.assertIs(self.test_market, route['market'])
+        self.assertEqual(symbol, route['symbol'])
+        self.assertEqual(self.exchange.parse_ticker_ws, route['parse'])
+
+    def test_reconnect_delay_backs_off_with_jitter(self):
+        self.exchange.reconnect_delay_min = 1
+        self.exchange.reconnect_delay_max = 8
+
+        for attempt, ceiling in [(0, 1), (1, 2), (2, 4), (3, 8), (10, 8)]:
+            delays = [self.exchange.reconnect_delay(attempt) for _ in range(50)]
+            self.assertTrue(all(ceiling / 2 <= d <= ceiling for d in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+    async def test_watchdog_closes_stale_websocket(self):
+        self.exchange.stale_timeout = 0.01
+        websocket = WebsocketMock()
+        self.exchange.connections[websocket] = []
+
+        await asyncio.wait_for(self.exchange.run_consumer(websocket), 1)
+
+        self.assertTrue(websocket.closed)
+
+    def test_update_order_book_without_snapshot(self):
+        update = {'bids': [[1, 1]], 'asks': [], **BOOK_METADATA}
+
+        self.assertFalse(self.exchange.update_order_book(update, self.test_market))
+        self.assertEqual({}, self.exchange.order_book)
+
+    async def put_book_update(self, bids):
+        update = {'bids': bids, 'asks': [], **BOOK_METADATA}
+        self.exchange.update_order_book(update, self.test_market)
+        await self.exchange.put_result((self.exchange.ORDER_BOOK, {self.test_market['symbol']: update}),
+                                       self.test_market['symbol'])
+
+    async def test_conflate_publishes_top_levels_on_change(self):
+        symbol = self.test_market['symbol']
+        self.exchange.result = None
+        queue = self.exchange.result_queue(self.exchange.ORDER_BOOK, maxsize=10)
+        self.exchange.conflate_order_books([symbol], top=1)
+        snapshot = {'bids': [[10, 1], [9, 1]], 'asks': [[11, 1]], **BOOK_METADATA}
+        self.exchange.update_order_book(snapshot, self.test_market, snapshot=True)
+
+        await self.put_book_update([[10, 2]])
+        await self.put_book_update([[9, 5]])  # Below the top level.
+        await self.put_book_update([[12, 1]])
+
+        published = [queue.get_nowait()[1][symbol] for _ in range(queue.qsize())]
+        self.assertEqual([[[10, 2]], [[12, 1]]], [p['bids'] for p in published])
+        self.assertEqual([[[11, 1]], [[11, 1]]], [p['asks'] for p in published])
+
+    async def test_conflate_publishes_at_most_once_per_interval(self):
+        symbol = self.test_market['symbol']
+        self.exchange.result = None
+        queue = self.exchange.result_queue(self.exchange.ORDER_BOOK, maxsize=10)
+        self.exchange.conflate_order_books([symbol], top=2, interval=0.05)
+        self.exchange.update_order_book({'bids': [], 'asks': [], **BOOK_METADATA}, self.test_market, snapshot=True)
+
+        for price in range(1, 5):
+            await self.put_book_update([[price, 1]])
+        self.assertEqual(1, queue.qsize())
+        await asyncio.sleep(0.1)
+
+        published = [queue.get_nowait()[1][symbol]['bids'] for _ in range(queue.qsize())]
+        self.assertEqual([[[1, 1]], [[4, 1], [3, 1]]], published)
+
+    async def test_bbo_events_only_on_change(self):
+        symbol = self.test_market['symbol']
+        self.exchange.result = None
+        queue = self.exchange.result_queue(self.exchange.BBO, maxsize=10)
+        snapshot = {'bids': [[10, 1], [9, 1]], 'asks': [[11, 1]], **BOOK_METADATA}
+        self.exchange.update_order_book(snapshot, self.test_market, snapshot=True)
+
+        await self.put_book_update([[10, 2]])
+        await self.put_book_update([[9, 5]])  # Below the best bid.
+        await self.put_book_update([[10, 0]])
+
+        published = [queue.get_nowait()[1][symbol] for _ in range(queue.qsize())]
+        self.assertEqual([(10, 2), (9, 5)], [(p['bid'], p['bidVolume']) for p in published])
+        self.assertEqual(2, published[-1]['spread'])
+        self.assertEqual(published[-1], self.exchange.bbo(symbol))
+
+    async def test_no_bbo_events_without_queue(self):
+        self.exchange.update_order_book({'bids': [[10, 1]], 'asks': [], **BOOK_METADATA}, self.test_market,
+                                        snapshot=True)
+
+        await self.put_book_update([[10, 2]])
+
+        self.assertEqual(self.exchange.ORDER_BOOK, self.exchange.result.get_nowait()[0])
+        self.assertEqual({}, self.exchange.published_bbo)
+
+    async def test_resync_without_unsubscribe_reopens_the_connection(self):
+        symbol = self.test_market['symbol']
+        websocket = WebsocketMock()
+        self.exchange.order_book[symbol] = {'bids': [], 'asks': [], **BOOK_METADATA}
+        channel = {'name': self.exchange.ORDER_BOOK, 'symbol': symbol, 'request': {}}
+        self.exchange.find_order_book_channels = lambda symbol: [(websocket, channel)]
+
+        self.exchange.resync_order_book(symbol)
+        await self.exchange.supervisor.wait()
+
+        self.assertNotIn(symbol, self.exchange.order_book)
+        self.assertTrue(websocket.closed)
+        self.assertEqual([], websocket.sent)
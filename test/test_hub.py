@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from unittest.mock import patch
+from ccxt.base.errors import BadSymbol
+from ccxt.base.errors import ExchangeError
+from cryptoapi.base.hub import Hub
+from cryptoapi.bitfinex import Bitfinex
+from cryptoapi.kraken import Kraken
+from test.helpers import AsyncMock, TEST_MARKET, WebsocketMock
+
+KRAKEN_MARKET = {**TEST_MARKET, 'info': {'wsname': 'XBT/USD'}}
+
+
+class Endpoints:
+    """Stands in for websockets.connect, one websocket per endpoint."""
+
+    def __init__(self, websockets):
+        self.websockets = websockets
+
+    async def __call__(self, endpoint):
+        return self.websockets[endpoint]
+
+
+class TestHub(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.kraken = Kraken({'reconnect': False})
+        self.kraken.markets = {KRAKEN_MARKET['symbol']: KRAKEN_MARKET}
+        self.kraken.load_markets = AsyncMock()
+        self.bitfinex = Bitfinex({'reconnect': False})
+        self.bitfinex.markets = {TEST_MARKET['symbol']: TEST_MARKET}
+        self.bitfinex.markets_by_id = {TEST_MARKET['id']: TEST_MARKET}
+        self.bitfinex.load_markets = AsyncMock()
+        self.spec = [
+            {'exchange': 'kraken', 'channel': 'trades', 'symbols': ['BTC/USD']},
+            {'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['BTC/USD']},
+        ]
+        self.exchanges = {'kraken': self.kraken, 'bitfinex': self.bitfinex}
+
+    def endpoints(self, kraken_replies, bitfinex_replies):
+        kraken = json.dumps({"channelID": 2, "event": "subscriptionStatus", "pair": "XBT/USD",
+                             "status": "subscribed", "subscription": {"name": "trade"}})
+        bitfinex = json.dumps({"event": "subscribed", "channel": "trades", "chanId": 5,
+                               "symbol": TEST_MARKET['id'], "pair": TEST_MARKET['id']})
+        return Endpoints({
+            self.kraken.ws_endpoint['public']: WebsocketMock([kraken, *kraken_replies]),
+            self.bitfinex.ws_endpoint['public']: WebsocketMock([bitfinex, *bitfinex_replies]),
+        })
+
+    async def test_merged_stream(self):
+        kraken_trade = json.dumps([2, [["5541.2", "0.1", "1534614057.321597", "s", "l", ""]], "trade", "XBT/USD"])
+        bitfinex_trade = json.dumps([5, 'te', [401597393, 1574694475039, 0.005, 7244.9]])
+        endpoints = self.endpoints([kraken_trade, None], [bitfinex_trade, None])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', endpoints):
+            async with Hub(self.spec, exchanges=self.exchanges) as hub:
+                results = [result async for result in hub]
+
+        self.kraken.load_markets.assert_called_once()
+        self.assertEqual(
+            [('bitfinex', 'trades', 'BTC/USD', 7244.9), ('kraken', 'trades', 'BTC/USD', 5541.2)],
+            sorted((e, c, s, data[0]['price']) for e, c, s, data in results)
+        )
+        self.assertIsNone(self.kraken.result)
+
+    async def test_failure_closes_every_subscription(self):
+        endpoints = self.endpoints([ExchangeError('down')], [])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', endpoints):
+            async with Hub(self.spec, exchanges=self.exchanges) as hub:
+                with self.assertRaises(ExchangeError):
+                    await hub.get()
+
+        self.assertEqual(set(), hub.supervisor.tasks)
+        self.assertEqual(set(), self.bitfinex.supervisor.tasks)
+
+    async def test_unknown_symbol(self):
+        spec = [{'exchange': 'kraken', 'channel': 'trades', 'symbols': ['ETH/USD']}]
+
+        with self.assertRaises(BadSymbol):
+            async with Hub(spec, exchanges=self.exchanges):
+                pass
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+import unittest
+
+
+def run(code):
+    # A fresh interpreter, so nothing is imported yet.
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+
+
+class TestImports(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        output = run(
+            'import sys, cryptoapi\n'
+            'print("ccxt" in sys.modules, "cryptoapi.kraken" in sys.modules)\n'
+            'cryptoapi.Kraken\n'
+            'print("cryptoapi.kraken" in sys.modules, "cryptoapi.bitfinex" in sys.modules)\n'
+        )
+
+        self.assertEqual(['False', 'False', 'True', 'False'], output)
+
+    def test_public_names(self):
+        output = run(
+            'import cryptoapi\n'
+            'from cryptoapi import *\n'
+            'print(cryptoapi.exchanges == ["Bitfinex", "Bitvavo", "Coinbasepro", "Kraken"])\n'
+            'print(all(hasattr(cryptoapi, name) for name in cryptoapi.__all__))\n'
+            'print(Kraken.__name__, Exchange.__name__, NetworkError.__name__, Reconnect.__name__)\n'
+            'print(issubclass(cryptoapi.Bitfinex, cryptoapi.Exchange))\n'
+        )
+
+        self.assertEqual(['True', 'True', 'Kraken', 'Exchange', 'NetworkError', 'Reconnect', 'True'], output)
@@ -1,7 +1,14 @@
+import asyncio
+import json
+import tempfile
 import unittest
+import zlib
 
+from unittest.mock import patch
 from cryptoapi.kraken import Kraken
-from test.helpers import AsyncContextManager, BOOK_METADATA, TEST_MARKET
+from cryptoapi.base.errors import UnknownResponse
+from cryptoapi.base.recorder import read_frames
+from test.helpers import AsyncContextManager, BOOK_METADATA, ConnectMock, TEST_MARKET, WebsocketMock
 
 
 # Kraken's websocket api uses different ids
@@ -31,6 +38,19 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         }]
         self.assertEqual(correct_requests, requests)
 
+    def test_build_batched_requests(self):
+        self.exchange.batch_requests = True
+        self.exchange.max_channels = 2
+        eth_market = {**self.test_market, 'symbol': 'ETH/USD', 'info': {'wsname': 'ETH/USD'}}
+        ltc_market = {**self.test_market, 'symbol': 'LTC/USD', 'info': {'wsname': 'LTC/USD'}}
+        self.exchange.markets.update({'ETH/USD': eth_market, 'LTC/USD': ltc_market})
+        symbols = [self.test_market['symbol'], 'ETH/USD', 'LTC/USD']
+
+        requests = self.exchange.build_requests(symbols, self.exchange.TICKER)
+
+        self.assertEqual([['XBT/USD', 'ETH/USD'], ['LTC/USD']], [r['pair'] for r in requests])
+        self.assertEqual([[requests[0]], [requests[1]]], self.exchange.shard_requests(requests))
+
     def test_ex_channel_id_from_reply(self):
         correct_ex_channel_id = 42
         reply = [
@@ -76,7 +96,7 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         correct_registration = [{
             'request': {
                 'event': 'subscribe',
-                'pair': id,
+                'pair': [id],
                 'subscription': reply['subscription']
             },
             'channel_id': 0,
@@ -114,7 +134,7 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         correct_registration = [{
             'request': {
                 'event': 'subscribe',
-                'pair': id,
+                'pair': [id],
                 'subscription': reply['subscription']
             },
             'channel_id': 0,
@@ -126,6 +146,253 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
         }]
         self.assertEqual(correct_registration, self.exchange.connections[websocket_mock])
 
+    async def test_reconnect_replays_registered_requests(self):
+        self.exchange.reconnect_delay = lambda attempt: 0
+        symbol = self.test_market['symbol']
+        wsname = self.test_market['info']['wsname']
+        subscribed = {
+            "channelID": 10,
+            "channelName": "book-10",
+            "event": "subscriptionStatus",
+            "pair": wsname,
+            "status": "subscribed",
+            "subscription": {"name": "book", "depth": 10}
+        }
+        # The first connection drops right after the subscription.
+        connect = ConnectMock([WebsocketMock([json.dumps(subscribed), None])])
+        self.exchange.order_book[symbol] = {'bids': [], 'asks': [], **BOOK_METADATA}
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_order_book([symbol], depth=10))
+            while len(connect.opened) < 2 or not connect.opened[1].sent:
+                await asyncio.sleep(0)
+
+            self.assertEqual([{
+                'event': 'subscribe',
+                'pair': [wsname],
+                'subscription': {'name': 'book', 'depth': 10}
+            }], [json.loads(m) for m in connect.opened[1].sent])
+            # The stale book is dropped until the new snapshot arrives.
+            self.assertNotIn(symbol, self.exchange.order_book)
+            await self.exchange.supervisor.cancel()
+            await task
+
+    async def test_no_reconnect_returns_when_closed(self):
+        self.exchange.reconnect = False
+        connect = ConnectMock([WebsocketMock([None])])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            await asyncio.wait_for(self.exchange.subscribe_ticker([self.test_market['symbol']]), 1)
+
+        self.assertEqual(1, len(connect.opened))
+
+    async def test_no_reconnect_raises_errors(self):
+        self.exchange.reconnect = False
+        connect = ConnectMock([WebsocketMock([OSError('reset')])])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            with self.assertRaises(OSError):
+                await asyncio.wait_for(self.exchange.subscribe_ticker([self.test_market['symbol']]), 1)
+
+    async def test_record_frames(self):
+        with tempfile.TemporaryDirectory() as path:
+            exchange = Kraken({'record': path})
+            exchange.markets = self.exchange.markets
+            heartbeat = '{"event":"heartbeat"}'
+            websocket = WebsocketMock([heartbeat, None])
+            exchange.connection_ids[websocket] = 3
+
+            await exchange.consumer(websocket)
+            await exchange.close()
+
+            records = list(read_frames(path))
+        self.assertEqual([{'c': 3, 'e': 'kraken', 'f': heartbeat}], [
+            {k: v for k, v in r.items() if k != 't'} for r in records
+        ])
+
+    async def test_latency_stages(self):
+        exchange = Kraken({'latency': True})
+        exchange.markets = self.exchange.markets
+        exchange.result = None
+        subscribed = {
+            "channelID": 2,
+            "event": "subscriptionStatus",
+            "pair": "XBT/USD",
+            "status": "subscribed",
+            "subscription": {"name": "trade"}
+        }
+        trade = [2, [["5541.20000", "0.15850568", "1534614057.321597", "s", "l", ""]], "trade", "XBT/USD"]
+        websocket = WebsocketMock([json.dumps(subscribed), json.dumps(trade), None])
+        exchange.connections[websocket] = []
+
+        await exchange.consumer(websocket)
+        await exchange.close()
+
+        snapshot = exchange.latency.snapshot()
+        self.assertEqual(['trades'], list(snapshot))
+        stages = exchange.latency.STAGES
+        self.assertEqual([s for s in stages if s != 'book'], list(snapshot['trades']))
+        self.assertEqual({1}, {s['count'] for s in snapshot['trades'].values()})
+        # Kraken's trade time is far in the past.
+        self.assertGreater(snapshot['trades']['exchange']['min'], 10 ** 9)
+
+    async def test_stats(self):
+        self.exchange.result = None
+        subscribed = {
+            "channelID": 2,
+            "event": "subscriptionStatus",
+            "pair": "XBT/USD",
+            "status": "subscribed",
+            "subscription": {"name": "trade"}
+        }
+        trade = json.dumps([2, [["5541.20000", "0.15850568", "1534614057.321597", "s", "l", ""]], "trade", "XBT/USD"])
+        heartbeat = '{"event":"heartbeat"}'
+        unknown = '[3,{},"ticker","XBT/USD"]'
+        websocket = WebsocketMock([json.dumps(subscribed), trade, heartbeat, unknown])
+        self.exchange.connections[websocket] = []
+        self.exchange.connection_ids[websocket] = 5
+
+        with self.assertRaises(UnknownResponse):
+            await self.exchange.consumer(websocket)
+
+        stats = self.exchange.stats()
+        self.assertEqual({5: {
+            'messages': 4,
+            'bytes': len(json.dumps(subscribed)) + len(trade) + len(heartbeat) + len(unknown),
+            'heartbeats': 1,
+            'parse_errors': 0,
+            'unknown_responses': 1,
+            'channels': 1,
+        }}, stats['connections'])
+        self.assertEqual({'trades': {
+            'messages': 1,
+            'bytes': len(trade),
+            'parse_errors': 0,
+            'queue_full_waits': 0,
+            'checksum_errors': 0,
+            'sequence_gaps': 0,
+        }}, stats['channels'])
+        self.assertIn('cryptoapi_channel_messages_total{exchange="kraken",channel="trades"} 1\n',
+                      self.exchange.metrics_text())
+
+    async def test_order_book_depth(self):
+        symbol = self.test_market['symbol']
+        self.exchange.verify_checksums = False
+        connect = ConnectMock([WebsocketMock()])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_order_book([symbol], depth=10, limit=2))
+            while not connect.opened or not connect.opened[0].sent:
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await task
+
+        self.assertEqual(10, json.loads(connect.opened[0].sent[0])['subscription']['depth'])
+        self.assertEqual(10, self.exchange.order_book_depth[symbol])
+        snapshot = [0, {
+            "as": [[f"{5541.3 + i}", "1.0", "1534614248.123678"] for i in range(11)],
+            "bs": [[f"{5541.2 - i}", "1.0", "1534614248.123678"] for i in range(3)],
+        }, "book-10", "XBT/USD"]
+        self.exchange.parse_order_book_ws(snapshot, self.test_market)
+        update = [0, {"b": [["5541.25000", "1.0", "1534614335.345903"]]}, "book-10", "XBT/USD"]
+        self.exchange.parse_order_book_ws(update, self.test_market)
+        order_book = self.exchange.order_book[symbol]
+        # The window of 10 levels is kept, the limit caps what's read.
+        self.assertEqual(10, len(order_book['asks']))
+        self.assertEqual(4, len(order_book['bids']))
+        self.assertEqual([5541.25, 5541.2], [level[0] for level in order_book.top()['bids']])
+        self.assertEqual(2, len(order_book.top()['asks']))
+
+    async def test_order_book_limit_keeps_checksum_levels(self):
+        symbol = self.test_market['symbol']
+        connect = ConnectMock([WebsocketMock()])
+
+        with patch('cryptoapi.base.exchange.websockets.connect', connect):
+            task = asyncio.create_task(self.exchange.subscribe_order_book([symbol], depth=25, limit=2))
+            while not connect.opened or not connect.opened[0].sent:
+                await asyncio.sleep(0)
+            await self.exchange.supervisor.cancel()
+            await task
+
+        # The smallest depth holding 2 levels, kept whole.
+        self.assertEqual(10, json.loads(connect.opened[0].sent[0])['subscription']['depth'])
+        self.assertEqual(10, self.exchange.order_book_depth[symbol])
+        self.exchange.result = None
+        asks = [[f"{5541.3 + i:.5f}", "1.00000000", "1534614248.123678"] for i in range(11)]
+        bids = [[f"{5541.2 - i:.5f}", "2.00000000", "1534614248.123678"] for i in range(10)]
+        snapshot = [0, {"as": asks[:10], "bs": bids}, "book-10", "XBT/USD"]
+        self.exchange.parse_order_book_ws(snapshot, self.test_market)
+        # Removing the best ask brings the next level into the window.
+        removed = [asks[0][0], "0.00000000", "1534614335.345903"]
+        update = [0, {"a": [removed, asks[10]], "c": self.checksum(asks[1:], bids)}, "book-10", "XBT/USD"]
+
+        self.assertIsNotNone(self.exchange.parse_order_book_ws(update, self.test_market))
+
+        self.assertEqual(0, self.exchange.channel_counters('order_book')['checksum_errors'])
+        order_book = self.exchange.order_book[symbol]
+        self.assertEqual(10, len(order_book['asks']))
+        self.assertEqual([[5542.3, 1.0], [5543.3, 1.0]], [level[:2] for level in order_book.top()['asks']])
+
+    def checksum_book(self):
+        self.exchange.result = None
+        asks = [[f"{5541.3 + i:.5f}", f"{1 + i / 1000:.8f}", "1534614248.123678"] for i in range(12)]
+        bids = [[f"{5541.2 - i:.5f}", f"{2 + i / 1000:.8f}", "1534614248.123678"] for i in range(12)]
+        self.exchange.parse_order_book_ws([0, {"as": asks, "bs": bids}, "book-25", "XBT/USD"], self.test_market)
+        return asks, bids
+
+    @staticmethod
+    def checksum(asks, bids):
+        tokens = [
+            (price.replace('.', '').lstrip('0') + amount.replace('.', '').lstrip('0'))
+            for price, amount, _ in asks[:10] + bids[:10]
+        ]
+        return str(zlib.crc32(''.join(tokens).encode()))
+
+    def test_verify_checksum_of_two_sided_update(self):
+        asks, bids = self.checksum_book()
+        ask = ["5541.80000", "0.50000000", "1534614335.345903"]
+        bid = ["5540.20000", "0.00000000", "1534614335.345903"]
+        expected_asks = sorted(asks[:5] + [ask] + asks[5:], key=lambda level: float(level[0]))
+        expected_bids = bids[:1] + bids[2:]
+        update = [0, {"a": [ask]}, {"b": [bid], "c": self.checksum(expected_asks, expected_bids)}, "book-25", "XBT/USD"]
+
+        channel, parsed = self.exchange.parse_order_book_ws(update, self.test_market)
+
+        self.assertEqual([[5541.8, 0.5, 1534614335.345903]], parsed['BTC/USD']['asks'])
+        self.assertEqual(0, self.exchange.channel_counters('order_book')['checksum_errors'])
+
+    async def test_checksum_mismatch_resubscribes_the_pair(self):
+        subscribed = {
+            "channelID": 0,
+            "event": "subscriptionStatus",
+            "pair": "XBT/USD",
+            "status": "subscribed",
+            "subscription": {"name": "book", "depth": 25}
+        }
+        websocket = WebsocketMock([json.dumps(subscribed), None])
+        self.exchange.connections[websocket] = []
+        await self.exchange.consumer(websocket)
+        self.checksum_book()
+        update = [0, {"a": [["5541.80000", "0.50000000", "1534614335.345903"]], "c": "12345"}, "book-25", "XBT/USD"]
+
+        self.assertIsNone(self.exchange.parse_order_book_ws(update, self.test_market))
+        await self.exchange.supervisor.wait()
+
+        self.assertNotIn('BTC/USD', self.exchange.order_book)
+        self.assertEqual(1, self.exchange.stats()['channels']['order_book']['checksum_errors'])
+        request = {'event': 'subscribe', 'pair': ['XBT/USD'], 'subscription': {'name': 'book', 'depth': 25}}
+        self.assertEqual([{**request, 'event': 'unsubscribe'}, request], [json.loads(m) for m in websocket.sent])
+        unsubscribed = {**subscribed, 'status': 'unsubscribed'}
+        self.exchange.parse_general_reply(unsubscribed, websocket)
+        self.assertEqual([], self.exchange.connections[websocket])
+        self.assertEqual({}, self.exchange.routes[websocket])
+
+    def test_drop_order_book_update_without_snapshot(self):
+        reply = [1234, {"b": [["5541.30000", "1.00000000", "1534614335.345903"]]}, "book-10", "XBT/USD"]
+
+        self.assertIsNone(self.exchange.parse_order_book_ws(reply, self.test_market))
+        self.assertNotIn(self.test_market['symbol'], self.exchange.order_book)
+
     def test_parse_order_book_snapshot_ccxt_style(self):
         reply = [
             0,
@@ -179,7 +446,8 @@ class TestKraken(unittest.IsolatedAsyncioTestCase):
                         "1534614335.345903"
                     ]
                 ],
-                "c": "974942666"
+                # CRC32 of "554130000" "100000000".
+                "c": "1966312271"
             },
             "book-10",
             "XBT/USD"
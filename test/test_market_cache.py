@@ -0,0 +1,98 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+
+from ccxt.base.errors import NetworkError
+from cryptoapi.base.market_cache import MarketCache
+from cryptoapi.kraken import Kraken
+from test.helpers import AsyncMock, TEST_MARKET
+
+KRAKEN_MARKET = {**TEST_MARKET, 'info': {**TEST_MARKET['info'], 'wsname': 'XBT/USD'}}
+
+
+class TestMarketCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = MarketCache(self.directory.name, ttl=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_read(self):
+        self.cache.write('kraken', [KRAKEN_MARKET], {'BTC': {'id': 'XBT', 'code': 'BTC'}})
+
+        entry = self.cache.read('kraken')
+
+        self.assertEqual([KRAKEN_MARKET], entry['markets'])
+        self.assertEqual({'BTC': {'id': 'XBT', 'code': 'BTC'}}, entry['currencies'])
+        self.assertFalse(self.cache.expired(entry))
+        self.assertTrue(self.cache.expired({**entry, 'time': entry['time'] - 61}))
+        self.assertEqual(['kraken-markets.json.gz'], os.listdir(self.directory.name))
+
+    def test_missing_or_unreadable(self):
+        self.assertIsNone(self.cache.read('kraken'))
+        with open(self.cache.file('kraken'), 'wb') as file:
+            file.write(b'not gzip')
+        self.assertIsNone(self.cache.read('kraken'))
+        with gzip.open(self.cache.file('kraken'), 'wb') as file:
+            file.write(b'{"version": 0}')
+        self.assertIsNone(self.cache.read('kraken'))
+
+
+class TestLoadMarkets(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.exchange = self.create_exchange()
+
+    async def asyncTearDown(self):
+        await self.exchange.close()
+        self.directory.cleanup()
+
+    def create_exchange(self, markets=[KRAKEN_MARKET]):
+        exchange = Kraken({'market_cache': self.directory.name, 'market_cache_ttl': 60})
+        exchange.fetch_markets = AsyncMock(return_value=[dict(m) for m in markets])
+        exchange.fetch_currencies = AsyncMock(return_value={})
+        return exchange
+
+    async def test_warm_start_from_cache(self):
+        await self.exchange.load_markets()
+        self.exchange.fetch_markets.assert_called_once()
+
+        warm = self.create_exchange()
+        markets = await warm.load_markets()
+        await warm.close()
+
+        warm.fetch_markets.assert_not_called()
+        self.assertEqual(['BTC/USD'], list(markets))
+        self.assertEqual('BTC/USD', warm.markets_by_id['BTCUSD']['symbol'])
+        self.assertEqual('BTC/USD', warm.markets_by_wsnames['XBT/USD']['symbol'])
+
+    async def test_expired_markets_are_refreshed_in_the_background(self):
+        eth_market = {**KRAKEN_MARKET, 'id': 'ETHUSD', 'symbol': 'ETH/USD', 'base': 'ETH', 'baseId': 'ETH'}
+        self.exchange.market_cache.write('kraken', [KRAKEN_MARKET], {})
+        entry = self.exchange.market_cache.read('kraken')
+        self.exchange.market_cache.write = lambda *args: None
+        self.exchange.market_cache.read = lambda id: {**entry, 'time': entry['time'] - 61}
+        self.exchange.fetch_markets = AsyncMock(return_value=[KRAKEN_MARKET, eth_market])
+
+        markets = await self.exchange.load_markets()
+
+        # The expired markets are used right away.
+        self.assertEqual(['BTC/USD'], list(markets))
+        await self.exchange.market_refresh
+        self.assertEqual(['BTC/USD', 'ETH/USD'], sorted(self.exchange.markets))
+        self.assertIsNone(self.exchange.market_refresh)
+
+    async def test_failed_refresh_keeps_cached_markets(self):
+        self.exchange.market_cache.write('kraken', [KRAKEN_MARKET], {})
+        self.exchange.market_cache.ttl = -1
+        self.exchange.fetch_markets = AsyncMock(side_effect=NetworkError('down'))
+
+        await self.exchange.load_markets()
+        await asyncio.wait_for(self.exchange.market_refresh, 1)
+
+        self.assertEqual(['BTC/USD'], list(self.exchange.markets))
@@ -0,0 +1,78 @@
+import unittest
+
+from cryptoapi.base.metrics import Histogram, LatencyTracker, prometheus
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_are_contiguous(self):
+        buckets = [Histogram.bucket(v) for v in range(1 << 12)]
+
+        self.assertEqual(list(range(buckets[-1] + 1)), sorted(set(buckets)))
+        for value, bucket in enumerate(buckets):
+            self.assertLessEqual(Histogram.lower_bound(bucket), value)
+            self.assertLess(value, Histogram.lower_bound(bucket + 1))
+
+    def test_percentiles_within_bucket_width(self):
+        histogram = Histogram()
+
+        for value in range(1, 10001):
+            histogram.record(value * 1000)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(10000, snapshot['count'])
+        self.assertEqual(1000, snapshot['min'])
+        self.assertEqual(10 ** 7, snapshot['max'])
+        for p, key in [(0.5, 'p50'), (0.99, 'p99')]:
+            self.assertLessEqual(snapshot[key], p * 10 ** 7)
+            self.assertGreater(snapshot[key], p * 10 ** 7 * 0.75)
+
+    def test_empty_snapshot(self):
+        self.assertEqual({
+            'count': 0, 'mean': None, 'min': None, 'max': None,
+            'p50': None, 'p90': None, 'p99': None, 'p999': None,
+        }, Histogram().snapshot())
+
+    def test_negative_values_count_as_zero(self):
+        histogram = Histogram()
+
+        histogram.record(-5)
+
+        self.assertEqual(0, histogram.max)
+
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_snapshot_per_channel_and_stage(self):
+        tracker = LatencyTracker()
+
+        tracker.record('trades', tracker.PARSE, 100)
+        tracker.record('trades', tracker.PARSE, 300)
+        tracker.record('ticker', tracker.DECODE, 50)
+
+        snapshot = tracker.snapshot()
+        self.assertEqual({'trades', 'ticker'}, set(snapshot))
+        self.assertEqual(2, snapshot['trades']['parse']['count'])
+        self.assertEqual(200, snapshot['trades']['parse']['mean'])
+        tracker.reset()
+        self.assertEqual({}, tracker.snapshot())
+
+
+class TestPrometheus(unittest.TestCase):
+
+    def test_format(self):
+        stats = {
+            'connections': {0: {
+                'messages': 3, 'bytes': 120, 'heartbeats': 1, 'parse_errors': 0, 'unknown_responses': 0,
+                'channels': 2,
+            }},
+            'channels': {'trades': {'messages': 2, 'bytes': 100, 'parse_errors': 0, 'queue_full_waits': 4,
+                                    'checksum_errors': 0, 'sequence_gaps': 0}},
+        }
+
+        lines = prometheus('kraken', stats).splitlines()
+
+        self.assertIn('# TYPE cryptoapi_connection_messages_total counter', lines)
+        self.assertIn('cryptoapi_connection_messages_total{exchange="kraken",connection="0"} 3', lines)
+        self.assertIn('cryptoapi_channel_queue_full_waits_total{exchange="kraken",channel="trades"} 4', lines)
+        self.assertIn('cryptoapi_connection_channels{exchange="kraken",connection="0"} 2', lines)
@@ -0,0 +1,201 @@
+import unittest
+
+from cryptoapi.base.order_book import Asks, Bids, L3OrderBook, OrderBook, stack_order_books
+from test.helpers import BOOK_METADATA
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestOrderBook(unittest.TestCase):
+
+    def test_sides_are_sorted_best_first(self):
+        bids = Bids([[1, 1], [3, 1], [2, 1]])
+        asks = Asks([[3, 1], [1, 1], [2, 1]])
+
+        self.assertEqual([[3, 1], [2, 1], [1, 1]], bids)
+        self.assertEqual([[1, 1], [2, 1], [3, 1]], asks)
+
+    def test_store_inserts_replaces_and_deletes(self):
+        asks = Asks([[1, 1], [3, 1]])
+
+        asks.store([2, 1])
+        asks.store([3, 0.5])
+        asks.store([1, 0])
+
+        self.assertEqual([[2, 1], [3, 0.5]], asks)
+        self.assertEqual(0.5, asks.amount(3))
+        self.assertEqual(0, asks.amount(1))
+
+    def test_delete_unknown_level_is_ignored(self):
+        bids = Bids([[1, 1]])
+
+        bids.store([2, 0])
+
+        self.assertEqual([[1, 1]], bids)
+
+    def test_book_compares_equal_to_plain_dict(self):
+        snapshot = {
+            'bids': [[2, 1], [1, 1]],
+            'asks': [[3, 1]],
+            **BOOK_METADATA
+        }
+
+        self.assertEqual(snapshot, OrderBook(snapshot))
+
+    def test_apply_update(self):
+        order_book = OrderBook({
+            'bids': [[2, 1]],
+            'asks': [[3, 1]],
+            **BOOK_METADATA
+        })
+        update = {
+            'bids': [[2, 0], [1.5, 2]],
+            'asks': [[2.5, 1]],
+            'timestamp': 1,
+            'datetime': None,
+            'nonce': 7
+        }
+
+        order_book.apply(update)
+
+        correct_book = {
+            'bids': [[1.5, 2]],
+            'asks': [[2.5, 1], [3, 1]],
+            'timestamp': 1,
+            'datetime': None,
+            'nonce': 7
+        }
+        self.assertEqual(correct_book, order_book)
+
+    def test_bbo(self):
+        book = OrderBook({'bids': [[9, 2, 1534614248.1], [8, 1, 1534614248.1]], 'asks': [[11, 3, 1534614248.1]],
+                          **BOOK_METADATA})
+
+        self.assertEqual({
+            'bid': 9, 'bidVolume': 2, 'ask': 11, 'askVolume': 3, 'spread': 2, 'mid': 10,
+            'timestamp': None, 'datetime': None,
+        }, book.bbo())
+        self.assertIs(book.bbo(), book.bbo())
+        book.apply({'bids': [[9, 0]], 'asks': [], **BOOK_METADATA})
+        self.assertEqual((8, 1, 3, 9.5), tuple(book.bbo()[k] for k in ['bid', 'bidVolume', 'spread', 'mid']))
+
+    def test_bbo_of_empty_side(self):
+        book = OrderBook({'bids': [], 'asks': [[11, 3]], **BOOK_METADATA})
+
+        self.assertEqual((None, 11, None, None), tuple(book.bbo()[k] for k in ['bid', 'ask', 'spread', 'mid']))
+
+    def test_depth_prunes_levels_outside_the_window(self):
+        bids = Bids([[1, 1], [2, 1], [3, 1], [4, 1]], depth=2)
+        self.assertEqual([[4, 1], [3, 1]], bids)
+
+        bids.store([1, 5])  # Outside the window.
+        bids.store([3.5, 1])  # Pushes 3 out.
+        self.assertEqual([[4, 1], [3.5, 1]], bids)
+        self.assertEqual(0, bids.amount(3))
+        self.assertEqual(0, bids.amount(1))
+
+        bids.store([4, 0])
+        self.assertEqual([[3.5, 1]], bids)
+        bids.store([2, 1])
+        self.assertEqual([[3.5, 1], [2, 1]], bids)
+
+    def test_limit_caps_reads_without_pruning(self):
+        book = OrderBook({'bids': [[100, 1], [99, 1], [98, 1]], 'asks': [], **BOOK_METADATA}, limit=2)
+
+        self.assertEqual([[100, 1], [99, 1]], book.top()['bids'])
+        self.assertEqual([[100, 1]], book.top(1)['bids'])
+        book.apply({'bids': [[100, 0], [99, 0]], 'asks': [], **BOOK_METADATA})
+
+        # The exchange won't send the level at 98 again.
+        self.assertEqual([[98, 1]], book.top()['bids'])
+        self.assertEqual(98, book.bbo()['bid'])
+
+    def test_book_depth(self):
+        book = OrderBook({'bids': [[1, 1], [2, 1]], 'asks': [[3, 1], [4, 1]], **BOOK_METADATA}, depth=1)
+
+        self.assertEqual([[2, 1]], book['bids'])
+        self.assertEqual([[3, 1]], book['asks'])
+
+
+class TestL3OrderBook(unittest.TestCase):
+
+    def setUp(self):
+        self.book = L3OrderBook({
+            'bids': [[100.0, 1.0, 'a'], [100.0, 2.0, 'b'], [99.0, 1.5, 'c']],
+            'asks': [[101.0, 0.5, 'd']],
+            'nonce': 10,
+        })
+
+    def test_snapshot_aggregates_orders(self):
+        self.assertEqual([[100.0, 3.0], [99.0, 1.5]], self.book['bids'])
+        self.assertEqual([[101.0, 0.5]], self.book['asks'])
+        self.assertEqual(10, self.book['nonce'])
+
+    def test_open_match_change_done(self):
+        self.assertEqual(('asks', [101.0, 1.5]), self.book.open('e', 'asks', 101.0, 1.0))
+        self.assertEqual(('bids', [100.0, 2.5]), self.book.match('a', 0.5))
+        self.assertEqual(('bids', [100.0, 1.5]), self.book.change('b', 1.0))
+        self.assertEqual(('bids', [100.0, 0.5]), self.book.done('b'))
+        self.assertEqual(('bids', [100.0, 0.0]), self.book.match('a', 0.5))
+        # An empty level leaves the side, its order stays until it's done.
+        self.assertEqual([[99.0, 1.5]], self.book['bids'])
+        self.assertIn(100.0, self.book.levels['bids'])
+        self.assertEqual(('bids', [100.0, 0]), self.book.done('a'))
+        self.assertNotIn(100.0, self.book.levels['bids'])
+        self.assertEqual({'c', 'd', 'e'}, set(self.book.orders))
+
+    def test_unknown_orders_are_ignored(self):
+        self.assertIsNone(self.book.done('x'))
+        self.assertIsNone(self.book.match('x', 1.0))
+        self.assertIsNone(self.book.change('x', 1.0))
+
+    def test_bbo_follows_orders(self):
+        self.assertEqual(100.0, self.book.bbo()['bid'])
+        self.book.done('a')
+        self.book.done('b')
+        self.assertEqual(99.0, self.book.bbo()['bid'])
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestOrderBookNumpy(unittest.TestCase):
+
+    def setUp(self):
+        self.book = OrderBook({
+            'bids': [[9, 1, 1534614248.1], [8, 2, 1534614248.1], [7, 3, 1534614248.1]],
+            'asks': [[11, 4, 1534614248.1]],
+            **BOOK_METADATA
+        })
+
+    def test_to_numpy(self):
+        bids, asks = self.book.to_numpy()
+
+        self.assertEqual(numpy.float64, bids.dtype)
+        self.assertTrue(bids.flags['C_CONTIGUOUS'])
+        self.assertEqual([[9, 1], [8, 2], [7, 3]], bids.tolist())
+        self.assertEqual([[11, 4]], asks.tolist())
+        self.assertEqual([[9, 1], [8, 2]], self.book.to_numpy(2)[0].tolist())
+
+    def test_to_numpy_reuses_buffers(self):
+        bids, _ = self.book.to_numpy()
+        self.assertIs(bids, self.book.to_numpy()[0])
+
+        self.book.apply({'bids': [[8, 0], [10, 5]], 'asks': [], **BOOK_METADATA})
+        updated, _ = self.book.to_numpy()
+
+        self.assertEqual([[10, 5], [9, 1], [7, 3]], updated.tolist())
+        self.assertIs(bids.base, updated.base)
+
+    def test_stack_order_books(self):
+        other = {'bids': [[5, 1]], 'asks': [[6, 1], [7, 2]], **BOOK_METADATA}
+
+        stacked = stack_order_books([self.book, None, other], 2)
+
+        self.assertEqual((3, 2, 2, 2), stacked.shape)
+        self.assertEqual([[9, 1], [8, 2]], stacked[0, 0].tolist())
+        self.assertEqual([[6, 1], [7, 2]], stacked[2, 1].tolist())
+        self.assertTrue(numpy.isnan(stacked[1]).all())
+        self.assertTrue(numpy.isnan(stacked[0, 1, 1]).all())
+        self.assertIs(stacked, stack_order_books([self.book, None, other], 2, out=stacked))
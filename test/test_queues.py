@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from cryptoapi.base.queues import ResultQueue
+
+
+class TestResultQueue(unittest.IsolatedAsyncioTestCase):
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            ResultQueue(policy='unknown')
+
+    async def test_drop_oldest(self):
+        queue = ResultQueue(maxsize=2, policy=ResultQueue.DROP_OLDEST)
+
+        for item in range(3):
+            await queue.put(item)
+
+        self.assertEqual(1, queue.get_nowait())
+        self.assertEqual(2, queue.get_nowait())
+        self.assertEqual(1, queue.dropped)
+
+    async def test_drop_newest(self):
+        queue = ResultQueue(maxsize=2, policy=ResultQueue.DROP_NEWEST)
+
+        for item in range(3):
+            await queue.put(item)
+
+        self.assertEqual(0, queue.get_nowait())
+        self.assertEqual(1, queue.get_nowait())
+        self.assertEqual(1, queue.dropped)
+
+    async def test_conflate_keeps_latest_per_key(self):
+        queue = ResultQueue(maxsize=2, policy=ResultQueue.CONFLATE)
+
+        await queue.put('a0', 'a')
+        await queue.put('b0', 'b')
+        await queue.put('a1', 'a')
+
+        self.assertEqual(2, queue.qsize())
+        self.assertEqual('a1', queue.get_nowait())
+        self.assertEqual('b0', queue.get_nowait())
+
+    async def test_conflate_full_drops_oldest_key(self):
+        queue = ResultQueue(maxsize=1, policy=ResultQueue.CONFLATE)
+
+        await queue.put('a0', 'a')
+        await queue.put('b0', 'b')
+
+        self.assertEqual('b0', queue.get_nowait())
+        self.assertTrue(queue.empty())
+
+    async def test_join_returns_after_drops(self):
+        for policy in [ResultQueue.DROP_OLDEST, ResultQueue.DROP_NEWEST, ResultQueue.CONFLATE]:
+            with self.subTest(policy=policy):
+                queue = ResultQueue(maxsize=1, policy=policy)
+                for key in ['a', 'a', 'b']:
+                    await queue.put(key, key)
+
+                queue.get_nowait()
+                queue.task_done()
+
+                await asyncio.wait_for(queue.join(), 1)
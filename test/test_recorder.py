@@ -0,0 +1,41 @@
+import glob
+import os
+import tempfile
+import unittest
+
+from cryptoapi.base.recorder import Recorder, read_frames
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_read_frames(self):
+        recorder = Recorder(self.path, 'kraken')
+
+        recorder.write(0, '{"event":"heartbeat"}')
+        recorder.write(1, b'[1,"hb"]')
+        recorder.close()
+
+        records = list(read_frames(self.path))
+        self.assertEqual(['{"event":"heartbeat"}', '[1,"hb"]'], [r['f'] for r in records])
+        self.assertEqual([0, 1], [r['c'] for r in records])
+        self.assertEqual({'kraken'}, {r['e'] for r in records})
+        self.assertLessEqual(records[0]['t'], records[1]['t'])
+
+    def test_rotate_segments(self):
+        recorder = Recorder(self.path, 'bitfinex', segment_size=1)
+
+        for i in range(3):
+            recorder.write(0, f'[{i},"hb"]')
+        recorder.close()
+
+        segments = sorted(glob.glob(os.path.join(self.path, '*.jsonl.gz')))
+        self.assertEqual(3, len(segments))
+        self.assertEqual(['[1,"hb"]'], [r['f'] for r in read_frames(segments[1])])
+        self.assertEqual(3, len(list(read_frames(self.path))))
@@ -0,0 +1,134 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from cryptoapi.bitvavo import Bitvavo
+from cryptoapi.kraken import Kraken
+from cryptoapi.base.recorder import Recorder
+from cryptoapi.base.replay import Replayer
+from test.helpers import BOOK_METADATA, TEST_MARKET, WebsocketMock
+
+
+MARKET = {**TEST_MARKET, 'info': {'wsname': 'XBT/USD'}}
+SUBSCRIBED = {
+    "channelID": 1,
+    "channelName": "book-10",
+    "event": "subscriptionStatus",
+    "pair": "XBT/USD",
+    "status": "subscribed",
+    "subscription": {"name": "book", "depth": 10}
+}
+SNAPSHOT = [1, {"as": [["5541.30000", "2.50000000", "1534614248.123678"]],
+                "bs": [["5541.20000", "1.50000000", "1534614248.765567"]]}, "book-10", "XBT/USD"]
+UPDATE = [1, {"b": [["5541.20000", "0.00000000", "1534614335.345903"]]}, "book-10", "XBT/USD"]
+
+
+def kraken():
+    exchange = Kraken()
+    exchange.markets = {MARKET['symbol']: MARKET}
+    exchange.markets_by_id = {'XBT/USD': MARKET}
+    exchange.result = None
+    return exchange
+
+
+class TestReplayer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def record(self, frames):
+        exchange = kraken()
+        exchange.recorder = Recorder(self.path, exchange.id)
+        websocket = WebsocketMock([json.dumps(f) for f in frames] + [None])
+        exchange.connections[websocket] = []
+        exchange.connection_ids[websocket] = 0
+        await exchange.consumer(websocket)
+        await exchange.close()
+        return exchange
+
+    async def test_replay_rebuilds_order_book(self):
+        recorded = await self.record([SUBSCRIBED, SNAPSHOT, UPDATE])
+        exchange = kraken()
+
+        replayer = Replayer(exchange, self.path)
+        self.assertEqual(3, await replayer.run())
+
+        symbol = MARKET['symbol']
+        self.assertEqual(recorded.order_book[symbol]['asks'], exchange.order_book[symbol]['asks'])
+        self.assertEqual([], exchange.order_book[symbol]['bids'])
+        self.assertEqual([], replayer.sockets[0].sent)
+
+    async def test_replay_until(self):
+        await self.record([SUBSCRIBED, SNAPSHOT, UPDATE])
+        update_time = max(json.loads(line)['t'] for line in self.lines())
+        exchange = kraken()
+
+        await Replayer(exchange, self.path).run(until=update_time - 1)
+
+        self.assertEqual([[5541.2, 1.5, 1534614248.765567]], exchange.order_book[MARKET['symbol']]['bids'])
+
+    async def test_replay_recorded_snapshot(self):
+        recorder = Recorder(self.path, 'kraken')
+        recorder.write(0, {'bids': [[5541.2, 1.5]], 'asks': [], **BOOK_METADATA}, MARKET['symbol'])
+        recorder.close()
+        exchange = kraken()
+
+        replayer = Replayer(exchange, self.path)
+        self.assertEqual(0, await replayer.run())
+
+        self.assertEqual(1, replayer.snapshots)
+        self.assertEqual([[5541.2, 1.5]], exchange.order_book[MARKET['symbol']]['bids'])
+
+    async def test_replay_buffers_bitvavo_deltas_until_the_snapshot(self):
+        id = TEST_MARKET['id']
+        symbol = TEST_MARKET['symbol']
+
+        def delta(nonce, price):
+            return json.dumps({'event': 'book', 'market': id, 'nonce': nonce, 'bids': [[price, '1']], 'asks': []})
+
+        recorder = Recorder(self.path, 'bitvavo')
+        recorder.write(0, json.dumps({'event': 'subscribed', 'subscriptions': {'book': [id]}}))
+        # Received while the snapshot was fetched.
+        recorder.write(0, delta(11, '2'))
+        recorder.write(0, delta(9, '9'))
+        recorder.write(0, {'bids': [[1.0, 1.0]], 'asks': [], **BOOK_METADATA, 'nonce': 10}, symbol)
+        recorder.write(0, delta(12, '3'))
+        recorder.close()
+        exchange = Bitvavo()
+        exchange.markets = {symbol: TEST_MARKET}
+        exchange.markets_by_id = {id: TEST_MARKET}
+        exchange.result = None
+
+        await Replayer(exchange, self.path).run()
+        await exchange.close()
+
+        self.assertEqual([[3.0, 1.0], [2.0, 1.0], [1.0, 1.0]], exchange.order_book[symbol]['bids'])
+        self.assertEqual(12, exchange.order_book[symbol]['nonce'])
+        self.assertEqual({}, exchange.book_buffers)
+
+    async def test_replay_paced(self):
+        heartbeat = '{"event":"heartbeat"}'
+        with gzip.open(os.path.join(self.path, 'kraken-0-000000.jsonl.gz'), 'wb') as file:
+            for t in [0, 50 * 10 ** 6]:
+                file.write(json.dumps({'t': t, 'c': 0, 'e': 'kraken', 'f': heartbeat}).encode() + b'\n')
+        exchange = kraken()
+
+        start = time.monotonic()
+        await Replayer(exchange, self.path, speed=1).run()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+        start = time.monotonic()
+        await Replayer(exchange, self.path, speed=10).run()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def lines(self):
+        for name in os.listdir(self.path):
+            with gzip.open(os.path.join(self.path, name), 'rb') as file:
+                yield from file
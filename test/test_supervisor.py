@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+
+from cryptoapi.base.supervisor import Supervisor
+
+
+class TestSupervisor(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.supervisor = Supervisor()
+
+    async def test_wait_for_all_tasks(self):
+        results = []
+
+        async def work(i):
+            await asyncio.sleep(0)
+            results.append(i)
+
+        for i in range(3):
+            self.supervisor.spawn(work(i))
+        await self.supervisor.wait()
+
+        self.assertEqual([0, 1, 2], sorted(results))
+        self.assertEqual(set(), self.supervisor.tasks)
+
+    async def test_failure_cancels_siblings(self):
+        async def fail():
+            raise ValueError
+
+        sibling = self.supervisor.spawn(asyncio.sleep(60))
+        self.supervisor.spawn(fail())
+
+        with self.assertRaises(ValueError):
+            await self.supervisor.wait()
+        self.assertTrue(sibling.cancelled())
+
+    async def test_cancel(self):
+        task = self.supervisor.spawn(asyncio.sleep(60))
+
+        await self.supervisor.cancel()
+
+        self.assertTrue(task.cancelled())
@@ -0,0 +1,118 @@
+import functools
+import unittest
+
+from benchmarks import frames
+from benchmarks.mock_server import MockServer
+from ccxt.base.errors import BadSymbol
+from cryptoapi.base.order_book import OrderBook
+from cryptoapi.base.workers import SharedBooks
+from cryptoapi.base.workers import WorkerPool
+from cryptoapi.bitfinex import Bitfinex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def mock_bitfinex(url, name, config):
+    # Workers' factory: a Bitfinex instance talking to the mock server.
+    exchange = Bitfinex(config)
+    frames.load_market(exchange, 'bitfinex')
+    exchange.ws_endpoint['public'] = url
+    return exchange
+
+
+class TestSharedBooks(unittest.TestCase):
+
+    def setUp(self):
+        self.books = SharedBooks(['BTC/USD', 'ETH/USD'], depth=2)
+        # The worker's view of the same memory.
+        self.writer = SharedBooks(['BTC/USD', 'ETH/USD'], depth=2, name=self.books.name)
+        self.order_book = OrderBook({
+            'bids': [[9, 1], [8, 2], [7, 3]], 'asks': [[11, 4]], 'timestamp': 1534614248123, 'nonce': 5,
+        })
+
+    def tearDown(self):
+        self.writer.close()
+        self.books.close()
+        self.books.unlink()
+
+    def test_write_and_read(self):
+        self.assertIsNone(self.books.read('BTC/USD'))
+
+        self.writer.write('BTC/USD', self.order_book)
+
+        self.assertEqual({
+            'bids': [[9, 1], [8, 2]], 'asks': [[11, 4]], 'timestamp': 1534614248123, 'nonce': 5,
+        }, self.books.read('BTC/USD'))
+        self.assertEqual(2, self.books.version('BTC/USD'))
+        self.assertIsNone(self.books.read('ETH/USD'))
+
+        self.order_book.apply({'bids': [[9, 0]], 'asks': [], 'timestamp': None, 'datetime': None, 'nonce': None})
+        self.writer.write('BTC/USD', self.order_book)
+
+        self.assertEqual({
+            'bids': [[8, 2], [7, 3]], 'asks': [[11, 4]], 'timestamp': None, 'nonce': None,
+        }, self.books.read('BTC/USD'))
+        self.assertEqual(4, self.books.version('BTC/USD'))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_to_numpy(self):
+        self.writer.write('ETH/USD', self.order_book)
+
+        bids, asks = self.books.to_numpy('ETH/USD')
+
+        self.assertEqual([[9, 1], [8, 2]], bids.tolist())
+        self.assertEqual([[11, 4]], asks.tolist())
+        # Views of the shared memory.
+        self.writer.write('ETH/USD', OrderBook({'bids': [[10, 1], [9, 1]], 'asks': [[11, 4]]}))
+        self.assertEqual([[10, 1], [9, 1]], bids.tolist())
+        del bids, asks
+
+
+class TestWorkerPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_books_in_shared_memory_and_trades_over_the_pipe(self):
+        spec = [
+            {'exchange': 'bitfinex', 'channel': 'order_book', 'symbols': ['BTC/USD']},
+            {'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['BTC/USD']},
+        ]
+        async with MockServer('bitfinex', count=200) as server:
+            factory = functools.partial(mock_bitfinex, server.url)
+            async with WorkerPool(spec, {'bitfinex': {'reconnect': False}}, factory=factory) as pool:
+                results = [result async for result in pool]
+                book = pool.book('bitfinex', 'BTC/USD')
+
+        self.assertTrue(results)
+        self.assertEqual({('bitfinex', 'trades', 'BTC/USD')}, {tuple(r[:3]) for r in results})
+        self.assertEqual(25, len(book['bids']))
+        self.assertEqual(sorted(book['bids'], reverse=True), book['bids'])
+        self.assertEqual(sorted(book['asks']), book['asks'])
+        self.assertEqual([], pool.workers)
+
+    def test_shards(self):
+        spec = [
+            {'exchange': 'bitfinex', 'channel': 'order_book', 'symbols': ['BTC/USD', 'ETH/USD', 'XRP/USD']},
+            {'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['BTC/USD']},
+            {'exchange': 'kraken', 'channel': 'trades', 'symbols': ['BTC/USD']},
+        ]
+
+        shards = WorkerPool(spec, shard_size=2).shards()
+
+        self.assertEqual([
+            ('bitfinex', [
+                {'exchange': 'bitfinex', 'channel': 'order_book', 'symbols': ['BTC/USD', 'ETH/USD']},
+                {'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['BTC/USD']},
+            ]),
+            ('bitfinex', [{'exchange': 'bitfinex', 'channel': 'order_book', 'symbols': ['XRP/USD']}]),
+            ('kraken', [{'exchange': 'kraken', 'channel': 'trades', 'symbols': ['BTC/USD']}]),
+        ], shards)
+
+    async def test_worker_error(self):
+        spec = [{'exchange': 'bitfinex', 'channel': 'trades', 'symbols': ['ETH/USD']}]
+        factory = functools.partial(mock_bitfinex, 'ws://127.0.0.1:1')
+
+        async with WorkerPool(spec, factory=factory) as pool:
+            with self.assertRaises(BadSymbol):
+                await pool.get()